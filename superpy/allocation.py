@@ -0,0 +1,132 @@
+"""
+First-expired-first-out (FEFO) lot allocation.
+
+Every product has a heap of its lots ordered by (expire_date, lot_id).
+A sale takes units from the lot that expires first, then the next one,
+so a sale that spans several lots is split over them. Taking a lot off
+the heap is O(log lots), so a sale never has to look at the whole inventory.
+
+Lots whose expire_date lies before the sale date are parked on a second
+heap per product. They come back when a sale is dated earlier than their
+expire_date (the application date can be reset to an earlier day).
+"""
+# ---------------All the IMPORTS:---------------#
+import heapq
+# -----------------------------------------------#
+
+
+class LotAllocator:
+    def __init__(self):
+        self.lots = {}            # lot_id -> lot dict (buy_amount is what is left)
+        self.queues = {}          # buy_name -> heap of (expire_date, lot_id), not expired
+        self.parked = {}          # buy_name -> heap of (-expire_date ordinal, expire_date, lot_id), expired
+        self.available = {}       # buy_name -> units left in the lots of 'queues'
+        self.expired = {}         # buy_name -> units left in the lots of 'parked'
+        self.parked_ids = set()   # lot_ids currently on a 'parked' heap
+
+    # ---------------------------------------------------------------------#
+    def add_lot(self, lot):
+        """
+        Add a lot (dict with buy_id, buy_date, buy_name, buy_amount, buy_price, expire_date).
+        expire_date must be an ISO 'year-month-day' string so it sorts by date.
+        """
+        name = lot['buy_name']
+        self.lots[lot['buy_id']] = lot
+        heapq.heappush(self.queues.setdefault(name, []), (lot['expire_date'], lot['buy_id']))
+        self.available[name] = self.available.get(name, 0) + lot['buy_amount']
+
+    # ---------------------------------------------------------------------#
+    def _move_to_date(self, name, sell_date):
+        """
+        Make the queue of 'name' hold exactly the lots that are not expired on 'sell_date'.
+        """
+        queue = self.queues.setdefault(name, [])
+        parked = self.parked.setdefault(name, [])
+        self.available.setdefault(name, 0)
+        self.expired.setdefault(name, 0)
+
+        # drop sold-out lots and park expired ones
+        while queue:
+            expire_date, lot_id = queue[0]
+            amount = self.lots[lot_id]['buy_amount']
+            if amount > 0 and expire_date >= sell_date:
+                break
+            heapq.heappop(queue)
+            if amount > 0:
+                heapq.heappush(parked, (_descending(expire_date), expire_date, lot_id))
+                self.parked_ids.add(lot_id)
+                self.available[name] -= amount
+                self.expired[name] += amount
+
+        # bring back parked lots that are not expired on this (earlier) date
+        while parked and parked[0][1] >= sell_date:
+            _, expire_date, lot_id = heapq.heappop(parked)
+            self.parked_ids.discard(lot_id)
+            amount = self.lots[lot_id]['buy_amount']
+            if amount > 0:
+                heapq.heappush(queue, (expire_date, lot_id))
+                self.available[name] += amount
+                self.expired[name] -= amount
+
+    # ---------------------------------------------------------------------#
+    def stock(self, name, sell_date):
+        """
+        Return (units not expired, units expired) of a product on 'sell_date'.
+        """
+        self._move_to_date(name, str(sell_date))
+        return self.available[name], self.expired[name]
+
+    # ---------------------------------------------------------------------#
+    def allocate(self, name, amount, sell_date, partial=False):
+        """
+        Take 'amount' units of a product from its non-expired lots, first expiring lot first.
+
+        Args:
+            name (str): Product name.
+            amount (int): Units to sell.
+            sell_date (date or str): Day of the sale.
+            partial (bool): Allocate what is there when there is not enough stock
+                            (used when replaying old sales that have no lot).
+
+        Returns:
+            list: (lot_id, units, expire_date) for every lot units were taken from,
+                  or None when there is not enough stock.
+        """
+        sell_date = str(sell_date)
+        self._move_to_date(name, sell_date)
+        if amount > self.available[name] and not partial:
+            return None
+
+        queue = self.queues[name]
+        allocations = []
+        while amount > 0 and queue:
+            lot_id = queue[0][1]
+            lot = self.lots[lot_id]
+            taken = min(amount, lot['buy_amount'])
+            lot['buy_amount'] -= taken
+            self.available[name] -= taken
+            amount -= taken
+            if taken:
+                allocations.append((lot_id, taken, lot['expire_date']))
+            if lot['buy_amount'] == 0:
+                heapq.heappop(queue)
+        return allocations
+
+    # ---------------------------------------------------------------------#
+    def consume(self, lot_id, units):
+        """
+        Take units from a known lot (a sale that was already allocated).
+        Sold-out lots are removed from their heap the next time the product is touched.
+        """
+        lot = self.lots[lot_id]
+        lot['buy_amount'] -= units
+        if lot_id in self.parked_ids:
+            self.expired[lot['buy_name']] -= units
+        else:
+            self.available[lot['buy_name']] -= units
+
+# ---------------------------------------------------------------------#
+def _descending(expire_date):
+    """Sort key that puts the latest expire_date on top of a min-heap."""
+    year, month, day = (int(part) for part in expire_date.split('-'))
+    return -(year * 10000 + month * 100 + day)
@@ -0,0 +1,164 @@
+"""
+Bulk import of buy and sell transactions.
+
+A batch is a CSV or NDJSON file (or stdin) with one transaction per line.
+All lines are validated column-wise, the good ones are applied in order and
+recorded in the storage in one go, and the rejected ones are written to a
+reject file together with the reason. A bad line never aborts the run.
+"""
+# ---------------All the IMPORTS:---------------#
+import os
+import sys
+import profiling
+# pandas is imported inside the functions that need it, so commands that do not use it start faster
+# -----------------------------------------------#
+
+BUY_BATCH_COLUMNS = ['buy_name', 'buy_amount', 'buy_price', 'expire_date']
+SELL_BATCH_COLUMNS = ['buy_name', 'sell_amount', 'sell_price']
+
+# ---------------------------------------------------------------------#
+def read_transactions(source, columns, file_format=None):
+    """
+    Read a batch of transactions.
+
+    Args:
+        source (str): Path of the file, or '-' to read from stdin.
+        columns (list): Columns every transaction needs.
+        file_format (str): 'csv' or 'ndjson'. Guessed from the file extension when not given.
+
+    Returns:
+        DataFrame: The transactions, all columns as read (no type conversion yet).
+    """
+    import pandas as pd
+    if file_format is None:
+        extension = os.path.splitext(source)[1].lower()
+        file_format = 'ndjson' if extension in ('.ndjson', '.jsonl', '.json') else 'csv'
+
+    stream = sys.stdin if source == '-' else source
+    if file_format == 'ndjson':
+        transactions = pd.read_json(stream, lines=True, dtype=False)
+    else:
+        # no value is read as missing ('None', 'NA' or 'nan' can be product names), an empty field stays ''
+        transactions = pd.read_csv(stream, dtype=str, skipinitialspace=True, keep_default_na=False, na_filter=False)
+
+    missing_columns = [col for col in columns if col not in transactions.columns]
+    if missing_columns:
+        raise ValueError(f"The batch is missing these columns: {missing_columns}")
+    return transactions[columns].reset_index(drop=True)
+
+# ---------------------------------------------------------------------#
+def write_rejects(rejects, rejects_file):
+    """
+    Write the rejected transactions (with a 'reject_reason' column) to 'rejects_file'.
+    """
+    if rejects.empty:
+        return
+    rejects.to_csv(rejects_file, index=False)
+    print(f"{len(rejects)} rejected line(s) written to: {rejects_file}")
+
+# ---------------------------------------------------------------------#
+def _set_reason(reasons, mask, reason):
+    """Give the rows in 'mask' that have no reason yet the reject reason 'reason'."""
+    reasons[mask & reasons.isna()] = reason
+
+# ---------------------------------------------------------------------#
+def buy_batch(storage_backend, source, current_date, file_format=None, rejects_file=None):
+    """
+    Buy every product of a batch.
+
+    A line is rejected when the name is empty, the amount is not a whole number above 0,
+    the price is not a number, or the expire date is invalid or already passed
+    (the same check as validate_expire_date_before_buying).
+
+    Returns:
+        tuple: (number of lines bought, number of lines rejected)
+    """
+    import pandas as pd
+    transactions = read_transactions(source, BUY_BATCH_COLUMNS, file_format)
+
+    names = transactions['buy_name'].astype(str).str.strip()
+    amounts = pd.to_numeric(transactions['buy_amount'], errors='coerce')
+    prices = pd.to_numeric(transactions['buy_price'], errors='coerce')
+    expire_dates = pd.to_datetime(transactions['expire_date'], errors='coerce', format='mixed')
+
+    reasons = pd.Series(pd.NA, index=transactions.index, dtype=object)
+    _set_reason(reasons, transactions['buy_name'].isna() | (names == ''), 'missing product name')
+    _set_reason(reasons, amounts.isna() | (amounts <= 0) | (amounts % 1 != 0), 'invalid amount')
+    _set_reason(reasons, prices.isna() | (prices < 0), 'invalid price')
+    _set_reason(reasons, expire_dates.isna(), 'invalid expire date')
+    _set_reason(reasons, expire_dates < pd.to_datetime(current_date), 'already expired')
+
+    accepted = reasons.isna()
+    bought = transactions[accepted]
+    if not bought.empty:
+        storage_backend.record_buys(current_date, [
+            (name, int(amount), float(price), str(expire_date.date()))
+            for name, amount, price, expire_date in zip(
+                names[accepted], amounts[accepted], prices[accepted], expire_dates[accepted])])
+
+    rejects = transactions[~accepted].assign(reject_reason=reasons[~accepted])
+    write_rejects(rejects, rejects_file or os.path.join(storage_backend.config.outputs_dir, 'rejected_buys.csv'))
+    return len(bought), len(rejects)
+
+# ---------------------------------------------------------------------#
+def sell_batch(storage_backend, source, current_date, file_format=None, rejects_file=None):
+    """
+    Sell every line of a batch, in order, first expired first out.
+
+    A line is rejected when the name is empty, the amount is not a whole number above 0,
+    the price is not a number, or there is not enough non-expired stock left
+    for it after the lines before it (the same check as sell_action).
+
+    Returns:
+        tuple: (number of lines sold, number of lines rejected)
+    """
+    import pandas as pd
+    transactions = read_transactions(source, SELL_BATCH_COLUMNS, file_format)
+
+    names = transactions['buy_name'].astype(str).str.strip()
+    amounts = pd.to_numeric(transactions['sell_amount'], errors='coerce')
+    prices = pd.to_numeric(transactions['sell_price'], errors='coerce')
+
+    reasons = pd.Series(pd.NA, index=transactions.index, dtype=object)
+    _set_reason(reasons, transactions['buy_name'].isna() | (names == ''), 'missing product name')
+    _set_reason(reasons, amounts.isna() | (amounts <= 0) | (amounts % 1 != 0), 'invalid amount')
+    _set_reason(reasons, prices.isna() | (prices < 0), 'invalid price')
+
+    # the stock is checked and taken in one transaction, so other tills cannot sell the same units
+    with storage_backend.transaction():
+        # only the products in the catalog can have lots, the others are out of stock
+        catalog = storage_backend.load_catalog()
+        products = [name for name in names[reasons.isna()].unique() if catalog.product_id(name) is not None]
+        with profiling.stage('lot_load') as current:
+            allocator = storage_backend.load_allocator(products)
+            current.rows = len(allocator.lots)
+
+        # products without any non-expired stock are rejected all at once
+        stock = {name: allocator.stock(name, current_date) for name in products}
+        units_not_expired = names.map({name: units[0] for name, units in stock.items()}).fillna(0)
+        units_in_stock = names.map({name: sum(units) for name, units in stock.items()}).fillna(0)
+        _set_reason(reasons, units_in_stock <= 0, 'out of stock')
+        _set_reason(reasons, units_not_expired <= 0, 'expired')
+
+        # the rest is allocated in order, so every line sees the stock the lines before it left
+        sales = []
+        try:
+            with profiling.stage('allocation') as current:
+                for index in reasons.index[reasons.isna()]:
+                    allocations = allocator.allocate(names[index], int(amounts[index]), current_date)
+                    if allocations is None:
+                        reasons[index] = 'not enough quantity left'
+                    else:
+                        sales.append((names[index], float(prices[index]), allocations))
+                current.rows = len(sales)
+
+            if sales:
+                storage_backend.record_sales(current_date, sales)
+        except BaseException:
+            # the lots in memory already lost the units of sales that were not recorded
+            storage_backend.drop_allocator()
+            raise
+
+    rejects = transactions[reasons.notna()].assign(reject_reason=reasons[reasons.notna()])
+    write_rejects(rejects, rejects_file or os.path.join(storage_backend.config.outputs_dir, 'rejected_sells.csv'))
+    return len(sales), len(rejects)
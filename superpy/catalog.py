@@ -0,0 +1,111 @@
+"""
+Product catalog.
+
+Every product gets a small integer id the first time the store sees it.
+Names are normalized first (the spaces around them are dropped, like the
+old sell check did), so ' Tomato 500g' and 'Tomato 500g' are one product.
+The CSV storage keeps the catalog in 'outputs/products.csv' (product_id,
+name) and only ever appends to it; the SQLite storage keeps it in its
+'products' table.
+
+A command resolves a product name once, with one dict lookup in the
+catalog, and the tables keep the id next to the name, so filtering and
+joining on a product compares integers.
+"""
+# ---------------All the IMPORTS:---------------#
+import csv
+import io
+import os
+import locking
+# -----------------------------------------------#
+
+CATALOG_COLUMNS = ['product_id', 'name']
+
+# catalog file -> (catalog, bytes of the file that are in it); the file is only appended to,
+# so a process that keeps running (see 'super.py serve') only reads the new products
+_loaded = {}
+
+# ---------------------------------------------------------------------#
+def normalize_name(name):
+    """Return the name a product is known by in the catalog."""
+    return str(name).strip()
+
+
+class ProductCatalog:
+    def __init__(self):
+        self.ids = {}       # normalized name -> product_id
+        self.names = {}     # product_id -> name
+        self.last_id = 0
+
+    # ---------------------------------------------------------------------#
+    def add(self, product_id, name):
+        self.ids[name] = product_id
+        self.names[product_id] = name
+        self.last_id = max(self.last_id, product_id)
+
+    # ---------------------------------------------------------------------#
+    def product_id(self, name):
+        """Return the id of product 'name' (None for a product the store never had)."""
+        return self.ids.get(normalize_name(name))
+
+    # ---------------------------------------------------------------------#
+    def new_names(self, names):
+        """Return the normalized names in 'names' that are not in the catalog yet, once each and in order."""
+        return list(dict.fromkeys(name for name in map(normalize_name, names) if name and name not in self.ids))
+
+    # ---------------------------------------------------------------------#
+    def id_column(self, names):
+        """Return the product ids of a Series of names (every distinct name is looked up once)."""
+        ids = {name: self.product_id(name) for name in names.unique()}
+        return names.map(ids).astype('Int64')
+
+# ---------------------------------------------------------------------#
+def load_catalog(config):
+    """
+    Return the catalog in 'products.csv' (an empty one when there is no file yet).
+    Only complete lines are read, so a product that is being added is left out.
+    """
+    path = os.path.abspath(config.products_file)
+    catalog, size = _loaded.get(path, (None, 0))
+    file_size = os.path.getsize(path) if os.path.exists(path) else 0
+    if catalog is None or file_size < size:
+        # the first time, or the file was created again
+        catalog, size = ProductCatalog(), 0
+    if file_size > size:
+        with open(path, 'rb') as f:
+            f.seek(size)
+            data = f.read()
+        data = data[:data.rfind(b'\n') + 1]
+        lines = data.decode('utf-8').splitlines()
+        if size == 0:
+            lines = lines[1:]    # header
+        for product_id, name in csv.reader(lines):
+            catalog.add(int(product_id), name)
+        size += len(data)
+    _loaded[path] = (catalog, size)
+    return catalog
+
+# ---------------------------------------------------------------------#
+def add_products(config, names):
+    """
+    Give the products in 'names' that are not in the catalog yet the next ids,
+    and append them to 'products.csv'.
+
+    Returns:
+        ProductCatalog: The catalog with the new products.
+    """
+    if not load_catalog(config).new_names(names):
+        return load_catalog(config)
+    with locking.store_lock(config):
+        # another process may have added some of them in the meantime
+        catalog = load_catalog(config)
+        new_names = catalog.new_names(names)
+        lines = io.StringIO()
+        writer = csv.writer(lines)
+        if not os.path.exists(config.products_file):
+            writer.writerow(CATALOG_COLUMNS)
+        writer.writerows(enumerate(new_names, start=catalog.last_id + 1))
+        os.makedirs(config.outputs_dir, exist_ok=True)
+        with open(config.products_file, 'a', newline='') as f:
+            f.write(lines.getvalue())
+    return load_catalog(config)
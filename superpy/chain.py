@@ -0,0 +1,130 @@
+"""
+Chain-wide reports over several stores.
+
+Every store has its own outputs folder (the outputs_dir of its SuperConfig),
+with a journal (the CSV storage) or a SQLite database; every store is read
+with the backend of the files in it, so the chain can mix both.
+The management report of every store is read up to date with its
+transactions (in memory, nothing is written into the store folders) and
+reduced to partial totals per product in a pool of worker processes, one
+store per task; the partials are then merged into the totals of the chain
+and the totals of every store.
+
+Per product and store the partial totals are: units bought, units sold,
+revenue, the cost of the goods sold, expired units and what they cost (like
+the profit report). Adding them up over the stores gives the chain totals.
+"""
+# ---------------All the IMPORTS:---------------#
+import os
+from concurrent.futures import ProcessPoolExecutor
+from config import SuperConfig
+# pandas is imported inside the functions that need it, so commands that do not use it start faster
+# -----------------------------------------------#
+
+PARTIAL_COLUMNS = ['buy_amount', 'sell_amount', 'revenue', 'cost_of_goods', 'expired_amount', 'expired_costs']
+
+# ---------------------------------------------------------------------#
+def find_stores(root):
+    """
+    Return the store folders in 'root': every sub folder with a journal or a SQLite database
+    (directly in it, or in its 'outputs' folder), sorted by name.
+    """
+    stores = []
+    for name in sorted(os.listdir(root)):
+        for folder in (os.path.join(root, name), os.path.join(root, name, 'outputs')):
+            if any(os.path.exists(os.path.join(folder, store_file)) for store_file in ('journal.csv', 'superpy.db')):
+                stores.append(folder)
+                break
+    return stores
+
+# ---------------------------------------------------------------------#
+def store_name(store_dir):
+    """The name of a store: its folder, or the folder around it when that is called 'outputs'."""
+    store_dir = os.path.abspath(store_dir)
+    if os.path.basename(store_dir) == 'outputs':
+        store_dir = os.path.dirname(store_dir)
+    return os.path.basename(store_dir)
+
+# ---------------------------------------------------------------------#
+def store_backend(config):
+    """
+    The storage backend of a store, from the files in it: 'sqlite' for a database, 'csv' for a journal.
+    A store with both (a CSV store that was copied to SQLite, see storage.migrate_csv_to_sqlite)
+    uses the configured backend (SUPERPY_STORAGE).
+    """
+    has_journal, has_database = os.path.exists(config.journal_file), os.path.exists(config.database_file)
+    if has_journal == has_database:
+        return config.storage
+    return 'sqlite' if has_database else 'csv'
+
+# ---------------------------------------------------------------------#
+def store_partials(store_dir):
+    """
+    Read the management report of one store, up to date with its transactions, and reduce it to the
+    partial totals per product. Nothing is written to the store. Runs in a worker process.
+
+    Returns:
+        DataFrame: One line per product with 'store', 'product' and PARTIAL_COLUMNS.
+    """
+    import report_model
+    import storage
+    config = SuperConfig(outputs_dir=store_dir, time_file=os.path.join(os.path.dirname(os.path.abspath(store_dir)), 'time.txt'))
+    config.storage = store_backend(config)
+    report = report_model.build_model(storage.get_storage(config).read_management_report())
+    partials = report.groupby('buy_name_buy', sort=True).agg(
+        buy_amount=('buy_amount_buy', 'sum'),
+        sell_amount=('sell_amount', 'sum'),
+        revenue=('revenue', 'sum'),
+        cost_of_goods=('cost_of_goods', 'sum'),
+        expired_amount=('expired_amount', 'sum'),
+        expired_costs=('expired_costs', 'sum'),
+    )
+    partials = partials.rename_axis('product').reset_index()
+    partials.insert(0, 'store', store_name(store_dir))
+    return partials[['store', 'product'] + PARTIAL_COLUMNS]
+
+# ---------------------------------------------------------------------#
+def _with_profit(totals):
+    totals['profit'] = totals['revenue'] - totals['cost_of_goods'] - totals['expired_costs']
+    return totals
+
+# ---------------------------------------------------------------------#
+def chain_report(store_dirs, jobs=None):
+    """
+    Compute the partial totals of every store in a pool of 'jobs' processes and merge them.
+
+    Args:
+        store_dirs (list): The outputs folders of the stores.
+        jobs (int): Number of worker processes (default: one per CPU, 1 runs in this process).
+
+    Returns:
+        tuple: (totals per product of the chain, totals per store, the partials per store and product,
+                dict store folder -> error for the stores that failed)
+    """
+    import pandas as pd
+    jobs = jobs or os.cpu_count() or 1
+    partials, errors = [], {}
+    # a missing folder is an error, not a new empty store
+    for store_dir in store_dirs:
+        if not os.path.isdir(store_dir):
+            errors[store_dir] = FileNotFoundError(f"No such folder: '{store_dir}'")
+    store_dirs = [store_dir for store_dir in store_dirs if store_dir not in errors]
+    if jobs == 1 or len(store_dirs) <= 1:
+        for store_dir in store_dirs:
+            try:
+                partials.append(store_partials(store_dir))
+            except Exception as e:
+                errors[store_dir] = e
+    else:
+        with ProcessPoolExecutor(max_workers=min(jobs, len(store_dirs))) as pool:
+            futures = {store_dir: pool.submit(store_partials, store_dir) for store_dir in store_dirs}
+            for store_dir, future in futures.items():
+                try:
+                    partials.append(future.result())
+                except Exception as e:
+                    errors[store_dir] = e
+
+    partials = pd.concat(partials, ignore_index=True) if partials else pd.DataFrame(columns=['store', 'product'] + PARTIAL_COLUMNS)
+    per_product = _with_profit(partials.groupby('product', sort=True)[PARTIAL_COLUMNS].sum().reset_index())
+    per_store = _with_profit(partials.groupby('store', sort=False)[PARTIAL_COLUMNS].sum().reset_index())
+    return per_product, per_store, _with_profit(partials), errors
@@ -0,0 +1,252 @@
+"""
+Inventory checkpoints for the CSV storage: the lots checkpoint, used to load the
+lots, and the dated checkpoints, used by 'report inventory --as-of DATE'.
+
+The lots checkpoint ('outputs/checkpoints/lots.json') is what is left of every
+lot at a position in the journal (the journal is the write-ahead log of every
+change). Loading the lots (for a sale, or for 'inventory.csv') reads it and
+replays only the events after it. When more than SuperConfig.checkpoint_events
+events had to be replayed, a new one is saved, so how long loading takes depends
+on the checkpoint interval and not on the length of the history. It is
+written at once (see locking.atomic_write) and only trusted when the journal
+still has its event at the position it names; otherwise the lots are replayed
+from the start of the journal.
+
+A dated checkpoint is the state of every lot with stock at the end of a day, saved
+as 'outputs/checkpoints/<date>.csv' together with the byte position in the
+journal where it was taken. A checkpoint is only taken at a cut of the journal:
+every event before that position is dated on or before the checkpoint day,
+every event after it later. So the inventory on any date is the nearest
+checkpoint on or before that date plus the events up to the next checkpoint,
+never a replay of the whole history.
+
+A dated checkpoint is taken every SuperConfig.checkpoint_days days of history. They
+are taken when an as-of inventory is asked for, so the first one reads the
+whole journal once. An event that is dated on or before a checkpoint day (after
+the clock was reset) breaks the cut, so writing it to the journal drops that
+checkpoint and the later ones (see journal.append_events); the next as-of
+inventory takes them again.
+"""
+# ---------------All the IMPORTS:---------------#
+import bisect
+import csv
+import json
+import os
+from datetime import date, timedelta
+import journal
+import locking
+from allocation import LotAllocator
+# pandas is imported inside the functions that need it, so commands that do not use it start faster
+# -----------------------------------------------#
+
+CHECKPOINT_COLUMNS = ['buy_id', 'buy_date', 'buy_name', 'buy_amount', 'buy_price', 'expire_date']
+
+# counter with the [date, journal position] of every checkpoint, oldest first
+CHECKPOINTS_COUNTER = 'checkpoints'
+
+# a lots checkpoint of another version is not used
+LOTS_CHECKPOINT_VERSION = 1
+
+COLUMNS = {name: index for index, name in enumerate(journal.JOURNAL_COLUMNS)}
+
+# ---------------------------------------------------------------------#
+def _checkpoint_file(config, checkpoint_date):
+    return os.path.join(config.checkpoints_dir, f"{checkpoint_date}.csv")
+
+# ---------------------------------------------------------------------#
+def _days_after(day, days):
+    return str(date.fromisoformat(day) + timedelta(days=days))
+
+# ---------------------------------------------------------------------#
+def _apply(allocator, row):
+    """Apply a journal event to the lots; expire events do not change what is left of a lot."""
+    event_type = row[COLUMNS['event_type']]
+    if event_type == 'buy':
+        allocator.add_lot({
+            'buy_id': int(row[COLUMNS['lot_id']]),
+            'buy_date': row[COLUMNS['event_date']],
+            'buy_name': row[COLUMNS['buy_name']],
+            'buy_amount': int(row[COLUMNS['amount']]),
+            'buy_price': float(row[COLUMNS['price']]),
+            'expire_date': row[COLUMNS['expire_date']],
+        })
+    elif event_type == 'sell':
+        lot_id = row[COLUMNS['lot_id']]
+        if lot_id == '':
+            allocator.allocate(row[COLUMNS['buy_name']], int(row[COLUMNS['amount']]), row[COLUMNS['event_date']], partial=True)
+        elif int(lot_id) in allocator.lots:
+            allocator.consume(int(lot_id), int(row[COLUMNS['amount']]))
+
+# ---------------------------------------------------------------------#
+def _save_checkpoint(config, checkpoint_date, allocator):
+    with locking.atomic_write(_checkpoint_file(config, checkpoint_date), newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=CHECKPOINT_COLUMNS)
+        writer.writeheader()
+        writer.writerows(lot for lot in allocator.lots.values() if lot['buy_amount'] > 0)
+
+# ---------------------------------------------------------------------#
+def _load_checkpoint(config, checkpoint_date):
+    allocator = LotAllocator()
+    if checkpoint_date is None:
+        return allocator
+    with open(_checkpoint_file(config, checkpoint_date), newline='') as f:
+        for lot in csv.DictReader(f):
+            allocator.add_lot({
+                'buy_id': int(lot['buy_id']),
+                'buy_date': lot['buy_date'],
+                'buy_name': lot['buy_name'],
+                'buy_amount': int(lot['buy_amount']),
+                'buy_price': float(lot['buy_price']),
+                'expire_date': lot['expire_date'],
+            })
+    return allocator
+
+# ---------------------------------------------------------------------#
+def _load_lots_checkpoint(config):
+    """
+    Return (allocator, event id, journal position) of the lots checkpoint, or an empty
+    allocator at the start of the journal when there is none that fits this journal.
+    """
+    allocator = LotAllocator()
+    try:
+        with open(config.lots_checkpoint_file) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        # no checkpoint yet, or not a complete one
+        return allocator, 0, 0
+    if state.get('version') != LOTS_CHECKPOINT_VERSION or journal.event_id_before(config, state.get('offset', 0)) != state.get('event_id'):
+        # the journal was created again since
+        return allocator, 0, 0
+    for values in zip(*(state['lots'][column] for column in CHECKPOINT_COLUMNS)):
+        allocator.add_lot(dict(zip(CHECKPOINT_COLUMNS, values)))
+    return allocator, state['event_id'], state['offset']
+
+# ---------------------------------------------------------------------#
+def save_lots_checkpoint(config, allocator, event_id, offset):
+    """Save the lots with stock of 'allocator', as they are after event 'event_id' (ending at byte 'offset')."""
+    lots = [lot for lot in allocator.lots.values() if lot['buy_amount'] > 0]
+    os.makedirs(config.checkpoints_dir, exist_ok=True)
+    with locking.atomic_write(config.lots_checkpoint_file) as f:
+        json.dump({
+            'version': LOTS_CHECKPOINT_VERSION,
+            'event_id': event_id,
+            'offset': offset,
+            # a list per column, the names are not repeated for every lot
+            'lots': {column: [lot[column] for lot in lots] for column in CHECKPOINT_COLUMNS},
+        }, f)
+
+# ---------------------------------------------------------------------#
+def load_lots(config):
+    """
+    Return the lots as they are at the end of the journal: the lots checkpoint plus the
+    events after it (saving a new checkpoint when there were many of them).
+
+    Returns:
+        tuple: (LotAllocator with the lots, the id of the last event in it, the journal position after that event).
+    """
+    journal.ensure_journal(config)
+    allocator, event_id, offset = _load_lots_checkpoint(config)
+    replayed = 0
+    for row, offset in journal.iter_events(config, offset):
+        _apply(allocator, row)
+        event_id = int(row[COLUMNS['event_id']])
+        replayed += 1
+    if replayed >= config.checkpoint_events:
+        save_lots_checkpoint(config, allocator, event_id, offset)
+    return allocator, event_id, offset
+
+# ---------------------------------------------------------------------#
+def drop_checkpoints(config, counters, first_date):
+    """
+    Drop the checkpoints dated on or after 'first_date' from 'counters' (the caller saves
+    them) and delete their files. Called when an event with that date is written.
+    """
+    kept = []
+    for checkpoint_date, offset in counters.get(CHECKPOINTS_COUNTER, []):
+        if checkpoint_date < first_date:
+            kept.append([checkpoint_date, offset])
+        elif os.path.exists(_checkpoint_file(config, checkpoint_date)):
+            os.remove(_checkpoint_file(config, checkpoint_date))
+    counters[CHECKPOINTS_COUNTER] = kept
+
+# ---------------------------------------------------------------------#
+def update_checkpoints(config):
+    """
+    Take the checkpoints of the history that was written since the last one.
+
+    Returns:
+        list: The [date, journal position] of every checkpoint, oldest first.
+    """
+    journal.ensure_journal(config)
+    os.makedirs(config.checkpoints_dir, exist_ok=True)
+    counters = journal.load_counters(config)
+    checkpoints = counters.get(CHECKPOINTS_COUNTER, [])
+    base_date, offset = checkpoints[-1] if checkpoints else (None, 0)
+    allocator = _load_checkpoint(config, base_date)
+
+    new_checkpoints = []
+    offset, latest_date = _take_checkpoints(config, allocator, offset, base_date or '', base_date, new_checkpoints)
+    with locking.store_lock(config):
+        # the events that were written while the journal was read can still break the new checkpoints
+        _take_checkpoints(config, allocator, offset, latest_date, base_date, new_checkpoints)
+        counters = journal.load_counters(config)
+        if counters.get(CHECKPOINTS_COUNTER, []) != checkpoints:
+            # another process took or dropped checkpoints in the meantime, those are up to date
+            return counters[CHECKPOINTS_COUNTER]
+        if new_checkpoints:
+            counters[CHECKPOINTS_COUNTER] = checkpoints + new_checkpoints
+            journal.save_counters(config, counters)
+    return checkpoints + new_checkpoints
+
+# ---------------------------------------------------------------------#
+def _take_checkpoints(config, allocator, offset, latest_date, base_date, new_checkpoints):
+    """
+    Replay the journal from 'offset' into the lots of 'allocator' and take a checkpoint
+    at every cut that is due. 'latest_date' is the latest event date before 'offset'.
+
+    Returns:
+        tuple: (the end of the journal that was read, the latest event date in it)
+    """
+    for row, end in journal.iter_events(config, offset):
+        event_date = row[COLUMNS['event_date']]
+        if new_checkpoints and event_date <= new_checkpoints[-1][0]:
+            # a later event dated back: the checkpoints of that day and after are no cut
+            while new_checkpoints and new_checkpoints[-1][0] >= event_date:
+                os.remove(_checkpoint_file(config, new_checkpoints.pop()[0]))
+        elif event_date > latest_date:
+            last_date = new_checkpoints[-1][0] if new_checkpoints else base_date
+            if latest_date and (last_date is None or latest_date >= _days_after(last_date, config.checkpoint_days)):
+                _save_checkpoint(config, latest_date, allocator)
+                new_checkpoints.append([latest_date, offset])
+            latest_date = event_date
+        _apply(allocator, row)
+        offset = end
+    return offset, latest_date
+
+# ---------------------------------------------------------------------#
+def inventory_as_of(config, as_of):
+    """
+    Return the inventory as it was at the end of day 'as_of': one checkpoint load
+    plus the journal events up to the next checkpoint that are dated on or before it.
+
+    Returns:
+        DataFrame: The lots with stock on that day, with the columns of 'inventory.csv'
+                   ('is_expired' is True for the lots that had expired by then).
+    """
+    import pandas as pd
+    as_of = str(as_of)
+    checkpoints = update_checkpoints(config)
+    index = bisect.bisect_right([checkpoint_date for checkpoint_date, _ in checkpoints], as_of)
+    base_date, offset = checkpoints[index - 1] if index > 0 else (None, 0)
+    stop = checkpoints[index][1] if index < len(checkpoints) else None
+
+    allocator = _load_checkpoint(config, base_date)
+    for row, _ in journal.iter_events(config, offset, stop):
+        if row[COLUMNS['event_date']] <= as_of:
+            _apply(allocator, row)
+
+    lots = sorted((lot for lot in allocator.lots.values() if lot['buy_amount'] > 0), key=lambda lot: lot['buy_id'])
+    inventory_df = pd.DataFrame.from_records(lots, columns=CHECKPOINT_COLUMNS)
+    inventory_df.insert(0, 'inventory_id', inventory_df['buy_id'])
+    inventory_df['is_expired'] = inventory_df['expire_date'] < as_of
+    return inventory_df
@@ -1,15 +1,61 @@
 # config.py
 import os
 class SuperConfig:
-    def __init__(self, outputs_dir='outputs'):
+    def __init__(self, outputs_dir='outputs', storage=None, time_file='time.txt', table_format=None):
         self.outputs_dir = outputs_dir
+        # the application date, and the real day the application last ran (see check_before_reset_date)
+        self.time_file = time_file
+        self.last_run_day_file = os.path.join(os.path.dirname(time_file), 'last_run_day.txt')
+        # storage backend: 'csv' (default) or 'sqlite', can also be set with the SUPERPY_STORAGE environment variable
+        self.storage = storage or os.environ.get('SUPERPY_STORAGE', 'csv')
+        # file format of the bought/sold/inventory/management report tables of the 'csv' storage:
+        # 'csv' (default), 'parquet' or 'feather', can also be set with SUPERPY_TABLE_FORMAT
+        self.table_format = table_format or os.environ.get('SUPERPY_TABLE_FORMAT', 'csv')
         self.bought_file = os.path.join(self.outputs_dir, 'bought.csv')
         self.sold_file = os.path.join(self.outputs_dir, 'sold.csv')
         self.inventory_file = os.path.join(self.outputs_dir, 'inventory.csv')
         self.management_report_file = os.path.join(self.outputs_dir, 'management_report.csv')
-        
+        self.pdf_reports_dir = os.path.join(self.outputs_dir, 'PDF_reports')
+        # the PDF management report and the hash of the management report it was rendered from
+        self.pdf_report_file = os.path.join(self.pdf_reports_dir, 'management_report.pdf')
+        self.pdf_hash_file = os.path.join(self.pdf_reports_dir, 'management_report.sha256')
+        # append-only transaction journal (source of truth) and its cached id counters
+        self.journal_file = os.path.join(self.outputs_dir, 'journal.csv')
+        self.counters_file = os.path.join(self.outputs_dir, 'counters.json')
+        # product catalog: the integer id of every product name (see catalog.py)
+        self.products_file = os.path.join(self.outputs_dir, 'products.csv')
+        # running totals of the management report and how far into the journal they are
+        self.report_state_file = os.path.join(self.outputs_dir, 'management_report_state.json')
+        # ledger of the lots every sale took its units from, kept with the management report
+        self.allocations_file = os.path.join(self.outputs_dir, 'allocations.csv')
+        # memory ceiling (MB) for streaming the journal into the management report, SUPERPY_REPORT_MEMORY_MB
+        self.report_memory_mb = int(os.environ.get('SUPERPY_REPORT_MEMORY_MB', 64))
+        # inventory checkpoints for 'report inventory --as-of', one per this many days of history (SUPERPY_CHECKPOINT_DAYS)
+        self.checkpoints_dir = os.path.join(self.outputs_dir, 'checkpoints')
+        self.checkpoint_days = int(os.environ.get('SUPERPY_CHECKPOINT_DAYS', 30))
+        # what is left of every lot at a position in the journal, so loading the lots only replays the events after it;
+        # a new one is saved when more than this many events had to be replayed (SUPERPY_CHECKPOINT_EVENTS)
+        self.lots_checkpoint_file = os.path.join(self.checkpoints_dir, 'lots.json')
+        self.checkpoint_events = int(os.environ.get('SUPERPY_CHECKPOINT_EVENTS', 5000))
+        # lots bucketed by expire date, so advancing time only reads the days it crosses
+        self.expiry_index_dir = os.path.join(self.outputs_dir, 'expiry_index')
+        # database used by the 'sqlite' storage backend
+        self.database_file = os.path.join(self.outputs_dir, 'superpy.db')
+        # advisory lock every transaction holds (see locking.py), and when the journal is flushed to disk:
+        # 'off' (default), 'always' or 'group' (group commit), can also be set with SUPERPY_SYNC
+        self.lock_file = os.path.join(self.outputs_dir, 'superpy.lock')
+        self.sync = os.environ.get('SUPERPY_SYNC', 'off')
+        # stage profiling of every command (see profiling.py): on with SUPERPY_PROFILE=1 (or 'super.py --profile'),
+        # one JSON line per command in the metrics file, and the cProfile statistics of the slowest stage in
+        # profile_dir when that is set (SUPERPY_METRICS_FILE, SUPERPY_PROFILE_DIR)
+        self.profile = os.environ.get('SUPERPY_PROFILE', '0') not in ('', '0', 'off')
+        self.metrics_file = os.environ.get('SUPERPY_METRICS_FILE', os.path.join(self.outputs_dir, 'metrics.ndjson'))
+        self.profile_dir = os.environ.get('SUPERPY_PROFILE_DIR')
+        # Unix socket of the resident process started with 'super.py serve'
+        self.socket_file = os.path.join(self.outputs_dir, 'superpy.sock')
+
 
 # Instantiate the config if the script is run directly
 if __name__ == "__main__":
     super_config = SuperConfig()
-    
+
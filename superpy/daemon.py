@@ -0,0 +1,154 @@
+"""
+Resident SuperPy process ('super.py serve') and the client that forwards to it.
+
+The server loads the store once and keeps it in memory (the storage backend
+caches the lots, the management report totals are folded incrementally), then
+runs the normal commands that arrive over a Unix socket. Everything is still
+written through the storage backend (journal or database), so the files stay
+the source of truth and the CLI works the same without the server.
+
+Protocol: line-delimited JSON, one request and one response per line, several
+requests can be sent over one connection.
+
+    request:  {"argv": ["sell", "Apple", "2", "1.0"]}
+    response: {"status": 0, "stdout": "Sale successful.\\n", "stderr": ""}
+
+Requests are handled one at a time, in the order they arrive.
+"""
+# ---------------All the IMPORTS:---------------#
+import contextlib
+import io
+import json
+import os
+import signal
+import socket
+import socketserver
+import sys
+# -----------------------------------------------#
+
+# commands that are never forwarded to the server (the action is found after the options that come before it,
+# like 'super.py --timings replay LOG')
+LOCAL_ACTIONS = ('serve', 'replay')
+
+# ---------------------------------------------------------------------#
+def run_command(run_cli, argv):
+    """
+    Run one command line in this process and capture what it prints.
+
+    Args:
+        run_cli (callable): Runs the command line 'argv' (super.py's run).
+        argv (list): The command line arguments, without 'super.py'.
+
+    Returns:
+        dict: The response: exit status, stdout and stderr of the command.
+    """
+    stdout, stderr = io.StringIO(), io.StringIO()
+    status = 0
+    with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+        try:
+            run_cli(argv)
+        except SystemExit as e:    # argparse errors and --help
+            status = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+        except Exception as e:
+            print("An error occurred while running the command ---->", e, file=sys.stderr)
+            status = 1
+    return {'status': status, 'stdout': stdout.getvalue(), 'stderr': stderr.getvalue()}
+
+
+class CommandHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                argv = [str(arg) for arg in request['argv']]
+            except (ValueError, KeyError, TypeError) as e:
+                response = {'status': 2, 'stdout': '', 'stderr': f"Invalid request: {e}\n"}
+            else:
+                action = self.server.command_action(argv)
+                if action in LOCAL_ACTIONS:
+                    response = {'status': 2, 'stdout': '', 'stderr': f"'{action}' cannot be sent to the server.\n"}
+                else:
+                    response = run_command(self.server.run_cli, argv)
+            self.wfile.write((json.dumps(response) + '\n').encode('utf-8'))
+            self.wfile.flush()
+
+
+class CommandServer(socketserver.UnixStreamServer):
+    def __init__(self, socket_file, run_cli, command_action):
+        self.run_cli = run_cli
+        self.command_action = command_action
+        super().__init__(socket_file, CommandHandler)
+
+# ---------------------------------------------------------------------#
+def server_is_running(socket_file):
+    """Return True when a server answers on 'socket_file'."""
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.connect(socket_file)
+        return True
+    except OSError:
+        return False
+
+# ---------------------------------------------------------------------#
+def serve(config, run_cli, command_action):
+    """
+    Run the server on 'config.socket_file' until it is interrupted (Ctrl+C or SIGTERM).
+
+    Args:
+        config (SuperConfig): Paths of the store.
+        run_cli (callable): Runs one command line (super.py's run).
+        command_action (callable): Returns the action of a command line (super.py's command_action).
+    """
+    if server_is_running(config.socket_file):
+        raise RuntimeError(f"A server is already running on: {config.socket_file}")
+    if os.path.exists(config.socket_file):
+        os.remove(config.socket_file)    # left behind by a server that did not stop cleanly
+
+    os.makedirs(config.outputs_dir, exist_ok=True)
+    server = CommandServer(config.socket_file, run_cli, command_action)
+    signal.signal(signal.SIGTERM, _stop_server)
+    print(f"SuperPy is serving on: {config.socket_file} (press Ctrl+C to stop)", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nServer stopped.")
+    finally:
+        server.server_close()
+        os.remove(config.socket_file)
+
+
+def _stop_server(signum, frame):
+    raise KeyboardInterrupt
+
+# ---------------------------------------------------------------------#
+def forward(config, argv, command_action):
+    """
+    Send a command line to the running server and print its output.
+    'command_action' returns the action of a command line (super.py's command_action).
+
+    Returns:
+        int: The exit status of the command, or None when no server is running
+             (the command then has to run in this process).
+    """
+    if not os.path.exists(config.socket_file) or command_action(argv) in LOCAL_ACTIONS:
+        return None
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(config.socket_file)
+    except OSError:
+        client.close()
+        return None
+
+    # once the server has the command it may have run it, so it is never run here again
+    try:
+        with client:
+            client.sendall((json.dumps({'argv': argv}) + '\n').encode('utf-8'))
+            with client.makefile('rb') as reply:
+                line = reply.readline()
+        response = json.loads(line)
+    except (OSError, ValueError) as e:
+        print(f"Error: No answer from the server on {config.socket_file} ---> {e}", file=sys.stderr)
+        return 1
+    sys.stdout.write(response['stdout'])
+    sys.stderr.write(response['stderr'])
+    return response['status']
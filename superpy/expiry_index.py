@@ -0,0 +1,92 @@
+"""
+Expiry index for the CSV storage.
+
+The lots are bucketed by expire_date: 'outputs/expiry_index/<expire_date>.csv'
+holds one line per change of a lot that expires on that day (+units when
+it is bought, -units when it is sold from). Moving the clock from day D1
+to day D2 only reads the buckets of the days in between, so only the lots
+that cross the expiry boundary are touched, no matter how big the inventory is.
+"""
+# ---------------All the IMPORTS:---------------#
+import csv
+import os
+import shutil
+import journal
+import locking
+# -----------------------------------------------#
+
+INDEX_COLUMNS = ['lot_id', 'buy_name', 'buy_price', 'units']
+
+# ---------------------------------------------------------------------#
+def ensure_index(config):
+    """
+    Build the index from the journal the first time it is needed.
+    Call this before writing the transaction that is going to be added to the index.
+    """
+    if os.path.isdir(config.expiry_index_dir):
+        return
+    with locking.store_lock(config):
+        if os.path.isdir(config.expiry_index_dir):
+            return
+        journal.ensure_journal(config)
+        lots = journal.replay_lots(journal.read_journal(config))
+        # built next to it and moved in place, so nobody sees a half-built index
+        building_dir = config.expiry_index_dir + '.building'
+        shutil.rmtree(building_dir, ignore_errors=True)    # left over from a build that did not finish
+        os.makedirs(building_dir)
+        add_entries(config, [(lot['expire_date'], lot['buy_id'], lot['buy_name'], lot['buy_price'], lot['buy_amount'])
+                             for lot in lots.values() if lot['buy_amount'] > 0], building_dir)
+        os.replace(building_dir, config.expiry_index_dir)
+
+# ---------------------------------------------------------------------#
+def add_entries(config, entries, index_dir=None):
+    """
+    Append changes to the index.
+
+    Args:
+        entries (list): (expire_date, lot_id, buy_name, buy_price, units) tuples;
+                        units is negative for a sale, which leaves buy_price empty.
+        index_dir (str): Folder of the index (default: config.expiry_index_dir).
+    """
+    buckets = {}
+    for expire_date, lot_id, buy_name, buy_price, units in entries:
+        buckets.setdefault(expire_date, []).append((lot_id, buy_name, buy_price, units))
+
+    for expire_date, rows in buckets.items():
+        bucket_file = os.path.join(index_dir or config.expiry_index_dir, f"{expire_date}.csv")
+        new_bucket = not os.path.exists(bucket_file)
+        with open(bucket_file, 'a', newline='') as f:
+            writer = csv.writer(f)
+            if new_bucket:
+                writer.writerow(INDEX_COLUMNS)
+            writer.writerows(rows)
+
+# ---------------------------------------------------------------------#
+def lots_expiring(config, first_date, last_date):
+    """
+    Return the lots with stock left whose expire_date is in [first_date, last_date).
+
+    Returns:
+        list: dicts with buy_id, buy_name, buy_price, buy_amount (units left) and expire_date.
+    """
+    ensure_index(config)
+    first_date, last_date = str(first_date), str(last_date)
+    lots = {}
+    for bucket_name in sorted(os.listdir(config.expiry_index_dir)):
+        expire_date = bucket_name[:-len('.csv')]
+        if not first_date <= expire_date < last_date:
+            continue
+        with open(os.path.join(config.expiry_index_dir, bucket_name), newline='') as f:
+            for row in csv.DictReader(f):
+                lot_id = int(row['lot_id'])
+                if lot_id not in lots:
+                    # the first line of a lot is the buy, it has the buy price
+                    lots[lot_id] = {
+                        'buy_id': lot_id,
+                        'buy_name': row['buy_name'],
+                        'buy_price': float(row['buy_price']),
+                        'buy_amount': 0,
+                        'expire_date': expire_date,
+                    }
+                lots[lot_id]['buy_amount'] += int(row['units'])
+    return [lot for lot in lots.values() if lot['buy_amount'] > 0]
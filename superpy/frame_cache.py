@@ -0,0 +1,96 @@
+"""
+Cached CSV (and Parquet/Feather) loader.
+
+Every module reads the store's files through read_csv (or read_frame), which
+parses a file only once as long as it does not change: the parsed DataFrame is kept
+per process, keyed on the path and the read options, and it is used again
+while the file has the same modification time and size. Writes go through
+write_csv (or call invalidate), so a file that is written in this process
+is always parsed again on the next read.
+
+Callers get a copy of the cached DataFrame, so they can change it freely.
+The hit/miss counters per file show how often a file was really parsed.
+"""
+# ---------------All the IMPORTS:---------------#
+import os
+import locking
+import profiling
+# pandas is imported inside the functions that need it, so commands that do not use it start faster
+# -----------------------------------------------#
+
+_frames = {}     # (path, read options) -> (mtime_ns, size, DataFrame)
+stats = {}       # path -> {'hits': int, 'misses': int}
+
+# ---------------------------------------------------------------------#
+def _file_stats(path):
+    return stats.setdefault(os.path.abspath(path), {'hits': 0, 'misses': 0})
+
+# ---------------------------------------------------------------------#
+def read_frame(path, loader, **read_options):
+    """
+    Return the contents of a file as a DataFrame, loaded only when the file changed.
+
+    Args:
+        path (str): The file.
+        loader (callable): loader(path, **read_options) returns the DataFrame.
+        **read_options: Passed on to the loader (they are part of the cache key).
+
+    Returns:
+        DataFrame: A copy of the (cached) loaded file.
+    """
+    file_info = os.stat(path)
+    key = (os.path.abspath(path), repr(sorted(read_options.items())))
+    cached = _frames.get(key)
+    if cached is not None and cached[:2] == (file_info.st_mtime_ns, file_info.st_size):
+        _file_stats(path)['hits'] += 1
+        return cached[2].copy()
+
+    _file_stats(path)['misses'] += 1
+    with profiling.stage('csv_read') as current:
+        df = loader(path, **read_options)
+        current.rows = len(df)
+    _frames[key] = (file_info.st_mtime_ns, file_info.st_size, df)
+    return df.copy()
+
+# ---------------------------------------------------------------------#
+def read_csv(path, **read_options):
+    """
+    Return the contents of a CSV file as a DataFrame, parsed only when the file changed
+    (read_options are passed on to pandas.read_csv). Only an empty field is missing:
+    'None', 'NA' or 'nan' are product names, not missing values.
+    """
+    import pandas as pd
+    read_options = {'keep_default_na': False, 'na_values': [''], **read_options}
+    return read_frame(path, pd.read_csv, **read_options)
+
+# ---------------------------------------------------------------------#
+def write_csv(df, path, **write_options):
+    """
+    Write a DataFrame to a CSV file (options are passed on to DataFrame.to_csv)
+    and forget the cached contents of that file. The file is replaced at once
+    (see locking.atomic_write), unless the options append to it.
+    """
+    if write_options.get('mode', 'w') != 'w':
+        df.to_csv(path, **write_options)
+    else:
+        with locking.atomic_write(path, newline='') as f:
+            df.to_csv(f, **write_options)
+    invalidate(path)
+
+# ---------------------------------------------------------------------#
+def invalidate(path):
+    """
+    Forget the cached contents of 'path'. Call this after writing the file some other way.
+    """
+    path = os.path.abspath(path)
+    for key in [key for key in _frames if key[0] == path]:
+        del _frames[key]
+
+# ---------------------------------------------------------------------#
+def summary():
+    """
+    Return the hit/miss counters as one line, for example:
+    'bought.csv parsed 1 cached 2, inventory.csv parsed 1 cached 0'.
+    """
+    return ', '.join(f"{os.path.basename(path)} parsed {counts['misses']} cached {counts['hits']}"
+                     for path, counts in sorted(stats.items())) or 'no file reads'
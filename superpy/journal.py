@@ -0,0 +1,492 @@
+"""
+Append-only transaction journal.
+
+Every buy, sell and expire event is written as one line to 'journal.csv'.
+The journal is the source of truth; 'bought.csv', 'sold.csv' and
+'inventory.csv' are materialized views that are only rebuilt from the
+journal when somebody asks for them (see refresh_views). The lots of the
+inventory come from the lots checkpoint plus the events after it (see
+checkpoints.load_lots), not from a replay of the whole journal.
+
+A transaction is appended in one write. When a process dies halfway through
+it, the journal ends in an incomplete line: readers skip it, and the next
+transaction cuts it off before it appends, so that transaction never happened.
+
+Ids are handed out from a small cached counter file ('counters.json'),
+so recording a transaction never has to read the history.
+"""
+# ---------------All the IMPORTS:---------------#
+import csv
+import io
+import json
+import os
+import catalog
+import frame_cache
+import locking
+import table_files
+from allocation import LotAllocator
+# pandas is imported inside the functions that need it, so commands that do not use it start faster
+# -----------------------------------------------#
+
+JOURNAL_COLUMNS = ['event_id', 'event_type', 'event_date', 'ref_id', 'lot_id', 'buy_name', 'amount', 'price', 'expire_date']
+BOUGHT_COLUMNS = ['buy_id', 'buy_date', 'buy_name', 'product_id', 'buy_amount', 'buy_price', 'expire_date']
+SOLD_COLUMNS = ['sell_id', 'sell_date', 'buy_name', 'product_id', 'sell_amount', 'sell_price']
+INVENTORY_COLUMNS = ['inventory_id', 'buy_id', 'buy_date', 'buy_name', 'product_id', 'buy_amount', 'buy_price', 'expire_date',
+                     'is_expired']
+
+# the id counters of 'counters.json', the other entries in it remember how far the views and checkpoints are
+COUNTER_NAMES = ('event_id', 'buy_id', 'sell_id')
+# counter name used to remember up to which event the views were materialized
+VIEWS_COUNTER = 'views_event_id'
+# the views are built again when they were written with other columns (2: with the product ids)
+VIEWS_VERSION = 2
+
+# ---------------------------------------------------------------------#
+def read_journal(config):
+    """
+    Read the whole journal into a DataFrame (empty DataFrame if there is no journal yet).
+    Only complete lines are read, so a transaction that is being written is left out.
+    The event types and product names are categoricals: every distinct one is stored once.
+    """
+    import pandas as pd
+    if not os.path.exists(config.journal_file):
+        return pd.DataFrame(columns=JOURNAL_COLUMNS)
+    return frame_cache.read_frame(config.journal_file, _read_complete_lines,
+                                  dtype={'event_type': 'category', 'event_date': str, 'buy_name': 'category',
+                                         'expire_date': str, 'ref_id': 'Int64', 'lot_id': 'Int64'})
+
+# ---------------------------------------------------------------------#
+def _read_complete_lines(path, **read_options):
+    import pandas as pd
+    with open(path, 'rb') as f:
+        data = f.read()
+    # only an empty field is missing, a product can be called 'None' or 'NA' (see frame_cache.read_csv)
+    return pd.read_csv(io.BytesIO(data[:data.rfind(b'\n') + 1]), keep_default_na=False, na_values=[''], **read_options)
+
+# ---------------------------------------------------------------------#
+def iter_events(config, offset=0, stop=None, chunk_bytes=1024 * 1024):
+    """
+    Stream the journal in chunks of 'chunk_bytes', so it is never in memory as a whole.
+
+    Args:
+        config (SuperConfig): Paths of the store.
+        offset (int): Byte position to start at, at the start of a line (0 skips the header).
+        stop (int): Byte position to stop at, at the start of a line (default: the end).
+        chunk_bytes (int): How much of the journal is read at a time.
+
+    Yields:
+        tuple: (fields of an event in JOURNAL_COLUMNS order, byte position right after its line).
+               A last line that is still being written is left for the next time.
+    """
+    with open(config.journal_file, 'rb') as f:
+        f.seek(offset)
+        rest = b''
+        while True:
+            data = f.read(chunk_bytes if stop is None else min(chunk_bytes, stop - f.tell()))
+            if not data:
+                break
+            data = rest + data
+            # only complete lines; the rest goes with the next chunk
+            end = data.rfind(b'\n') + 1
+            rest = data[end:]
+            lines = data[:end].split(b'\n')[:-1]
+            if offset == 0 and lines:
+                offset += len(lines.pop(0)) + 1    # header
+            for line, row in zip(lines, csv.reader(line.decode('utf-8') for line in lines)):
+                offset += len(line) + 1
+                yield row, offset
+
+# ---------------------------------------------------------------------#
+def event_id_before(config, offset):
+    """Return the id of the event whose line ends at byte 'offset' of the journal (None when no line ends there)."""
+    if offset <= 0 or offset > os.path.getsize(config.journal_file):
+        return None
+    with open(config.journal_file, 'rb') as f:
+        f.seek(max(0, offset - 4096))
+        data = f.read(offset - f.tell())
+    if not data.endswith(b'\n'):
+        return None
+    line = data[:-1].rsplit(b'\n', 1)[-1]
+    event_id = line.split(b',', 1)[0]
+    return int(event_id) if event_id.isdigit() else None
+
+# ---------------------------------------------------------------------#
+def load_counters(config):
+    """
+    Return the cached id counters, seeding them from the journal when the cache is missing
+    or cannot be read (an empty or torn file). Call it under the store lock (see locking.store_lock)
+    to change them.
+    """
+    ensure_journal(config)
+    counters = _read_counters(config)
+    if counters is not None:
+        return counters
+
+    with locking.store_lock(config):
+        counters = _read_counters(config)
+        if counters is not None:
+            return counters
+        return _seed_counters(config)
+
+# ---------------------------------------------------------------------#
+def _read_counters(config):
+    """Return the cached id counters (None when the file is missing or not valid)."""
+    try:
+        with open(config.counters_file) as f:
+            counters = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(counters, dict) or not all(isinstance(counters.get(name), int) for name in COUNTER_NAMES):
+        return None
+    return counters
+
+# ---------------------------------------------------------------------#
+def _seed_counters(config):
+    journal_df = read_journal(config)
+    counters = dict.fromkeys(COUNTER_NAMES, 0)
+    if not journal_df.empty:
+        counters['event_id'] = int(journal_df['event_id'].max())
+        for event_type, counter_name in (('buy', 'buy_id'), ('sell', 'sell_id')):
+            ref_ids = journal_df.loc[journal_df['event_type'] == event_type, 'ref_id']
+            if ref_ids.notna().any():
+                counters[counter_name] = int(ref_ids.max())
+    save_counters(config, counters)
+    return counters
+
+# ---------------------------------------------------------------------#
+def save_counters(config, counters):
+    with locking.atomic_write(config.counters_file) as f:
+        json.dump(counters, f)
+
+# ---------------------------------------------------------------------#
+def next_id(config, counter_name, count=1):
+    """
+    Reserve 'count' consecutive ids from the cached counter and return the first one.
+
+    Args:
+        config (SuperConfig): Paths of the store.
+        counter_name (str): 'buy_id' or 'sell_id'.
+        count (int): Number of ids to reserve.
+    """
+    with locking.store_lock(config):
+        counters = load_counters(config)
+        first_id = counters.get(counter_name, 0) + 1
+        counters[counter_name] = first_id + count - 1
+        save_counters(config, counters)
+    return first_id
+
+# ---------------------------------------------------------------------#
+def append_events(config, events):
+    """
+    Append events (dicts keyed by JOURNAL_COLUMNS, without 'event_id') to the journal.
+    The event ids are assigned here. Returns the events with their ids filled in.
+    """
+    with locking.store_lock(config):
+        counters = load_counters(config)
+        for event in events:
+            counters['event_id'] += 1
+            event['event_id'] = counters['event_id']
+
+        # an event dated on or before an inventory checkpoint (the clock was reset) makes it wrong
+        checkpoints_taken = counters.get('checkpoints')
+        first_date = min(str(event['event_date']) for event in events) if events else None
+        if checkpoints_taken and first_date <= checkpoints_taken[-1][0]:
+            import checkpoints    # imported here, checkpoints itself imports this module
+            checkpoints.drop_checkpoints(config, counters, first_date)
+
+        # one write for all lines, so a reader sees all of them or none
+        lines = io.StringIO()
+        csv.DictWriter(lines, fieldnames=JOURNAL_COLUMNS).writerows(events)
+        _drop_incomplete_line(config)
+        with open(config.journal_file, 'a', newline='') as f:
+            f.write(lines.getvalue())
+            locking.appended(config, config.journal_file, f.tell())
+        frame_cache.invalidate(config.journal_file)
+
+        save_counters(config, counters)
+    return events
+
+# ---------------------------------------------------------------------#
+def _drop_incomplete_line(config):
+    """
+    Cut off the last line of the journal when it is incomplete: the rest of a transaction
+    that was being written when its process died. Call it under the store lock.
+    """
+    with open(config.journal_file, 'rb+') as f:
+        end = f.seek(0, os.SEEK_END)
+        if end == 0:
+            return
+        f.seek(end - 1)
+        if f.read(1) == b'\n':
+            return
+        # the start of the incomplete line: right after the last complete one
+        position = end
+        while position > 0:
+            start = max(0, position - 64 * 1024)
+            f.seek(start)
+            newline = f.read(position - start).rfind(b'\n')
+            if newline >= 0:
+                position = start + newline + 1
+                break
+            position = start
+        f.truncate(position)
+    frame_cache.invalidate(config.journal_file)
+    # the flushed position of a group commit may lie in the part that was cut off
+    if os.path.exists(config.journal_file + '.synced'):
+        os.remove(config.journal_file + '.synced')
+
+# ---------------------------------------------------------------------#
+def record_buys(config, buy_date, buys):
+    """
+    Write buy events to the journal, one per bought lot.
+
+    Args:
+        buys (list): (buy_name, amount, price, expire_date) tuples.
+
+    Returns:
+        int: The buy_id (which is also the lot_id) of the first new lot; the others follow it.
+    """
+    first_id = next_id(config, 'buy_id', count=len(buys))
+    append_events(config, [{
+        'event_type': 'buy',
+        'event_date': str(buy_date),
+        'ref_id': buy_id,
+        'lot_id': buy_id,
+        'buy_name': buy_name,
+        'amount': amount,
+        'price': price,
+        'expire_date': expire_date,
+    } for buy_id, (buy_name, amount, price, expire_date) in enumerate(buys, start=first_id)])
+    return first_id
+
+# ---------------------------------------------------------------------#
+def record_sales(config, sell_date, sales):
+    """
+    Write sales to the journal: one sell event per lot the units were taken from,
+    all events of a sale with the same sell_id.
+
+    Args:
+        sales (list): (buy_name, price, allocations) tuples, where allocations are the
+                      (lot_id, units, expire_date) tuples returned by LotAllocator.allocate.
+
+    Returns:
+        int: The sell_id of the first sale; the others follow it.
+    """
+    first_id = next_id(config, 'sell_id', count=len(sales))
+    append_events(config, [{
+        'event_type': 'sell',
+        'event_date': str(sell_date),
+        'ref_id': sell_id,
+        'lot_id': lot_id,
+        'buy_name': buy_name,
+        'amount': units,
+        'price': price,
+        'expire_date': expire_date,
+    } for sell_id, (buy_name, price, allocations) in enumerate(sales, start=first_id)
+      for lot_id, units, expire_date in allocations])
+    return first_id
+
+# ---------------------------------------------------------------------#
+def record_expirations(config, event_type, event_date, lots):
+    """
+    Write an 'expire' (or, when the clock moved back, an 'unexpire') event
+    for every lot in 'lots' with the units it still has.
+
+    Args:
+        event_type (str): 'expire' or 'unexpire'.
+        event_date (date): The new current date.
+        lots (list): Lot dicts (buy_id, buy_name, buy_amount, buy_price, expire_date),
+                     see expiry_index.lots_expiring.
+
+    Returns:
+        list: The written events.
+    """
+    return append_events(config, [{
+        'event_type': event_type,
+        'event_date': str(event_date),
+        'ref_id': '',
+        'lot_id': lot['buy_id'],
+        'buy_name': lot['buy_name'],
+        'amount': lot['buy_amount'],
+        'price': lot['buy_price'],
+        'expire_date': lot['expire_date'],
+    } for lot in lots]) if lots else []
+
+# ---------------------------------------------------------------------#
+def ensure_journal(config):
+    """
+    Make sure the journal exists. The first time it is needed, the journal
+    is seeded once from the existing 'bought.csv' and 'sold.csv' files, plus an
+    expire event for every lot that 'inventory.csv' marks as expired.
+    """
+    if os.path.exists(config.journal_file):
+        return
+    with locking.store_lock(config):
+        if not os.path.exists(config.journal_file):
+            _create_journal(config)
+
+# ---------------------------------------------------------------------#
+def _create_journal(config):
+    import pandas as pd
+    events = []
+    if os.path.exists(config.bought_file):
+        bought_df = frame_cache.read_csv(config.bought_file)
+        for row in bought_df.itertuples(index=False):
+            events.append({
+                'event_type': 'buy',
+                'event_date': row.buy_date,
+                'ref_id': int(row.buy_id),
+                'lot_id': int(row.buy_id),
+                'buy_name': row.buy_name,
+                'amount': int(row.buy_amount),
+                'price': row.buy_price,
+                'expire_date': str(pd.to_datetime(row.expire_date).date()),
+            })
+    if os.path.exists(config.sold_file):
+        sold_df = frame_cache.read_csv(config.sold_file)
+        for row in sold_df.itertuples(index=False):
+            events.append({
+                'event_type': 'sell',
+                'event_date': row.sell_date,
+                'ref_id': int(row.sell_id),
+                'lot_id': '',
+                'buy_name': row.buy_name,
+                'amount': int(row.sell_amount),
+                'price': row.sell_price,
+                'expire_date': '',
+            })
+    if os.path.exists(config.inventory_file):
+        inventory_df = frame_cache.read_csv(config.inventory_file)
+        expired_lots = inventory_df[inventory_df['is_expired'].astype(str) == 'True']
+        for row in expired_lots.itertuples(index=False):
+            events.append({
+                'event_type': 'expire',
+                'event_date': str((pd.to_datetime(row.expire_date) + pd.Timedelta(days=1)).date()),
+                'ref_id': '',
+                'lot_id': int(row.buy_id),
+                'buy_name': row.buy_name,
+                'amount': int(row.buy_amount),
+                'price': row.buy_price,
+                'expire_date': str(pd.to_datetime(row.expire_date).date()),
+            })
+    for event_id, event in enumerate(events, start=1):
+        event['event_id'] = event_id
+
+    os.makedirs(config.outputs_dir, exist_ok=True)
+    with locking.atomic_write(config.journal_file, newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=JOURNAL_COLUMNS)
+        writer.writeheader()
+        writer.writerows(events)
+    frame_cache.invalidate(config.journal_file)
+
+    # the cached counters (and how far the journal was flushed, and the lots checkpoint) belong to the old files
+    for stale_file in (config.counters_file, config.journal_file + '.synced', config.lots_checkpoint_file):
+        if os.path.exists(stale_file):
+            os.remove(stale_file)
+    load_counters(config)
+
+# ---------------------------------------------------------------------#
+def load_allocator(journal_df):
+    """
+    Replay the journal into a LotAllocator.
+
+    Sell events carry the lot they were taken from. Sell events without a
+    lot_id (the ones seeded from the old 'sold.csv') are allocated first
+    expired first out, using the lots that were not expired on the day of the sale.
+
+    Returns:
+        LotAllocator: The lots with what is left of them.
+    """
+    import pandas as pd
+    allocator = LotAllocator()
+    for event in journal_df.itertuples(index=False):
+        if event.event_type == 'buy':
+            allocator.add_lot({
+                'buy_id': int(event.lot_id),
+                'buy_date': event.event_date,
+                'buy_name': event.buy_name,
+                'buy_amount': int(event.amount),
+                'buy_price': event.price,
+                'expire_date': event.expire_date,
+            })
+        elif event.event_type == 'sell':
+            if pd.isna(event.lot_id):
+                allocator.allocate(event.buy_name, int(event.amount), event.event_date, partial=True)
+            else:
+                allocator.consume(int(event.lot_id), int(event.amount))
+    return allocator
+
+# ---------------------------------------------------------------------#
+def replay_lots(journal_df):
+    """
+    Replay the journal and return the state of every lot.
+
+    Returns:
+        dict: lot_id -> dict with the inventory columns (buy_amount is what is left).
+    """
+    return load_allocator(journal_df).lots
+
+# ---------------------------------------------------------------------#
+def materialize_views(config, current_date):
+    """
+    Rebuild 'bought.csv', 'sold.csv' and 'inventory.csv' from the journal.
+
+    Args:
+        config (SuperConfig): Paths of the store.
+        current_date (date): Date used to set the 'is_expired' column of the inventory.
+    """
+    import pandas as pd
+    import checkpoints    # imported here, checkpoints itself imports this module
+    # the lots up to some event, and the journal up to the same event (other processes may append meanwhile)
+    allocator, last_event_id, _ = checkpoints.load_lots(config)
+    journal_df = read_journal(config)
+    journal_df = journal_df[journal_df['event_id'] <= last_event_id]
+    # every product in the journal has an id (the catalog is created from the journal the first time)
+    products = catalog.add_products(config, journal_df['buy_name'].unique())
+
+    buys = journal_df[journal_df['event_type'] == 'buy']
+    bought_df = pd.DataFrame({
+        'buy_id': buys['ref_id'],
+        'buy_date': buys['event_date'],
+        'buy_name': buys['buy_name'],
+        'product_id': products.id_column(buys['buy_name']),
+        'buy_amount': buys['amount'],
+        'buy_price': buys['price'],
+        'expire_date': buys['expire_date'],
+    }, columns=BOUGHT_COLUMNS)
+    table_files.write_table(config, 'bought', bought_df)
+
+    # sold.csv has one line per sale (the lots it was taken from are in the allocation ledger)
+    # (the first event of a sale has its date, product and price; a grouped 'first' of a categorical is slow)
+    sells = journal_df[journal_df['event_type'] == 'sell']
+    sold_df = sells.drop_duplicates('ref_id').rename(columns={
+        'ref_id': 'sell_id', 'event_date': 'sell_date', 'price': 'sell_price'})
+    sold_df['sell_amount'] = sold_df['sell_id'].map(sells.groupby('ref_id')['amount'].sum())
+    sold_df['product_id'] = products.id_column(sold_df['buy_name'])
+    table_files.write_table(config, 'sold', sold_df[SOLD_COLUMNS])
+
+    lots = [lot for lot in allocator.lots.values() if lot['buy_amount'] > 0]
+    inventory_df = pd.DataFrame.from_records(lots, columns=INVENTORY_COLUMNS[1:-1])
+    inventory_df.insert(0, 'inventory_id', inventory_df['buy_id'])
+    inventory_df['product_id'] = products.id_column(inventory_df['buy_name'])
+    inventory_df['is_expired'] = inventory_df['expire_date'] < str(current_date)
+    table_files.write_table(config, 'inventory', inventory_df)
+
+    # the views are as new as the journal that was read, other processes may have written since
+    with locking.store_lock(config):
+        counters = load_counters(config)
+        counters[VIEWS_COUNTER] = last_event_id
+        counters['views_version'] = VIEWS_VERSION
+        save_counters(config, counters)
+
+# ---------------------------------------------------------------------#
+def refresh_views(config, current_date):
+    """
+    Rebuild the materialized views only when the journal has new events since the last build.
+    """
+    counters = load_counters(config)
+    views_exist = all(os.path.exists(table_files.table_file(config, name)) for name in ('bought', 'sold', 'inventory'))
+    if not views_exist or counters.get(VIEWS_COUNTER) != counters['event_id'] or counters.get('views_version') != VIEWS_VERSION:
+        materialize_views(config, current_date)
+
+# ---------------------------------------------------------------------#
@@ -0,0 +1,163 @@
+"""
+Concurrency for several tills that share one 'outputs' folder.
+
+- store_lock: an advisory lock on 'outputs/superpy.lock' that every
+  transaction holds from reading the state it depends on (the lots, the id
+  counters, the date) up to writing its result, so two processes never sell
+  the same units or hand out the same id. It can be taken again by the
+  process that holds it.
+- atomic_write: files that are rewritten are written to a temporary file
+  next to them, flushed to disk and renamed over them, so a reader (also
+  after a power loss) sees the old or the new file, never a half-written one. The journal is only appended to, and
+  readers only read its complete lines, so reports never wait for a writer.
+- sync modes (SuperConfig.sync, SUPERPY_SYNC): 'off' leaves flushing the
+  journal to the operating system (the default), 'always' fsyncs it after
+  every transaction, and 'group' is a group commit: a writer fsyncs after it
+  released the store lock, and one fsync covers the transactions of every
+  writer that appended in the meantime, so the others find their data
+  already flushed and return without a flush of their own.
+"""
+# ---------------All the IMPORTS:---------------#
+import contextlib
+import os
+try:
+    import fcntl
+except ImportError:     # Windows
+    fcntl = None
+    import msvcrt
+# -----------------------------------------------#
+
+SYNC_MODES = ('off', 'always', 'group')
+
+_held = {}              # lock file -> (open file, depth) of the locks this process holds
+_unsynced = {}          # path -> (config, end offset) appended under the store lock, to be flushed when it is released
+sync_stats = {'commits': 0, 'fsyncs': 0}
+
+# ---------------------------------------------------------------------#
+def _lock_file(f):
+    if fcntl:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+
+# ---------------------------------------------------------------------#
+def _unlock_file(f):
+    if fcntl:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+# ---------------------------------------------------------------------#
+@contextlib.contextmanager
+def file_lock(path):
+    """
+    Hold an exclusive advisory lock on 'path' (created when it is missing).
+    A process that already holds it can take it again.
+    """
+    path = os.path.abspath(path)
+    if path in _held:
+        f, depth = _held[path]
+        _held[path] = (f, depth + 1)
+    else:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        f = open(path, 'a+')
+        _lock_file(f)
+        _held[path] = (f, 1)
+    try:
+        yield
+    finally:
+        f, depth = _held[path]
+        if depth > 1:
+            _held[path] = (f, depth - 1)
+        else:
+            del _held[path]
+            _unlock_file(f)
+            f.close()
+
+# ---------------------------------------------------------------------#
+@contextlib.contextmanager
+def store_lock(config):
+    """
+    Hold the lock of the store for one transaction. When the outermost store lock
+    is released, the journal appends it covered are flushed as config.sync asks.
+    """
+    outermost = os.path.abspath(config.lock_file) not in _held
+    with file_lock(config.lock_file):
+        yield
+    if outermost:
+        for path, (path_config, end) in list(_unsynced.items()):
+            del _unsynced[path]
+            _sync(path_config, path, end)
+
+# ---------------------------------------------------------------------#
+def appended(config, path, end):
+    """
+    Note that 'path' was appended to up to byte 'end' (call it under the store lock);
+    it is flushed when the store lock is released.
+    """
+    if config.sync != 'off':
+        _unsynced[os.path.abspath(path)] = (config, end)
+
+# ---------------------------------------------------------------------#
+def _sync(config, path, end):
+    sync_stats['commits'] += 1
+    if config.sync == 'always':
+        _fsync(path)
+        return
+    # group commit: whoever flushes first flushes the appends of everybody before it
+    synced_file = path + '.synced'
+    with file_lock(path + '.sync.lock'):
+        synced = 0
+        if os.path.exists(synced_file):
+            with open(synced_file) as f:
+                synced = int(f.read() or 0)
+        if synced >= end:
+            return
+        size = os.path.getsize(path)
+        _fsync(path)
+        with atomic_write(synced_file) as f:
+            f.write(str(size))
+
+# ---------------------------------------------------------------------#
+def _fsync(path):
+    sync_stats['fsyncs'] += 1
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+# ---------------------------------------------------------------------#
+@contextlib.contextmanager
+def atomic_write(path, mode='w', **open_options):
+    """
+    Open a temporary file next to 'path' for writing and move it over 'path'
+    when the block ends without an error (the temporary file is removed otherwise).
+    The file is on disk before it is moved, and the move is on disk when this returns,
+    so after a power loss 'path' is the old or the new file, never an empty one.
+    """
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, mode, **open_options) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+        _fsync_folder(os.path.dirname(os.path.abspath(path)))
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+# ---------------------------------------------------------------------#
+def _fsync_folder(folder):
+    """Flush the entries of 'folder' (a rename in it) to disk; Windows cannot open a folder for that."""
+    try:
+        fd = os.open(folder, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
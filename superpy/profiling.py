@@ -0,0 +1,177 @@
+"""
+Stage-level profiling of one command ('super.py --profile ...' or SUPERPY_PROFILE=1).
+
+The expensive steps of a command run in a stage:
+
+    with profiling.stage('csv_read') as current:
+        df = loader(path)
+        current.rows = len(df)
+
+For every stage the wall time, the rows it processed and the peak memory of
+the process when it ended (the high-water mark of its resident memory, so the
+stage that raises it is the one that needed the memory) are recorded. This
+costs next to nothing, unlike tracing every allocation, so the times are the
+times of a normal run ('serve' runs many commands in one process, there the
+peak is that of the server so far). When the command ends, one JSON line is
+appended to the metrics file (SuperConfig.metrics_file), for example:
+
+    {"time": "2024-01-31T12:00:00", "command": "report profit", "seconds": 0.84, "peak_mb": 140.2, "error": null,
+     "stages": {"csv_read": {"calls": 2, "seconds": 0.31, "rows": 20000, "peak_mb": 131.5}, ...}}
+
+Stages can run inside each other (the management report reads the journal), so
+the time of a stage includes the stages it ran. A stage that ended with an error
+has the error in the record. With a profile folder (--profile-dir or
+SUPERPY_PROFILE_DIR) every outermost stage also runs under cProfile, and the
+statistics of the slowest one are written to that folder (open them with pstats
+or snakeviz).
+
+Without profiling, stage() only checks a flag.
+"""
+# ---------------All the IMPORTS:---------------#
+import contextlib
+import json
+import os
+import sys
+import time
+from datetime import datetime as dt
+try:
+    import resource
+except ImportError:     # Windows
+    resource = None
+# cProfile is imported when a profile folder is given
+# -----------------------------------------------#
+
+enabled = False
+_invocation = None      # the record of the command that is profiled
+_stack = []             # the stages that are running, outermost first
+
+
+class _Stage:
+    __slots__ = ('rows',)
+
+    def __init__(self, rows=None):
+        self.rows = rows
+
+# handed out when profiling is off, setting its rows does nothing useful
+_IGNORED = _Stage()
+
+# ---------------------------------------------------------------------#
+def start(config, command, argv, profile_dir=None):
+    """
+    Start profiling a command (call finish when it is done).
+
+    Args:
+        config (SuperConfig): The store; the record goes to config.metrics_file.
+        command (str): The name of the command in the record, for example 'report profit'.
+        argv (list): The command line, without 'super.py'.
+        profile_dir (str): Folder for the cProfile statistics of the slowest stage (None: no cProfile).
+    """
+    global enabled, _invocation
+    _invocation = {
+        'config': config,
+        'profile_dir': profile_dir,
+        'started': time.perf_counter(),
+        'slowest': None,            # (seconds, stage name, cProfile.Profile) of the slowest outermost stage
+        'record': {'time': dt.now().isoformat(timespec='seconds'), 'command': command, 'argv': list(argv),
+                   'pid': os.getpid(), 'seconds': None, 'peak_mb': None, 'error': None, 'stages': {}, 'profile': None},
+    }
+    enabled = True
+
+# ---------------------------------------------------------------------#
+def peak_memory_mb():
+    """Return the peak resident memory of this process so far in MB (None where it is not known)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+# ---------------------------------------------------------------------#
+@contextlib.contextmanager
+def stage(name, rows=None):
+    """
+    Measure one stage of the command: wall time, rows (pass them, or set .rows on the
+    object this yields) and peak memory. Does nothing when profiling is off.
+    """
+    if not enabled:
+        yield _IGNORED
+        return
+
+    current = _Stage(rows)
+    profiler = _start_profiler() if not _stack and _invocation['profile_dir'] else None
+    _stack.append(current)
+    error = None
+    started = time.perf_counter()
+    try:
+        yield current
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        seconds = time.perf_counter() - started
+        _stack.pop()
+        if profiler:
+            profiler.disable()
+            slowest = _invocation['slowest']
+            if slowest is None or seconds > slowest[0]:
+                _invocation['slowest'] = (seconds, name, profiler)
+        _add_stage(name, seconds, current, error)
+
+# ---------------------------------------------------------------------#
+def _start_profiler():
+    import cProfile
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:      # another profiler is running (python -m cProfile ...)
+        return None
+    return profiler
+
+# ---------------------------------------------------------------------#
+def _add_stage(name, seconds, current, error):
+    totals = _invocation['record']['stages'].setdefault(name, {'calls': 0, 'seconds': 0.0, 'rows': None, 'peak_mb': None})
+    totals['calls'] += 1
+    totals['seconds'] = round(totals['seconds'] + seconds, 6)
+    if current.rows is not None:
+        totals['rows'] = (totals['rows'] or 0) + int(current.rows)
+    totals['peak_mb'] = peak_memory_mb()
+    if error is not None:
+        totals['error'] = f"{type(error).__name__}: {error}"
+
+# ---------------------------------------------------------------------#
+def finish(error=None):
+    """
+    Stop profiling the command and append its record to the metrics file
+    (and write the cProfile statistics of the slowest stage). Does nothing when profiling is off.
+
+    Args:
+        error (BaseException): The error the command ended with, if any.
+
+    Returns:
+        dict: The record that was written (None when profiling is off).
+    """
+    global enabled, _invocation
+    if not enabled:
+        return None
+    invocation, enabled, _invocation = _invocation, False, None
+    _stack.clear()
+
+    record = invocation['record']
+    record['seconds'] = round(time.perf_counter() - invocation['started'], 6)
+    record['peak_mb'] = peak_memory_mb()
+    if error is not None and not (isinstance(error, SystemExit) and error.code in (None, 0)):
+        record['error'] = f"{type(error).__name__}: {error}"
+    if invocation['slowest']:
+        _, name, profiler = invocation['slowest']
+        os.makedirs(invocation['profile_dir'], exist_ok=True)
+        command = record['command'].replace(' ', '-')
+        record['profile'] = os.path.join(invocation['profile_dir'],
+                                         f"{dt.now():%Y%m%d-%H%M%S}-{os.getpid()}-{command}-{name}.prof")
+        profiler.dump_stats(record['profile'])
+
+    metrics_file = invocation['config'].metrics_file
+    os.makedirs(os.path.dirname(os.path.abspath(metrics_file)), exist_ok=True)
+    # one write of one line in append mode, so the lines of processes that finish together do not mix
+    with open(metrics_file, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(record) + '\n')
+    return record
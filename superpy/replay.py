@@ -0,0 +1,248 @@
+"""
+Replay of a transaction log against a scratch store, for load testing.
+
+A replay log is a CSV or NDJSON file with one event per line (LOG_COLUMNS):
+
+    at,action,name,amount,price,expire_date,days
+    0.00,buy,Tomato 500g,20,1.50,2023-07-20,
+    0.35,sell,Tomato 500g,2,3.85,,
+    1.10,time,,,,,1
+    1.20,report,,,,,
+
+'at' is when the event happened: seconds since the start of the log, or a
+timestamp (year-month-day hour:minute:second). 'buy', 'sell' and 'time' run
+the Store methods that 'super.py buy', 'sell' and 'time' run (a buy or sale
+the store refuses with a StoreError counts as rejected); 'report' brings the
+expire status and the management report up to date, like every report does
+before it prints.
+
+The events run against a scratch outputs folder (a new one, or a copy of a
+seed store), never against the store of the application. They run one after
+the other at full speed, or paced like the log with a speed-up factor. The
+result is the throughput, the latency percentiles per action and checksums
+of the final inventory and management report. The checksums only depend on
+the rows, not on how they are stored, so two replays of one log can compare
+storage backends or engine changes.
+"""
+# ---------------All the IMPORTS:---------------#
+import csv
+import hashlib
+import json
+import os
+import shutil
+import time
+from datetime import datetime as dt
+from config import SuperConfig
+import functions
+from report_aggregates import MANAGEMENT_REPORT_COLUMNS
+from store import StoreError
+# pandas is imported when a replay starts
+# -----------------------------------------------#
+
+LOG_COLUMNS = ['at', 'action', 'name', 'amount', 'price', 'expire_date', 'days']
+REPLAY_ACTIONS = ['buy', 'sell', 'time', 'report']
+START_DATE = '2023-07-01'
+PERCENTILES = [50, 90, 99]
+
+# the rows the checksums are made of, in a fixed order (the ids are left out, they are numbered differently per storage)
+CHECKSUM_COLUMNS = {
+    'inventory': ['buy_date', 'buy_name', 'buy_amount', 'buy_price', 'expire_date', 'is_expired'],
+    'management_report': MANAGEMENT_REPORT_COLUMNS,
+}
+
+# ---------------------------------------------------------------------#
+def _seconds(value):
+    """Return 'at' as seconds: a number as it is, a timestamp as seconds since the epoch."""
+    try:
+        return float(value)
+    except ValueError:
+        return dt.fromisoformat(str(value)).timestamp()
+
+# ---------------------------------------------------------------------#
+def read_log(source, file_format=None):
+    """
+    Read a replay log.
+
+    Args:
+        source (str): Path of the log.
+        file_format (str): 'csv' or 'ndjson'. Guessed from the file extension when not given.
+
+    Returns:
+        list: The events as dicts with LOG_COLUMNS, 'at' in seconds since the first event.
+
+    Raises:
+        ValueError: When a line has no 'at' or an action that cannot be replayed.
+    """
+    if file_format is None:
+        extension = os.path.splitext(source)[1].lower()
+        file_format = 'ndjson' if extension in ('.ndjson', '.jsonl', '.json') else 'csv'
+    with open(source, newline='') as f:
+        if file_format == 'ndjson':
+            lines = [json.loads(line) for line in f if line.strip()]
+        else:
+            lines = list(csv.DictReader(f, skipinitialspace=True))
+
+    events = []
+    for number, line in enumerate(lines, start=1):
+        event = {column: line.get(column) for column in LOG_COLUMNS}
+        if event['action'] not in REPLAY_ACTIONS:
+            raise ValueError(f"Line {number}: the action must be one of {REPLAY_ACTIONS}, not '{event['action']}'")
+        if event['at'] in (None, ''):
+            raise ValueError(f"Line {number}: 'at' is missing")
+        event['at'] = _seconds(event['at'])
+        events.append(event)
+    if events:
+        first = events[0]['at']
+        for event in events:
+            event['at'] -= first
+    return events
+
+# ---------------------------------------------------------------------#
+def prepare_store(scratch_dir, seed_dir=None, start_date=START_DATE, storage=None):
+    """
+    Set up a scratch store in 'scratch_dir' (an 'outputs' folder and a time file) and return its config.
+
+    Args:
+        scratch_dir (str): A folder that does not exist yet or is empty.
+        seed_dir (str): An outputs folder to start from (it is copied), otherwise the store starts empty.
+        start_date (str): The application date at the start of the replay.
+        storage (str): 'csv' or 'sqlite' (default: as in the config).
+
+    Raises:
+        ValueError: When 'scratch_dir' is not empty, so a replay never writes into an existing store.
+    """
+    if os.path.isdir(scratch_dir) and os.listdir(scratch_dir):
+        raise ValueError(f"The scratch folder '{scratch_dir}' is not empty")
+    outputs_dir = os.path.join(scratch_dir, 'outputs')
+    if seed_dir:
+        shutil.copytree(seed_dir, outputs_dir, ignore=shutil.ignore_patterns('*.sock', '*.lock'))
+    else:
+        os.makedirs(outputs_dir)
+    config = SuperConfig(outputs_dir=outputs_dir, storage=storage, time_file=os.path.join(scratch_dir, 'time.txt'))
+    with open(config.time_file, 'w') as f:
+        f.write(str(functions.parse_date(start_date)))
+    with open(config.last_run_day_file, 'w') as f:
+        f.write(str(dt.today().date()))
+    return config
+
+# ---------------------------------------------------------------------#
+def run_event(event):
+    """
+    Run one event through the store the command line uses (functions.store).
+
+    Returns:
+        bool: False when the store refused it (a StoreError, like an out of stock sale), True otherwise.
+    """
+    store = functions.store
+    action = event['action']
+    try:
+        if action == 'buy':
+            store.buy(event['name'], int(event['amount']), float(event['price']), event['expire_date'])
+        elif action == 'sell':
+            store.sell(event['name'], int(event['amount']), float(event['price']))
+        elif action == 'time':
+            store.advance_time(int(event['days']))
+        else:
+            store.update_expire_status()
+            store.update_management_report()
+    except StoreError:
+        return False
+    return True
+
+# ---------------------------------------------------------------------#
+def percentiles(latencies):
+    """Return the PERCENTILES (and the maximum) of a list of latencies, in milliseconds."""
+    if not latencies:
+        return {}
+    ordered = sorted(latencies)
+    result = {f"p{p}": round(ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))] * 1000, 3) for p in PERCENTILES}
+    result['max'] = round(ordered[-1] * 1000, 3)
+    return result
+
+# ---------------------------------------------------------------------#
+def state_checksums(storage_backend, current_date):
+    """
+    Return a sha256 of the final inventory and of the management report:
+    the CHECKSUM_COLUMNS of their rows, sorted, with the numbers rounded to cents.
+    """
+    import pandas as pd
+    storage_backend.update_expire_status(current_date)
+    tables = {
+        'inventory': storage_backend.read_table('inventory'),
+        'management_report': storage_backend.update_management_report(),
+    }
+    checksums = {}
+    for name, table in tables.items():
+        columns = CHECKSUM_COLUMNS[name]
+        table = table[columns].assign(**{column: pd.to_datetime(table[column]).dt.strftime('%Y-%m-%d')
+                                          for column in columns if column.endswith('_date')})
+        table = table.sort_values(columns, kind='stable')
+        text = table.to_csv(index=False, float_format='%.2f', lineterminator='\n')
+        checksums[name] = hashlib.sha256(text.encode('utf-8')).hexdigest()
+    return checksums
+
+# ---------------------------------------------------------------------#
+def replay(config, events, speed=None):
+    """
+    Replay 'events' (see read_log) against the store in 'config', one after the other.
+
+    Args:
+        config (SuperConfig): The scratch store (see prepare_store).
+        events (list): The events of the log.
+        speed (float): Run the log this many times faster than it was recorded; at full speed when not given.
+
+    Returns:
+        dict: The number of events and rejected events, the seconds, the events per second,
+              the latency percentiles in ms (of all events and per action), the final date and the checksums.
+    """
+    # the libraries are loaded before the clock starts, like in a till that keeps running ('super.py serve')
+    import pandas
+    previous_config = functions.super_config
+    functions.use_config(config)
+    try:
+        latencies = {action: [] for action in REPLAY_ACTIONS}
+        rejected = 0
+        start = time.perf_counter()
+        for event in events:
+            if speed:
+                # wait until the event is due; an event that is late runs right away
+                delay = start + event['at'] / speed - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            event_start = time.perf_counter()
+            accepted = run_event(event)
+            latencies[event['action']].append(time.perf_counter() - event_start)
+            if not accepted:
+                rejected += 1
+        seconds = time.perf_counter() - start
+
+        current_date = functions.get_current_date()
+        all_latencies = [latency for action_latencies in latencies.values() for latency in action_latencies]
+        return {
+            'storage': config.storage,
+            'events': len(events),
+            'rejected': rejected,
+            'seconds': round(seconds, 3),
+            'events_per_second': round(len(events) / seconds, 1) if seconds else None,
+            'latency_ms': percentiles(all_latencies),
+            'latency_ms_per_action': {action: dict(events=len(action_latencies), **percentiles(action_latencies))
+                                      for action, action_latencies in latencies.items() if action_latencies},
+            'final_date': str(current_date),
+            'checksums': state_checksums(functions.storage_backend, current_date),
+        }
+    finally:
+        functions.use_config(previous_config)
+
+# ---------------------------------------------------------------------#
+def print_results(results):
+    """Print the result of a replay."""
+    print(f"Replayed {results['events']} event(s) in {results['seconds']:.3f} s on the {results['storage']} storage: "
+          f"{results['events_per_second']} events/s, {results['rejected']} rejected")
+    print(f"{'latency (ms)':<14}{'events':>8}" + ''.join(f"{f'p{p}':>10}" for p in PERCENTILES) + f"{'max':>10}")
+    rows = dict(results['latency_ms_per_action'], all=dict(events=results['events'], **results['latency_ms']))
+    for action, latency in rows.items():
+        print(f"{action:<14}{latency['events']:>8}" + ''.join(f"{latency.get(f'p{p}', 0):>10.3f}" for p in PERCENTILES)
+              + f"{latency.get('max', 0):>10.3f}")
+    print(f"Final date: {results['final_date']}")
+    for name, checksum in results['checksums'].items():
+        print(f"{name} checksum: {checksum}")
@@ -0,0 +1,269 @@
+"""
+Running totals for the management report, and the sale allocation ledger.
+
+The management report is kept as aggregates that every journal event
+updates in place, per (buy_name, buy_price): the amount bought, the amount
+expired, and the units sold from the lots of that line with the revenue they
+brought. Every sell event names the lot its units came from, so a sale is
+counted on the line of that lot, at the price it was sold for; the cost of
+the goods sold is the units times the buy price of the line.
+
+Every lot a sale took units from is also written as one line of the
+allocation ledger ('outputs/allocations.csv', ALLOCATION_COLUMNS): the sale,
+the lot, the units, what they cost and what they were sold for. The sales
+totals of a line are the sum of its ledger lines, so margins per lot or per
+sale are one grouped sum over the ledger.
+
+The aggregates are saved together with the position in the journal up to
+which they are complete (and the size of the ledger at that point), so
+bringing them up to date only reads the events that were written since then.
+Of the lots only the buy price is saved (a sale names its lot and product),
+as one array of floats, so loading the totals stays quick with many lots.
+A full rebuild folds the whole journal again.
+
+The journal is streamed in chunks, so folding it never holds more than one
+chunk of it in memory, however long the history is. The chunk size follows
+from the memory ceiling in the config (SuperConfig.report_memory_mb).
+"""
+# ---------------All the IMPORTS:---------------#
+import base64
+import csv
+import json
+from array import array
+import os
+import journal
+import locking
+from allocation import LotAllocator
+# pandas is imported inside the functions that need it, so commands that do not use it start faster
+# -----------------------------------------------#
+
+# the columns of 'management_report.csv': the six of the original file, in the same order, and 'revenue' after them.
+# 'sell_price' is the average price of the sold units (revenue / sell_amount); the original file held the sum
+# of the prices of every sale of the product there (see the README)
+MANAGEMENT_REPORT_COLUMNS = ['buy_name_buy', 'buy_amount_buy', 'buy_price_buy', 'sell_amount', 'sell_price', 'expired_amount',
+                             'revenue']
+ALLOCATION_COLUMNS = ['sale_id', 'sale_date', 'lot_id', 'buy_name', 'units', 'unit_cost', 'unit_price']
+
+# saved totals of another version are folded again from the start
+STATE_VERSION = 2
+
+# a chunk of the journal takes several times its size once it is decoded and split into rows
+CHUNK_MEMORY_FACTOR = 8
+MIN_CHUNK_BYTES = 64 * 1024
+
+COLUMNS = {name: index for index, name in enumerate(journal.JOURNAL_COLUMNS)}
+NAN = float('nan')
+
+
+class ManagementAggregates:
+    def __init__(self):
+        self.lines = {}                 # (buy_name, buy_price) -> [buy_amount, expired_amount, sell_amount, revenue]
+        self.lot_prices = array('d')    # buy price per lot id (NaN for an id that is not a lot), to find the line of a sale
+        self.lots = {}                  # lot_id -> lot dict (buy_amount is what is left), while old sales can follow (see _sell)
+        self.allocator = None           # LotAllocator over 'lots' for the sales without a lot (see _allocate)
+        self.event_id = 0               # last journal event that is in the totals
+        self.offset = 0                 # byte position in the journal right after that event
+        self.ledger_size = 0            # byte size of the allocation ledger with the sales of these events
+
+    # ---------------------------------------------------------------------#
+    def _line(self, buy_name, buy_price):
+        return self.lines.setdefault((buy_name, buy_price), [0, 0, 0, 0.0])
+
+    # ---------------------------------------------------------------------#
+    def _lot_price(self, lot_id):
+        price = self.lot_prices[lot_id] if 0 <= lot_id < len(self.lot_prices) else NAN
+        return None if price != price else price
+
+    # ---------------------------------------------------------------------#
+    def apply(self, row):
+        """
+        Add one journal event (its fields in JOURNAL_COLUMNS order) to the totals.
+
+        Returns:
+            list: The allocation ledger lines of a sale (ALLOCATION_COLUMNS), one per lot.
+        """
+        event_type = row[COLUMNS['event_type']]
+        buy_name, amount, price = row[COLUMNS['buy_name']], int(row[COLUMNS['amount']]), float(row[COLUMNS['price']])
+        if event_type == 'buy':
+            lot_id = int(row[COLUMNS['lot_id']])
+            if lot_id >= len(self.lot_prices):
+                self.lot_prices.extend([NAN] * (lot_id + 1 - len(self.lot_prices)))
+            self.lot_prices[lot_id] = price
+            if self.lots is not None:
+                lot = {'buy_id': lot_id, 'buy_date': row[COLUMNS['event_date']], 'buy_name': buy_name,
+                       'buy_amount': amount, 'buy_price': price, 'expire_date': row[COLUMNS['expire_date']]}
+                self.lots[lot_id] = lot
+                if self.allocator is not None:
+                    self.allocator.add_lot(lot)
+            self._line(buy_name, price)[0] += amount
+        elif event_type == 'sell':
+            return self._sell(row, buy_name, amount, price)
+        elif event_type == 'expire':
+            self._line(buy_name, price)[1] += amount
+        elif event_type == 'unexpire':
+            self._line(buy_name, price)[1] -= amount
+        return []
+
+    # ---------------------------------------------------------------------#
+    def _sell(self, row, buy_name, amount, price):
+        sale_id, sale_date, lot_id = row[COLUMNS['ref_id']], row[COLUMNS['event_date']], row[COLUMNS['lot_id']]
+        if lot_id == '':
+            # a sale carried over from the old 'sold.csv': its units are taken first expired first out
+            allocations = self._allocate(buy_name, amount, sale_date)
+        else:
+            # the sales with a lot come after the old ones, so what is left of every lot is not needed anymore
+            self.lots, self.allocator = None, None
+            lot_price = self._lot_price(int(lot_id))
+            allocations = [(int(lot_id), lot_price, amount)] if lot_price is not None else []
+
+        ledger = []
+        for lot_id, lot_price, units in allocations:
+            line = self._line(buy_name, lot_price)
+            line[2] += units
+            line[3] += units * price
+            ledger.append([sale_id, sale_date, lot_id, buy_name, units, lot_price, price])
+        unallocated = amount - sum(units for _, _, units in allocations)
+        if unallocated:
+            # there was no stock to take them from (or the lot is unknown): in the ledger, without a lot and cost
+            ledger.append([sale_id, sale_date, '', buy_name, unallocated, '', price])
+        return ledger
+
+    # ---------------------------------------------------------------------#
+    def _allocate(self, buy_name, amount, sale_date):
+        if self.lots is None:
+            # saved totals do not keep what is left of every lot; old sales are only at the start of the journal
+            return []
+        if self.allocator is None:
+            # the allocator shares the lot dicts, so both see what is left of a lot
+            self.allocator = LotAllocator()
+            for lot in self.lots.values():
+                self.allocator.add_lot(lot)
+        return [(lot_id, self.lots[lot_id]['buy_price'], units)
+                for lot_id, units, _ in self.allocator.allocate(buy_name, amount, sale_date, partial=True)]
+
+    # ---------------------------------------------------------------------#
+    def to_frame(self):
+        """
+        Return the management report, one line per product and buy price
+        ('sell_price' is the average price the units of the line were sold for).
+        """
+        import pandas as pd
+        rows = []
+        for (buy_name, buy_price), (buy_amount, expired_amount, sell_amount, revenue) in sorted(self.lines.items()):
+            sell_price = revenue / sell_amount if sell_amount else 0.0
+            rows.append((buy_name, buy_amount, buy_price, sell_amount, sell_price, expired_amount, round(revenue, 2)))
+        return pd.DataFrame.from_records(rows, columns=MANAGEMENT_REPORT_COLUMNS)
+
+    # ---------------------------------------------------------------------#
+    def save(self, filename):
+        with locking.atomic_write(filename) as f:
+            json.dump({
+                'version': STATE_VERSION,
+                'event_id': self.event_id,
+                'offset': self.offset,
+                'ledger_size': self.ledger_size,
+                'lines': [[buy_name, buy_price] + totals for (buy_name, buy_price), totals in self.lines.items()],
+                # the buy price of every lot as the bytes of a float array, small and quick to read back
+                'lot_prices': base64.b64encode(self.lot_prices.tobytes()).decode('ascii'),
+            }, f)
+
+    # ---------------------------------------------------------------------#
+    @classmethod
+    def load(cls, filename):
+        """Return the saved aggregates (None when they were saved by another version)."""
+        aggregates = cls()
+        with open(filename) as f:
+            state = json.load(f)
+        if state.get('version') != STATE_VERSION:
+            return None
+        aggregates.event_id = state['event_id']
+        aggregates.offset = state['offset']
+        aggregates.ledger_size = state['ledger_size']
+        aggregates.lines = {(buy_name, buy_price): totals for buy_name, buy_price, *totals in state['lines']}
+        aggregates.lot_prices.frombytes(base64.b64decode(state['lot_prices']))
+        aggregates.lots = None
+        return aggregates
+
+# ---------------------------------------------------------------------#
+def fold_journal(config, rebuild=False):
+    """
+    Bring the saved aggregates and the allocation ledger up to date with the journal and save them again.
+
+    Args:
+        config (SuperConfig): Paths of the store.
+        rebuild (bool): Start from zero and fold the whole journal.
+
+    Returns:
+        ManagementAggregates: The up-to-date totals.
+    """
+    journal.ensure_journal(config)
+    # one fold at a time, they append to the same ledger (transactions do not wait for it)
+    with locking.file_lock(config.allocations_file + '.lock'):
+        aggregates = None
+        if not rebuild and os.path.exists(config.report_state_file):
+            try:
+                aggregates = ManagementAggregates.load(config.report_state_file)
+            except (ValueError, KeyError):
+                # totals that were not saved completely: start over
+                pass
+            # the event the totals end with is not at their offset: the journal was created again, start over
+            if aggregates is not None and journal.event_id_before(config, aggregates.offset) != aggregates.event_id:
+                aggregates = None
+        if aggregates is None:
+            aggregates = ManagementAggregates()
+
+        # the ledger lines after the saved totals (from a fold that did not finish) are written again
+        if os.path.exists(config.allocations_file) and os.path.getsize(config.allocations_file) > aggregates.ledger_size:
+            os.truncate(config.allocations_file, aggregates.ledger_size)
+        chunk_bytes = max(MIN_CHUNK_BYTES, config.report_memory_mb * 1024 * 1024 // CHUNK_MEMORY_FACTOR)
+        with open(config.allocations_file, 'a', newline='') as ledger_file:
+            ledger = csv.writer(ledger_file)
+            if aggregates.ledger_size == 0:
+                ledger.writerow(ALLOCATION_COLUMNS)
+            for row, aggregates.offset in journal.iter_events(config, aggregates.offset, chunk_bytes=chunk_bytes):
+                ledger.writerows(aggregates.apply(row))
+                aggregates.event_id = int(row[COLUMNS['event_id']])
+            aggregates.ledger_size = ledger_file.tell()
+
+        aggregates.save(config.report_state_file)
+    return aggregates
+
+# ---------------------------------------------------------------------#
+def current_aggregates(config):
+    """
+    Return the totals at the end of the journal without writing anything to the store:
+    the saved aggregates (when they fit this journal) plus the events after them, folded
+    in memory. For a report over stores this process does not own (see chain.py).
+
+    Raises:
+        FileNotFoundError: When the store has no journal.
+    """
+    if not os.path.exists(config.journal_file):
+        raise FileNotFoundError(f"No journal in '{config.outputs_dir}' (run any command in that store once)")
+    aggregates = None
+    try:
+        aggregates = ManagementAggregates.load(config.report_state_file)
+    except (OSError, ValueError, KeyError):
+        # no saved totals, or not complete ones
+        pass
+    if aggregates is not None and journal.event_id_before(config, aggregates.offset) != aggregates.event_id:
+        # the journal was created again since
+        aggregates = None
+    if aggregates is None:
+        aggregates = ManagementAggregates()
+    chunk_bytes = max(MIN_CHUNK_BYTES, config.report_memory_mb * 1024 * 1024 // CHUNK_MEMORY_FACTOR)
+    for row, aggregates.offset in journal.iter_events(config, aggregates.offset, chunk_bytes=chunk_bytes):
+        aggregates.apply(row)
+        aggregates.event_id = int(row[COLUMNS['event_id']])
+    return aggregates
+
+# ---------------------------------------------------------------------#
+def read_allocations(config):
+    """
+    Return the allocation ledger as a DataFrame (as far as the management report was brought up to date).
+    """
+    import pandas as pd
+    import frame_cache
+    if not os.path.exists(config.allocations_file):
+        return pd.DataFrame(columns=ALLOCATION_COLUMNS)
+    return frame_cache.read_csv(config.allocations_file, dtype={'sale_date': str, 'buy_name': str, 'lot_id': 'Int64'})
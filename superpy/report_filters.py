@@ -0,0 +1,93 @@
+"""
+Filtering, sorting and paging of the console reports.
+
+The filters of 'report' (--product, --expired/--not-expired, --sort, --top,
+--page) are applied to the report's DataFrame before anything is formatted,
+and the cells are formatted a whole column at a time, so printing a report
+costs the rows that are shown, not the rows that are stored.
+"""
+# ---------------All the IMPORTS:---------------#
+# numpy is imported inside the functions that need it, so super.py can read SORT_KEYS without loading it
+# -----------------------------------------------#
+
+PAGE_SIZE = 50
+
+SORT_KEYS = ['name', 'amount', 'price', 'expire_date', 'revenue', 'profit', 'expired']
+# the other keys sort the largest value first
+ASCENDING_SORT_KEYS = ('name', 'expire_date')
+
+# ---------------------------------------------------------------------#
+def select_rows(data, sort_columns, is_expired=None, product=None, expired=None, sort=None, top=None, page=None,
+                page_size=PAGE_SIZE):
+    """
+    Filter, sort and cut the rows of a report.
+
+    Args:
+        data (DataFrame): All rows of the report.
+        sort_columns (dict): Sort key -> column of 'data', for the keys this report can sort on.
+                             The 'name' key is also the column --product searches.
+        is_expired (Series): Per row whether it counts as expired (for --expired/--not-expired).
+        product (str): Only the rows whose name contains this text (not case sensitive).
+        expired (bool): Only the expired (True) or the not expired (False) rows.
+        sort (str): Sort key, one of SORT_KEYS.
+        top (int): Only the first 'top' rows (after sorting).
+        page (int): Only page 'page' (from 1) of 'page_size' rows.
+
+    Returns:
+        tuple: (the rows to show, a footer line or None when all rows are shown).
+
+    Raises:
+        ValueError: When the report cannot be sorted on 'sort'.
+    """
+    import numpy as np
+    if sort is not None and sort not in sort_columns:
+        raise ValueError(f"This report cannot be sorted by '{sort}'. Choose from: {', '.join(sort_columns)}")
+
+    mask = np.ones(len(data), dtype=bool)
+    if product:
+        mask &= data[sort_columns['name']].astype(str).str.contains(product, case=False, regex=False).to_numpy()
+    if expired is not None and is_expired is not None:
+        mask &= is_expired.to_numpy(dtype=bool) == expired
+    if not mask.all():
+        data = data[mask]
+    matched = len(data)
+
+    if sort is not None:
+        column = sort_columns[sort]
+        ascending = sort in ASCENDING_SORT_KEYS
+        if top is not None and page is None and not ascending:
+            # only the largest 'top' values are needed, not a sort of every row
+            data = data.nlargest(top, column, keep='first')
+        else:
+            data = data.sort_values(column, ascending=ascending, kind='stable')
+    if top is not None:
+        data = data.head(top)
+
+    footer = None
+    if page is not None:
+        pages = max(1, -(-len(data) // page_size))
+        data = data.iloc[(page - 1) * page_size:page * page_size]
+        footer = f"Page {page} of {pages} ({matched} matching rows)"
+    elif top is not None and len(data) < matched:
+        footer = f"Top {len(data)} of {matched} matching rows"
+    elif matched < len(mask):
+        footer = f"{matched} of {len(mask)} rows"
+    return data, footer
+
+# ---------------------------------------------------------------------#
+def format_numbers(values, decimals=2):
+    """Format a numeric column as text with 'decimals' decimals, in one go."""
+    import numpy as np
+    return np.char.mod(f'%.{decimals}f', values.to_numpy(dtype=float))
+
+# ---------------------------------------------------------------------#
+def format_text(values):
+    """Format a column as text, in one go."""
+    return values.astype(str).to_numpy()
+
+# ---------------------------------------------------------------------#
+def markup(style, cells):
+    """Wrap text cells in rich markup: '[style]cell[/style]' (style can be an array, one per cell)."""
+    import numpy as np
+    return np.char.add(np.char.add(np.char.add(np.char.add('[', style), ']'), cells.astype(str)),
+                       np.char.add(np.char.add('[/', style), ']'))
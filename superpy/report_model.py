@@ -0,0 +1,174 @@
+"""
+The rows behind every report, apart from how they are shown.
+
+The management report holds the running totals per (buy_name, buy_price)
+(see report_aggregates). build_model adds what the revenue report, the
+profit report and the PDF show on top of them, a whole column at a time:
+the cost of the goods sold, the cost of the expired units and the profit.
+A report command builds the model once, and every renderer only formats the
+columns it shows.
+
+report_rows selects the rows of any report (inventory, expired, revenue or
+profit) with the filters of 'report'. The renderers are the rich tables and
+the PDF in reporting_logic, and write_rows / write_csv here, which stream
+the rows as JSON, NDJSON or CSV without loading rich at all.
+"""
+# ---------------All the IMPORTS:---------------#
+import io
+import os
+import sys
+import frame_cache
+import profiling
+from report_aggregates import MANAGEMENT_REPORT_COLUMNS
+# pandas is imported inside the functions that need it
+# -----------------------------------------------#
+
+MODEL_COLUMNS = MANAGEMENT_REPORT_COLUMNS + ['cost_of_goods', 'expired_costs', 'profit']
+
+# the columns of every report, with their names in the tables
+REPORT_COLUMNS = {
+    'inventory': ['buy_name', 'buy_amount', 'buy_price', 'expire_date', 'is_expired'],
+    'expired': ['inventory_id', 'buy_date', 'buy_name', 'buy_amount', 'buy_price', 'expire_date'],
+    'revenue': ['buy_name_buy', 'sell_amount', 'sell_price', 'revenue'],
+    'profit': ['buy_name_buy', 'buy_amount_buy', 'buy_price_buy', 'sell_amount', 'sell_price', 'cost_of_goods', 'revenue',
+               'expired_amount', 'expired_costs', 'profit'],
+}
+
+# sort key -> column, for the keys every report can be sorted on (see report_filters.select_rows)
+SORT_COLUMNS = {
+    'inventory': {'name': 'buy_name', 'amount': 'buy_amount', 'price': 'buy_price', 'expire_date': 'expire_date'},
+    'expired': {'name': 'buy_name', 'amount': 'buy_amount', 'price': 'buy_price', 'expire_date': 'expire_date'},
+    'revenue': {'name': 'buy_name_buy', 'amount': 'sell_amount', 'price': 'sell_price', 'revenue': 'revenue',
+                'expired': 'expired_amount'},
+    'profit': {'name': 'buy_name_buy', 'amount': 'buy_amount_buy', 'price': 'buy_price_buy', 'revenue': 'revenue',
+               'profit': 'profit', 'expired': 'expired_amount'},
+}
+
+OUTPUT_FORMATS = ['json', 'ndjson', 'csv']
+
+# rows formatted and written at a time, so the first rows go out while the rest are still formatted
+CHUNK_ROWS = 10000
+
+# ---------------------------------------------------------------------#
+def update_management_report(storage_backend, rebuild=False):
+    """
+    Bring the management report up to date and return it.
+
+    The report is kept as running totals per (buy_name, buy_price) that every buy,
+    sell and expiry updates, so this only adds what happened since the last time.
+
+    Args:
+        storage_backend: The storage of the store (see storage.get_storage).
+        rebuild (bool): Compute the whole report again from the complete history.
+    """
+    with profiling.stage('management_report') as current:
+        management_report = storage_backend.update_management_report(rebuild)
+        current.rows = len(management_report)
+    return management_report
+
+# ---------------------------------------------------------------------#
+def build_model(management_report):
+    """
+    Add the derived columns to the management report (a new DataFrame, the one given is not changed).
+    The sales of a line are the units taken from its lots, so what they cost is
+    exactly the units times the buy price of the line.
+
+    Returns:
+        DataFrame: The management report with MODEL_COLUMNS.
+    """
+    cost_of_goods = management_report['sell_amount'] * management_report['buy_price_buy']
+    expired_costs = management_report['expired_amount'] * management_report['buy_price_buy']
+    return management_report.assign(
+        cost_of_goods=cost_of_goods,
+        expired_costs=expired_costs,
+        profit=management_report['revenue'] - cost_of_goods - expired_costs,
+    )[MODEL_COLUMNS]
+
+# ---------------------------------------------------------------------#
+def load_model(storage_backend):
+    """Build the model from the management report in the storage (as it was last brought up to date)."""
+    return build_model(storage_backend.read_table('management_report'))
+
+# ---------------------------------------------------------------------#
+def expired_lots(storage_backend, current_date):
+    """Return the lots in the inventory whose expire date is before 'current_date' (expire_date as dates)."""
+    import pandas as pd
+    inventory_data = storage_backend.read_table('inventory')
+    expire_dates = pd.to_datetime(inventory_data['expire_date']).dt.date
+    return inventory_data[expire_dates < current_date].assign(expire_date=expire_dates)
+
+# ---------------------------------------------------------------------#
+def report_rows(report_type, storage_backend, current_date=None, filters=None, model=None, as_of=None):
+    """
+    Return the rows of a report, filtered, sorted and paged like the report table.
+
+    Args:
+        report_type (str): 'inventory', 'expired', 'revenue' or 'profit'.
+        storage_backend: The storage of the store (see storage.get_storage).
+        current_date (date): The date the 'expired' report compares the expire dates with.
+        filters (dict): Filter, sort and page options, see report_filters.select_rows.
+        model (DataFrame): The model of the revenue and profit reports, built from the storage when it is not given.
+        as_of (date): The inventory as it was at the end of this day instead of now.
+
+    Returns:
+        tuple: (the rows, with at least the REPORT_COLUMNS of the report, a footer line or None when all rows are shown).
+
+    Raises:
+        ValueError: When the report cannot be sorted as 'filters' asks.
+    """
+    from report_filters import select_rows
+    is_expired = None
+    if report_type == 'inventory':
+        columns = REPORT_COLUMNS['inventory']
+        data = storage_backend.inventory_as_of(as_of)[columns] if as_of else storage_backend.read_table('inventory', columns=columns)
+        is_expired = data['is_expired']
+    elif report_type == 'expired':
+        data = expired_lots(storage_backend, current_date)
+    else:
+        data = model if model is not None else load_model(storage_backend)
+        is_expired = data['expired_amount'] > 0
+    return select_rows(data, SORT_COLUMNS[report_type], is_expired=is_expired, **(filters or {}))
+
+# ---------------------------------------------------------------------#
+def write_rows(rows, output_format, out=None):
+    """
+    Stream rows to 'out' (default: stdout) in a machine-readable format, CHUNK_ROWS at a time:
+    'json' (one array of objects), 'ndjson' (one object per line) or 'csv' (with a header).
+    Numbers are written with at most 2 decimals and dates as year-month-day.
+
+    Returns:
+        bool: False when the reader closed the pipe before all rows were written (like 'report ... | head').
+    """
+    out = out or sys.stdout
+    try:
+        if output_format == 'json':
+            out.write('[')
+        elif output_format == 'csv' and rows.empty:
+            rows.to_csv(out, index=False)
+        for start in range(0, len(rows), CHUNK_ROWS):
+            chunk = rows.iloc[start:start + CHUNK_ROWS]
+            # dates (text, date objects or timestamps) all become year-month-day
+            chunk = chunk.assign(**{column: chunk[column].astype(str) for column in chunk.columns if column.endswith('_date')})
+            if output_format == 'csv':
+                chunk.to_csv(out, index=False, header=start == 0, float_format='%.2f')
+            elif output_format == 'ndjson':
+                out.write(chunk.to_json(orient='records', lines=True, double_precision=2).rstrip('\n') + '\n')
+            else:
+                out.write((',' if start else '') + chunk.to_json(orient='records', double_precision=2)[1:-1])
+        if output_format == 'json':
+            out.write(']\n')
+        out.flush()
+    except BrokenPipeError:
+        # the rest of the output goes nowhere, so flushing it at exit does not fail again
+        try:
+            devnull = os.open(os.devnull, os.O_WRONLY)
+            os.dup2(devnull, out.fileno())
+        except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+            pass
+        return False
+    return True
+
+# ---------------------------------------------------------------------#
+def write_csv(model, report_type, filename):
+    """Write the rows of the model with the columns of report 'report_type' ('revenue' or 'profit') to a CSV file."""
+    frame_cache.write_csv(model, filename, index=False, columns=REPORT_COLUMNS[report_type], float_format='%.2f')
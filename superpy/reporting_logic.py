@@ -3,6 +3,9 @@ from rich.table import Table as rTable
 from rich.console import Console
 from rich.style import Style
 from rich import box
+import os
+import subprocess
+import sys
 import pandas as pd
 import numpy as np
 
@@ -15,11 +18,15 @@ from reportlab.lib.pagesizes import letter, inch
 
 # Import local modules:
 import functions
-from config import SuperConfig
+import frame_cache
+import locking
+import profiling
+import report_model
+from report_filters import select_rows, format_numbers, format_text, markup
 
 # ===============================================================================
 console = Console()
-super_config = SuperConfig()
+# the store is functions.super_config / functions.storage_backend (see functions.use_config)
 # ===============================================================================
 
 #==========================generating reports ======================================
@@ -27,9 +34,9 @@ def inspection_code():
     # INSPECTION CODE -----------------------------
     print(f"-------------START INSPECTION CODE OUTPUT-----------------------")
     # Load and inspect data from CSV files
-    bought_data = pd.read_csv(super_config.bought_file)
-    sold_data = pd.read_csv(super_config.sold_file)
-    inventory_data = pd.read_csv(super_config.inventory_file)
+    bought_data = functions.storage_backend.read_table('bought')
+    sold_data = functions.storage_backend.read_table('sold')
+    inventory_data = functions.storage_backend.read_table('inventory')
 
     # Inspect the data for missing values
     print("Bought Data:")
@@ -46,7 +53,7 @@ def inspection_code():
 
 
 # ----------------------------------------------------------------------------
-def generate_inventory_report():
+def generate_inventory_report(as_of=None, filters=None):
     """
     Generate an inventory report.
     
@@ -54,42 +61,55 @@ def generate_inventory_report():
     and prints a formatted report of the inventory.
     
     The report includes details such as product name, amount, price, and expiration date.
+
+    Args:
+        as_of (date): Show the inventory as it was at the end of this day instead of now.
+        filters (dict): Filter, sort and page options, see report_filters.select_rows.
     """
     
     try:
-        inventory_col_names = ['buy_name', 'buy_amount', 'buy_price', 'expire_date', 'is_expired']
-        inventory_data = functions.read_or_create_csv_file(super_config.inventory_file, inventory_col_names)      
-        table = rTable(title="Inventory Report", style='white', box=box.ROUNDED)
+        title = f"Inventory Report (as of {as_of})" if as_of else "Inventory Report"
+        inventory_data, footer = report_model.report_rows('inventory', functions.storage_backend, filters=filters, as_of=as_of)
+
+        table = rTable(title=title, style='white', box=box.ROUNDED)
         table.add_column("[bold purple]Product Name[/bold purple]")
         table.add_column("[bold dodger_blue3]Amount[/bold dodger_blue3]")
         table.add_column("[bold dark_green]Price[/bold dark_green]")
         table.add_column("[bold dark_orange]Expiration Date[/bold dark_orange]")
         table.add_column("[bold rgb(155,0,0)]Is the product expired?[/bold rgb(155,0,0)]")
 
-        # Add rows to the table
-        for _, row in inventory_data.iterrows():
-            product_name = f"[medium_purple1]{row['buy_name']}[/medium_purple1]"
-            amount = f"[dodger_blue1]{row['buy_amount']}[/dodger_blue1]"
-            price = f"[green]{row['buy_price']}[/green]"
-            expire_date = f"[orange1]{row['expire_date']}[/orange1]"
-            if row['is_expired'] == True:
-                is_expired = f"[yellow1]{row['is_expired']}[/yellow1]"
-            else:
-                is_expired = f"[red1]{row['is_expired']}[/red1]"
-
-            table.add_row(product_name, amount, price, expire_date, is_expired)
+        # Add rows to the table (the cells are formatted a column at a time)
+        rows = zip(
+            markup('medium_purple1', format_text(inventory_data['buy_name'])),
+            markup('dodger_blue1', format_text(inventory_data['buy_amount'])),
+            markup('green', format_text(inventory_data['buy_price'])),
+            markup('orange1', format_text(inventory_data['expire_date'])),
+            markup(np.where(inventory_data['is_expired'] == True, 'yellow1', 'red1'), format_text(inventory_data['is_expired'])),
+        )
+        for row in rows:
+            table.add_row(*row)
 
-        console = Console()
-        console.print(table)
+        with profiling.stage('table_render', rows=len(inventory_data)):
+            console = Console()
+            console.print(table)
+            if footer:
+                console.print(footer)
 
     except Exception as e:
         print("An error occurred while generating the inventory report ---->", e)
 
 
 # -------------------------------------------------------------------------------------
-def generate_revenue_report(management_report_file):
-    # Load data from CSV files
-    mangement_data = pd.read_csv(management_report_file)
+def generate_revenue_report(filters=None, model=None, output_file=None):
+    """
+    Print the revenue report.
+
+    Args:
+        filters (dict): Filter, sort and page options, see report_filters.select_rows.
+        model (DataFrame): The report model (see report_model.build_model), built from the storage when it is not given.
+        output_file (str): Also write the rows of the report to this CSV file.
+    """
+    mangement_data, footer = report_model.report_rows('revenue', functions.storage_backend, filters=filters, model=model)
     
     table = rTable(title="Revenue Report", style='blue', box=box.ROUNDED)
     table.add_column("[bold purple]Product Name[/bold purple]", justify="left", style="bold", no_wrap=True)
@@ -97,20 +117,32 @@ def generate_revenue_report(management_report_file):
     table.add_column("Sold Price", justify="center", style="bold", no_wrap=True)
     table.add_column("Revenue", justify="center", style="bold", no_wrap=True)
     
-    for _, row in mangement_data.iterrows():
-        
-        revenue =  row['sell_price'] * row['sell_amount']
-        table.add_row(
-            row['buy_name_buy'],
-            f"{row['sell_amount']:.2f}",
-            f"{row['sell_price']:.2f}",
-            f"{revenue:.2f}",
-        )
-    console.print(table) 
+    rows = zip(
+        format_text(mangement_data['buy_name_buy']),
+        format_numbers(mangement_data['sell_amount']),
+        format_numbers(mangement_data['sell_price']),
+        format_numbers(mangement_data['revenue']),
+    )
+    for row in rows:
+        table.add_row(*row)
+    with profiling.stage('table_render', rows=len(mangement_data)):
+        console.print(table)
+        if footer:
+            console.print(footer)
+    if output_file:
+        report_model.write_csv(mangement_data, 'revenue', output_file)
+        print(f"Revenue report written to: {output_file}")
 #-------------------------------------------------------------------------------------
-def generate_profit_report(management_report_file):
-    # Load data from CSV files
-    mangement_data = pd.read_csv(management_report_file)   
+def generate_profit_report(filters=None, model=None, output_file=None):
+    """
+    Print the profit report: per line the revenue minus the cost of the goods sold and of the expired units.
+
+    Args:
+        filters (dict): Filter, sort and page options, see report_filters.select_rows.
+        model (DataFrame): The report model (see report_model.build_model), built from the storage when it is not given.
+        output_file (str): Also write the rows of the report to this CSV file.
+    """
+    mangement_data, footer = report_model.report_rows('profit', functions.storage_backend, filters=filters, model=model)
     
     table = rTable(title="Profit Report", style='blue', box=box.ROUNDED)
     table.add_column("[bold purple]Product Name[/bold purple]", justify="left", style="bold", no_wrap=True)
@@ -118,79 +150,78 @@ def generate_profit_report(management_report_file):
     table.add_column("Buy Price", justify="center", style="bold", no_wrap=True)
     table.add_column("Sold Amount", justify="center", style="bold", no_wrap=True)
     table.add_column("Sold Price", justify="center", style="bold", no_wrap=True)
-    table.add_column("Total Purchasing Costs", justify="center", style="bold", no_wrap=True)
+    table.add_column("Cost of Goods Sold", justify="center", style="bold", no_wrap=True)
     table.add_column("Revenue", justify="center", style="bold", no_wrap=True)
     table.add_column("Expired Amount", justify="center", style="bold", no_wrap=True)
     table.add_column("Total Expired Costs", justify="center", style="bold", no_wrap=True)
     table.add_column("[bold]Profit/Loss[/bold]", justify="center", style="bold", no_wrap=True)
 
-    for _, row in mangement_data.iterrows():   
-        profit = 0
-        revenue =  row['sell_price'] * row['sell_amount']
-        total_purchase_costs = row['buy_amount_buy'] * row['buy_price_buy']
-        total_expired_costs = row['expired_amount'] * row['buy_price_buy']
-        profit = revenue - total_purchase_costs - total_expired_costs      
-        
-        if profit == 0:
-                profit_cell_color = 'blue'
-        else:
-                profit_cell_color = 'red' if profit < 0 else 'green'
-                                
-        table.add_row(
-            row['buy_name_buy'],
-            f"{int(row['buy_amount_buy'])}",
-            f"{row['buy_price_buy']:.2f}",
-            f"{row['sell_amount']:.2f}",
-            f"{row['sell_price']:.2f}",
-            f"{total_purchase_costs:.2f}",
-            f"{revenue:.2f}",
-            f"{row['expired_amount']}",
-            f"{total_expired_costs:.2f}",
-            f"[{profit_cell_color}]{profit:.2f}"
-        )
-    console.print(table)     
+    profit = mangement_data['profit']
+    profit_cell_colors = np.where(profit == 0, 'blue', np.where(profit < 0, 'red', 'green'))
+    rows = zip(
+        format_text(mangement_data['buy_name_buy']),
+        format_text(mangement_data['buy_amount_buy'].astype(int)),
+        format_numbers(mangement_data['buy_price_buy']),
+        format_numbers(mangement_data['sell_amount']),
+        format_numbers(mangement_data['sell_price']),
+        format_numbers(mangement_data['cost_of_goods']),
+        format_numbers(mangement_data['revenue']),
+        format_text(mangement_data['expired_amount']),
+        format_numbers(mangement_data['expired_costs']),
+        markup(profit_cell_colors, format_numbers(profit)),
+    )
+    for row in rows:
+        table.add_row(*row)
+    with profiling.stage('table_render', rows=len(mangement_data)):
+        console.print(table)
+        if footer:
+            console.print(footer)
+    if output_file:
+        report_model.write_csv(mangement_data, 'profit', output_file)
+        print(f"Profit report written to: {output_file}")
 # ---------------------------------------------------------------------#
-def get_profit_color(profit_val, row_nr):       
-        if profit_val == 0:
-            return ('TEXTCOLOR', (-1, row_nr), (-1, -1), colors.blue),
-        elif profit_val < 0:
-            return ('TEXTCOLOR', (-1, row_nr), (-1, -1), colors.red),
-        else:
-            return ('TEXTCOLOR', (-1, row_nr), (-1, -1), colors.green),
+def profit_color_styles(profit, first_row=1):
+    """
+    Return the ReportLab TEXTCOLOR commands that color the profit column (the last one):
+    blue for zero, red for a loss, green for a profit (in cents, as it is printed).
+    Consecutive rows with the same color share one command, so a long table does not
+    get a command per row.
+    """
+    color_codes = np.sign(profit.to_numpy(dtype=float).round(2)).astype(int)
+    # the rows where a run of one color starts
+    starts = np.flatnonzero(np.diff(color_codes, prepend=color_codes[:1] - 1))
+    ends = np.append(starts[1:], len(color_codes)) - 1
+    row_colors = {0: colors.blue, -1: colors.red, 1: colors.green}
+    return [('TEXTCOLOR', (-1, first_row + start), (-1, first_row + end), row_colors[color_codes[start]])
+            for start, end in zip(starts, ends)]
 # ---------------------------------------------------------------------#
-def generate_pdf_report():
-    data = pd.read_csv(super_config.management_report_file)
-
-    new_data = [["Product Name", "Buy Amount", "Buy Price", "Total Buy Costs", "Sell Amount", "Sell Price", "Revenue", "Expired Amount", "Profit"]]
-
-    for _, row in data.iterrows():
-        profit = 0
-        revenue =  row['sell_price'] * row['sell_amount']
-        total_purchase_costs = row['buy_amount_buy'] * row['buy_price_buy']
-        total_expired_costs = row['expired_amount'] * row['buy_price_buy']
-        profit = revenue - total_purchase_costs - total_expired_costs     
-
-        new_data.append([
-            row['buy_name_buy'],
-            f"{int(row['buy_amount_buy'])}",
-            f"{row['buy_price_buy']:.2f}",
-            f"{total_purchase_costs:.2f}",
-            f"{row['sell_amount']:.2f}",
-            f"{row['sell_price']:.2f}",
-            f"{revenue:.2f}",
-            f"{row['expired_amount']}",
-            f"{profit:.2f}"
-        ])
-
-    # Convert the list to a DataFrame
-    new_data_df = pd.DataFrame(new_data[1:], columns=new_data[0])
+def generate_pdf_report(model=None):
+    """
+    Render the PDF management report ('outputs/PDF_reports/management_report.pdf').
 
-    # Set up PDF document
-    extension = '.pdf'
-    file_path = f"outputs/PDF_reports/management_report{extension}"
+    Args:
+        model (DataFrame): The report model (see report_model.build_model), built from the storage when it is not given.
+    """
+    if model is None:
+        model = report_model.load_model(functions.storage_backend)
+
+    header = ["Product Name", "Buy Amount", "Buy Price", "Cost of Goods Sold", "Sell Amount", "Sell Price", "Revenue", "Expired Amount", "Profit"]
+    # the cells are formatted a column at a time
+    cells = np.column_stack([
+        format_text(model['buy_name_buy']),
+        format_text(model['buy_amount_buy'].astype(int)),
+        format_numbers(model['buy_price_buy']),
+        format_numbers(model['cost_of_goods']),
+        format_numbers(model['sell_amount']),
+        format_numbers(model['sell_price']),
+        format_numbers(model['revenue']),
+        format_text(model['expired_amount']),
+        format_numbers(model['profit']),
+    ]) if len(model) else np.empty((0, len(header)), dtype=str)
 
-    # Create the SimpleDocTemplate with the frame
-    doc = SimpleDocTemplate(file_path, pagesize=landscape(A4))
+    # Set up PDF document
+    os.makedirs(functions.super_config.pdf_reports_dir, exist_ok=True)
+    file_path = functions.super_config.pdf_report_file
 
     # Create a list to hold the content of the PDF
     content = []
@@ -225,7 +256,7 @@ def generate_pdf_report():
     content.append(Paragraph(text_to_write, text_to_write_style))
 
     # Create a ReportLab table
-    pdf_table = Table([list(new_data_df.columns)] + new_data_df.values.tolist())
+    pdf_table = Table([header] + cells.tolist())
                    
     # Apply styles to the table
     style = [
@@ -240,12 +271,8 @@ def generate_pdf_report():
         ('TEXTCOLOR', (-1, 1), (-1, -1), colors.purple),  # Text color for data rows
     ]
     
-    # Define styles for each row based on the 'Profit' column
-    extra_style = []
-    for k, profit_val in new_data_df['Profit'].items():   
-        extra_style.append(get_profit_color(float(profit_val), k+1))
-    
-    style.extend(list(i[0] for i in extra_style))
+    # Color the 'Profit' column by the sign of the profit
+    style.extend(profit_color_styles(model['profit']))
 
     # Apply the modified style to the table
     pdf_table.setStyle(style)  
@@ -253,61 +280,116 @@ def generate_pdf_report():
     # Add the table to the content
     content.append(pdf_table)
 
-    # Build the PDF document
-    doc.build(content)
+    # Build the PDF document next to it and move it in place, so nobody opens a half-written PDF
+    with locking.atomic_write(file_path, 'wb') as f:
+        doc = SimpleDocTemplate(f, pagesize=landscape(A4))
+        doc.build(content)
 # -------------------------------------------------------------------------------------
 
-def update_management_report():
-    # Read data from the CSV files
-    bought_df = pd.read_csv(super_config.bought_file)
-    inventory_df = pd.read_csv(super_config.inventory_file)
-    sold_df = pd.read_csv(super_config.sold_file)
-
-    # Merge bought_df and inventory_df on 'buy_id'
-    bought_and_inventory = pd.merge(
-        bought_df, inventory_df,
-        left_on=['buy_id'],
-        right_on=['buy_id'],
-        how='left', suffixes=('_buy', '_inventory')
-    )
-
-    # Create a DataFrame for 'expired_amount' based on 'is_expired' column
-    expired_amount_df = bought_and_inventory[bought_and_inventory['is_expired'].fillna(False)].groupby(['buy_name_buy', 'buy_price_buy']).agg({'buy_amount_buy': 'sum'}).reset_index()
-    expired_amount_df.rename(columns={'buy_amount_buy': 'expired_amount'}, inplace=True)
+def generate_chain_report(store_dirs, jobs=None, by_store=False, output_file=None, filters=None):
+    """
+    Print the chain-wide management report of several stores: the totals per product
+    of all stores together, and the totals of every store (see chain.chain_report).
+
+    Args:
+        store_dirs (list): The outputs folders of the stores.
+        jobs (int): Number of worker processes (default: one per CPU).
+        by_store (bool): Also print every product of every store.
+        output_file (str): Also write the totals per store and product to this CSV file.
+        filters (dict): Filter, sort and page options for the product lines, see report_filters.select_rows.
+    """
+    import chain
+    per_product, per_store, partials, errors = chain.chain_report(store_dirs, jobs)
+    for store_dir, error in errors.items():
+        print(f"Store '{store_dir}' was left out ---->", error)
+
+    sort_columns = {'name': 'product', 'amount': 'sell_amount', 'revenue': 'revenue', 'profit': 'profit', 'expired': 'expired_amount'}
+    filters = filters or {}
+    tables = [(f"Chain Report ({len(per_store)} stores)", None, per_product)]
+    if by_store:
+        tables.append(("Chain Report per Store and Product", 'store', partials))
+    for title, first_column, data in tables:
+        data, footer = select_rows(data, sort_columns, is_expired=data['expired_amount'] > 0, **filters)
+        _print_chain_table(title, first_column, data, footer)
+    _print_chain_table("Stores", 'store', per_store, None, name_column=None)
+
+    if output_file:
+        frame_cache.write_csv(partials, output_file, index=False)
+        print(f"Totals per store and product written to: {output_file}")
 
-    # Create a DataFrame for 'buy_amount_buy'
-    buy_amount_df = bought_and_inventory.groupby(['buy_name_buy', 'buy_price_buy']).agg({'buy_amount_buy': 'sum'}).reset_index()
+# ---------------------------------------------------------------------#
+def _print_chain_table(title, first_column, data, footer, name_column='product'):
+    table = rTable(title=title, style='blue', box=box.ROUNDED)
+    columns = [column for column in (first_column, name_column) if column]
+    for column in columns:
+        table.add_column(f"[bold purple]{column.capitalize()}[/bold purple]", justify="left", style="bold", no_wrap=True)
+    for heading in ("Buy Amount", "Sold Amount", "Revenue", "Cost of Goods Sold", "Expired Amount", "Expired Costs"):
+        table.add_column(heading, justify="center", style="bold", no_wrap=True)
+    table.add_column("[bold]Profit/Loss[/bold]", justify="center", style="bold", no_wrap=True)
 
-    # Create a DataFrame for 'sell_amount' and 'sell_price'
-    sell_df = sold_df.groupby(['buy_name']).agg({'sell_amount': 'sum', 'sell_price': 'sum'}).reset_index()
+    profit = data['profit']
+    rows = zip(
+        *[format_text(data[column]) for column in columns],
+        format_text(data['buy_amount'].astype(int)),
+        format_text(data['sell_amount'].astype(int)),
+        format_numbers(data['revenue']),
+        format_numbers(data['cost_of_goods']),
+        format_text(data['expired_amount'].astype(int)),
+        format_numbers(data['expired_costs']),
+        markup(np.where(profit == 0, 'blue', np.where(profit < 0, 'red', 'green')), format_numbers(profit)),
+    )
+    for row in rows:
+        table.add_row(*row)
+    with profiling.stage('table_render', rows=len(data)):
+        console.print(table)
+        if footer:
+            console.print(footer)
+# -------------------------------------------------------------------------------------
 
-    # Merge the DataFrames
-    profit_report = pd.merge(buy_amount_df, sell_df, left_on=['buy_name_buy'], right_on=['buy_name'], how='left')
-    profit_report = pd.merge(profit_report, expired_amount_df, on=['buy_name_buy', 'buy_price_buy'], how='left')
+def update_pdf_report(force=False, background=False, model=None):
+    """
+    Render the PDF management report only when it is asked for, or when the management
+    report changed since the last render (the hash of its contents is kept next to the PDF).
 
-    # Fill NaN values in 'sell_amount', 'sell_price', and 'expired_amount' columns with 0
-    profit_report['sell_amount'].fillna(0, inplace=True)
-    profit_report['sell_price'].fillna(0, inplace=True)
-    profit_report['expired_amount'].fillna(0, inplace=True)
+    Args:
+        force (bool): Render it even when nothing changed.
+        background (bool): Render it in a separate process, so the console report does not wait for it.
+        model (DataFrame): The report model the command already built (see report_model.build_model).
 
-    # Group by relevant columns and sum 'sell_amount', 'sell_price'
-    group_columns = ['buy_name_buy', 'buy_price_buy']
-    profit_report = profit_report.groupby(group_columns).agg({
-        'buy_amount_buy': 'sum',
-        'sell_amount': 'sum',
-        'sell_price': 'sum',
-        'expired_amount': 'sum',
-    }).reset_index()
+    Returns:
+        str: 'rendered', 'started' (in the background) or 'unchanged'.
+    """
+    config = functions.super_config
+    content_hash = functions.storage_backend.content_hash('management_report')
+    if not force and os.path.exists(config.pdf_report_file) and os.path.exists(config.pdf_hash_file):
+        with open(config.pdf_hash_file) as f:
+            if f.read() == content_hash:
+                return 'unchanged'
+
+    if background:
+        subprocess.Popen([sys.executable, os.path.abspath(__file__), config.outputs_dir, config.storage,
+                          config.time_file, config.table_format],
+                         stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                         start_new_session=True)
+        return 'started'
+
+    with profiling.stage('pdf_build'):
+        generate_pdf_report(model)
+    # only once the PDF is in place, so a hash never stands for a PDF that was not written
+    with locking.atomic_write(config.pdf_hash_file) as f:
+        f.write(content_hash or '')
+    return 'rendered'
+# -------------------------------------------------------------------------------------
 
-    # Save the updated report to a new CSV file
-    profit_report.to_csv(super_config.management_report_file, index=False,
-                         columns=['buy_name_buy', 'buy_amount_buy', 'buy_price_buy', 'sell_amount', 'sell_price', 'expired_amount'])
+def update_management_report(rebuild=False):
+    """Bring the management report of the store up to date and return it (see report_model.update_management_report)."""
+    return report_model.update_management_report(functions.storage_backend, rebuild)
 
 # ----------------------------------------------------------------------------------
 
 def update_expired_items_in_management_report():
     # Load the inventory and sold data
-    inventory_data = pd.read_csv(super_config.inventory_file)
+    inventory_data = frame_cache.read_csv(functions.super_config.inventory_file)
 
     # Identify expired products
     expired_products = inventory_data[inventory_data['is_expired']]
@@ -347,8 +429,16 @@ def update_expired_items_in_management_report():
     report_df = pd.DataFrame(report_data)
 
     # Append the data to the management_report.csv file
-    report_df.to_csv(super_config.management_report_file, mode='a', header=False, index=False)
+    frame_cache.write_csv(report_df, functions.super_config.management_report_file, mode='a', header=False, index=False)
 
     print("Expired items updated in the management report file.")
 # -------------------------------------------------------------------------------------
 
+
+
+# Run directly by update_pdf_report(background=True):
+#   python reporting_logic.py OUTPUTS_DIR STORAGE TIME_FILE TABLE_FORMAT
+if __name__ == "__main__":
+    from config import SuperConfig
+    functions.use_config(SuperConfig(*sys.argv[1:5]))
+    update_pdf_report(force=True)
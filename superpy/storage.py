@@ -0,0 +1,622 @@
+"""
+Storage backends.
+
+Every module reads and writes the store through one of these classes, picked
+with SuperConfig(storage=...):
+
+- CsvStorage: the journal plus the CSV files in 'outputs' (the default).
+- SqliteStorage: one SQLite database with indexed tables for lots, sales
+  and the management report. A buy, a sell or a time advance is a few
+  indexed row updates in one transaction.
+
+Both offer the same tables to the reports: 'bought', 'sold', 'inventory',
+'management_report' and 'allocations', with the same columns as the CSV files,
+and the same product catalog (see catalog.py): the CSV storage keeps it in
+'products.csv', the SQLite storage in its 'products' table. The
+management report is kept as running totals that every transaction
+updates (see report_aggregates); update_management_report(rebuild=True)
+computes it again from scratch.
+"""
+# ---------------All the IMPORTS:---------------#
+import contextlib
+import hashlib
+import os
+import pathlib
+import sqlite3
+import catalog
+import checkpoints
+import expiry_index
+import journal
+import locking
+import profiling
+import report_aggregates
+import table_files
+from allocation import LotAllocator
+from report_aggregates import ALLOCATION_COLUMNS, MANAGEMENT_REPORT_COLUMNS
+# pandas is imported inside the functions that need it, so commands that do not use it start faster
+# -----------------------------------------------#
+
+JOURNAL_NAME = journal.JOURNAL_COLUMNS.index('buy_name')
+
+TABLE_COLUMNS = {
+    'bought': journal.BOUGHT_COLUMNS,
+    'sold': journal.SOLD_COLUMNS,
+    'inventory': journal.INVENTORY_COLUMNS,
+    'management_report': MANAGEMENT_REPORT_COLUMNS,
+    'allocations': ALLOCATION_COLUMNS,
+}
+
+# ---------------------------------------------------------------------#
+def get_storage(config):
+    """
+    Return the storage backend chosen in the config ('csv' or 'sqlite').
+    """
+    if config.storage == 'csv':
+        return CsvStorage(config)
+    if config.storage == 'sqlite':
+        return SqliteStorage(config)
+    raise ValueError(f"Unknown storage backend: '{config.storage}'. Choose 'csv' or 'sqlite'.")
+
+# =====================================================================#
+class CsvStorage:
+    """
+    The journal is the source of truth, the tables are views on it (CSV files, or
+    Parquet/Feather files when the config asks for them, see table_files).
+
+    The lots are kept in memory (a LotAllocator) once they are loaded, as long as
+    this process lives (see 'super.py serve'). The cache is only used while the
+    journal still has the size it had after our own last write; a journal that
+    another process wrote to is replayed again.
+    """
+    def __init__(self, config):
+        self.config = config
+        self.allocator = None
+        self.journal_size = None
+
+    # ---------------------------------------------------------------------#
+    def _journal_size(self):
+        return os.path.getsize(self.config.journal_file) if os.path.exists(self.config.journal_file) else None
+
+    # ---------------------------------------------------------------------#
+    def _allocator_in_sync(self):
+        return self.allocator is not None and self._journal_size() == self.journal_size
+
+    # ---------------------------------------------------------------------#
+    def _allocator_written(self, in_sync):
+        """After our own write: keep the cache if it was up to date before it, drop it otherwise."""
+        if in_sync:
+            self.journal_size = self._journal_size()
+        else:
+            self.allocator = None
+
+    # ---------------------------------------------------------------------#
+    def transaction(self):
+        """
+        Lock the store for a transaction: from reading what it depends on (see load_allocator)
+        up to recording it, no other process writes (see locking.store_lock).
+        """
+        return locking.store_lock(self.config)
+
+    # ---------------------------------------------------------------------#
+    def read_table(self, name, columns=None):
+        if name == 'allocations':
+            # the ledger is written with the management report (see update_management_report)
+            allocations = report_aggregates.read_allocations(self.config)
+            return allocations[columns] if columns else allocations
+        return table_files.read_table(self.config, name, columns)
+
+    # ---------------------------------------------------------------------#
+    def write_table(self, name, df):
+        table_files.write_table(self.config, name, df)
+
+    # ---------------------------------------------------------------------#
+    def content_hash(self, name):
+        """Return a hash of the file of table 'name' (None when there is no file yet)."""
+        path = table_files.table_file(self.config, name)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+
+    # ---------------------------------------------------------------------#
+    def refresh_views(self, current_date):
+        journal.refresh_views(self.config, current_date)
+
+    # ---------------------------------------------------------------------#
+    def inventory_as_of(self, as_of):
+        """Return the inventory at the end of day 'as_of' (see checkpoints.inventory_as_of)."""
+        return checkpoints.inventory_as_of(self.config, as_of)
+
+    # ---------------------------------------------------------------------#
+    def update_management_report(self, rebuild=False):
+        """
+        Fold the journal events written since the last time into the running totals and
+        the allocation ledger, write them to 'management_report.csv' and return them.
+        """
+        management_report = report_aggregates.fold_journal(self.config, rebuild).to_frame()
+        self.write_table('management_report', management_report)
+        return management_report
+
+    # ---------------------------------------------------------------------#
+    def read_management_report(self):
+        """Return the management report up to date with the journal, without writing to the store."""
+        return report_aggregates.current_aggregates(self.config).to_frame()
+
+    # ---------------------------------------------------------------------#
+    def update_expire_status(self, current_date):
+        """
+        Bring the 'is_expired' column of 'inventory.csv' up to date. Every lot with stock
+        that crosses its expire date gets an expire/unexpire event in the journal
+        (see record_expirations), so refreshing the views is enough.
+        """
+        self.refresh_views(current_date)
+
+    # ---------------------------------------------------------------------#
+    def load_catalog(self):
+        """
+        Return the product catalog. A store that has none yet gets it from the products in its journal.
+        """
+        if not os.path.exists(self.config.products_file):
+            journal.ensure_journal(self.config)
+            catalog.add_products(self.config, [row[JOURNAL_NAME] for row, _ in journal.iter_events(self.config)])
+        return catalog.load_catalog(self.config)
+
+    # ---------------------------------------------------------------------#
+    def record_buys(self, buy_date, buys):
+        buys = [(catalog.normalize_name(buy_name), amount, price, expire_date) for buy_name, amount, price, expire_date in buys]
+        expiry_index.ensure_index(self.config)
+        with self.transaction():
+            # a new product gets its id before its first lot is in the journal
+            self.load_catalog()
+            catalog.add_products(self.config, [buy_name for buy_name, _, _, _ in buys])
+            in_sync = self._allocator_in_sync()
+            first_id = journal.record_buys(self.config, buy_date, buys)
+            expiry_index.add_entries(self.config, [(expire_date, buy_id, buy_name, price, amount)
+                                                   for buy_id, (buy_name, amount, price, expire_date) in enumerate(buys, start=first_id)])
+            if in_sync:
+                for buy_id, (buy_name, amount, price, expire_date) in enumerate(buys, start=first_id):
+                    self.allocator.add_lot({
+                        'buy_id': buy_id,
+                        'buy_date': str(buy_date),
+                        'buy_name': buy_name,
+                        'buy_amount': amount,
+                        'buy_price': price,
+                        'expire_date': expire_date,
+                    })
+            self._allocator_written(in_sync)
+        return first_id
+
+    # ---------------------------------------------------------------------#
+    def record_sales(self, sell_date, sales):
+        """
+        Record sales. The allocations must come from the allocator returned by
+        load_allocator, which already took the units from its lots, in the same transaction.
+        """
+        expiry_index.ensure_index(self.config)
+        with self.transaction():
+            in_sync = self._allocator_in_sync()
+            first_id = journal.record_sales(self.config, sell_date, sales)
+            # the buy price of the lot is already in the index, a sale only changes the units
+            expiry_index.add_entries(self.config, [(expire_date, lot_id, buy_name, '', -units)
+                                                   for buy_name, _, allocations in sales
+                                                   for lot_id, units, expire_date in allocations])
+            self._allocator_written(in_sync)
+        return first_id
+
+    # ---------------------------------------------------------------------#
+    def record_expirations(self, old_date, new_date):
+        """
+        Expire the lots that cross their expire date when the clock moves from 'old_date'
+        to 'new_date' (or un-expire them when it moves back). Only the expiry index
+        buckets of the days in between are read.
+
+        Returns:
+            list: The lots that changed, with the units they have left.
+        """
+        old_date, new_date = str(old_date), str(new_date)
+        if new_date == old_date:
+            return []
+        event_type = 'expire' if new_date > old_date else 'unexpire'
+        with self.transaction():
+            lots = expiry_index.lots_expiring(self.config, *sorted([old_date, new_date]))
+            in_sync = self._allocator_in_sync()
+            journal.record_expirations(self.config, event_type, new_date, lots)
+            # the allocator works out what is expired from the sale date, so it stays as it is
+            self._allocator_written(in_sync)
+        return lots
+
+    # ---------------------------------------------------------------------#
+    def load_allocator(self, names=None):
+        """
+        Return a LotAllocator with the current lots. The CSV backend loads the lots
+        checkpoint plus the journal events after it once (see checkpoints.load_lots) and
+        keeps the result, so 'names' (the products that are needed) is not used here.
+        """
+        if not self._allocator_in_sync():
+            self.allocator = checkpoints.load_lots(self.config)[0]
+            self.journal_size = self._journal_size()
+        return self.allocator
+
+    # ---------------------------------------------------------------------#
+    def drop_allocator(self):
+        """
+        Forget the lots in memory, after units were taken from them (see LotAllocator.allocate)
+        for a sale that could not be recorded; the next load_allocator replays them again.
+        """
+        self.allocator = None
+
+# =====================================================================#
+SQLITE_SCHEMA = """
+-- the product catalog (see catalog.py)
+CREATE TABLE IF NOT EXISTS products (
+    product_id INTEGER PRIMARY KEY,
+    name       TEXT    NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS lots (
+    lot_id      INTEGER PRIMARY KEY,
+    buy_date    TEXT    NOT NULL,
+    buy_name    TEXT    NOT NULL,
+    buy_amount  INTEGER NOT NULL,
+    remaining   INTEGER NOT NULL,
+    buy_price   REAL    NOT NULL,
+    expire_date TEXT    NOT NULL,
+    is_expired  INTEGER NOT NULL DEFAULT 0,
+    product_id  INTEGER REFERENCES products (product_id)
+);
+
+CREATE TABLE IF NOT EXISTS sales (
+    sale_row    INTEGER PRIMARY KEY,
+    sell_id     INTEGER NOT NULL,
+    sell_date   TEXT    NOT NULL,
+    buy_name    TEXT    NOT NULL,
+    lot_id      INTEGER,
+    sell_amount INTEGER NOT NULL,
+    sell_price  REAL    NOT NULL,
+    product_id  INTEGER REFERENCES products (product_id)
+);
+
+-- running totals of the management report, updated by every transaction;
+-- the units sold from the lots of a line and their revenue are the sums of its rows in 'sales'
+CREATE TABLE IF NOT EXISTS management_report (
+    buy_name_buy   TEXT    NOT NULL,
+    buy_price_buy  REAL    NOT NULL,
+    buy_amount_buy INTEGER NOT NULL DEFAULT 0,
+    expired_amount INTEGER NOT NULL DEFAULT 0,
+    sell_amount    INTEGER NOT NULL DEFAULT 0,
+    revenue        REAL    NOT NULL DEFAULT 0,
+    PRIMARY KEY (buy_name_buy, buy_price_buy)
+);
+
+CREATE TABLE IF NOT EXISTS counters (
+    name  TEXT    PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+# created after the tables are brought up to date (see SqliteStorage.connect)
+SQLITE_INDEXES = """
+CREATE INDEX IF NOT EXISTS lots_product_id ON lots (product_id, expire_date);
+CREATE INDEX IF NOT EXISTS lots_expire_date ON lots (expire_date);
+CREATE INDEX IF NOT EXISTS lots_is_expired ON lots (is_expired);
+CREATE INDEX IF NOT EXISTS sales_product_id ON sales (product_id);
+CREATE INDEX IF NOT EXISTS sales_sell_date ON sales (sell_date);
+"""
+
+SQLITE_TABLE_QUERIES = {
+    'bought': """
+        SELECT lot_id AS buy_id, buy_date, buy_name, product_id, buy_amount, buy_price, expire_date
+        FROM lots ORDER BY lot_id""",
+    'inventory': """
+        SELECT lot_id AS inventory_id, lot_id AS buy_id, buy_date, buy_name, product_id, remaining AS buy_amount,
+               buy_price, expire_date, is_expired
+        FROM lots WHERE remaining > 0 ORDER BY lot_id""",
+    # one line per sale, like 'sold.csv' (a row of 'sales' is the part of a sale taken from one lot)
+    'sold': """
+        SELECT sell_id, MIN(sell_date) AS sell_date, MIN(buy_name) AS buy_name, MIN(product_id) AS product_id,
+               SUM(sell_amount) AS sell_amount, MIN(sell_price) AS sell_price
+        FROM sales GROUP BY sell_id ORDER BY MIN(sale_row)""",
+    'management_report': """
+        SELECT buy_name_buy, buy_amount_buy, buy_price_buy, sell_amount,
+               CASE WHEN sell_amount > 0 THEN revenue / sell_amount ELSE 0.0 END AS sell_price,
+               expired_amount, ROUND(revenue, 2) AS revenue
+        FROM management_report ORDER BY buy_name_buy, buy_price_buy""",
+    'allocations': """
+        SELECT sales.sell_id AS sale_id, sales.sell_date AS sale_date, sales.lot_id, sales.buy_name,
+               sales.sell_amount AS units, lots.buy_price AS unit_cost, sales.sell_price AS unit_price
+        FROM sales LEFT JOIN lots USING (lot_id) ORDER BY sales.sale_row""",
+}
+
+
+class SqliteStorage:
+    """
+    Lots, sales and the management report in indexed SQLite tables that are updated in place.
+    """
+    def __init__(self, config):
+        self.config = config
+        self.connection = None
+        self.catalog = None
+
+    # ---------------------------------------------------------------------#
+    def connect(self):
+        if self.connection is None:
+            os.makedirs(self.config.outputs_dir, exist_ok=True)
+            self.connection = sqlite3.connect(self.config.database_file)
+            self.connection.executescript(SQLITE_SCHEMA)
+            if 'product_id' not in self._columns('lots'):
+                self._add_product_ids()
+            self.connection.executescript(SQLITE_INDEXES)
+            if 'revenue' not in self._columns('management_report'):
+                # a database of before the sales were counted per lot: add the columns and fill them in
+                with self.connection:
+                    self.connection.execute("ALTER TABLE management_report ADD COLUMN sell_amount INTEGER NOT NULL DEFAULT 0")
+                    self.connection.execute("ALTER TABLE management_report ADD COLUMN revenue REAL NOT NULL DEFAULT 0")
+                self.update_management_report(rebuild=True)
+        return self.connection
+
+    # ---------------------------------------------------------------------#
+    def _columns(self, table):
+        return [row[1] for row in self.connection.execute(f"PRAGMA table_info({table})")]
+
+    # ---------------------------------------------------------------------#
+    def _add_product_ids(self):
+        """A database of before the product catalog: fill the catalog from the lots and sales, and give them the ids."""
+        with self.connection:
+            for table in ('lots', 'sales'):
+                self.connection.execute(f"ALTER TABLE {table} ADD COLUMN product_id INTEGER REFERENCES products (product_id)")
+            # in the order the products were first bought, like the catalog of the CSV storage
+            self.connection.execute("INSERT OR IGNORE INTO products (name) "
+                                    "SELECT TRIM(buy_name) FROM lots GROUP BY TRIM(buy_name) ORDER BY MIN(lot_id)")
+            self.connection.execute("INSERT OR IGNORE INTO products (name) SELECT DISTINCT TRIM(buy_name) FROM sales")
+            for table in ('lots', 'sales'):
+                self.connection.execute(f"UPDATE {table} SET product_id = (SELECT product_id FROM products WHERE name = TRIM({table}.buy_name))")
+            self.connection.execute("DROP INDEX IF EXISTS lots_buy_name")
+            self.connection.execute("DROP INDEX IF EXISTS sales_buy_name")
+
+    # ---------------------------------------------------------------------#
+    def load_catalog(self):
+        """Return the product catalog (the 'products' table); only the products added since the last time are read."""
+        if self.catalog is None:
+            self.catalog = catalog.ProductCatalog()
+        for product_id, name in self.connect().execute("SELECT product_id, name FROM products WHERE product_id > ?",
+                                                       (self.catalog.last_id,)):
+            self.catalog.add(product_id, name)
+        return self.catalog
+
+    # ---------------------------------------------------------------------#
+    def transaction(self):
+        """
+        Lock the store for a transaction (see CsvStorage.transaction). SQLite serializes
+        the writes itself, the lock keeps a sale from selling units another process is selling.
+        """
+        return locking.store_lock(self.config)
+
+    # ---------------------------------------------------------------------#
+    def read_table(self, name, columns=None):
+        import pandas as pd
+        with profiling.stage('sql_read') as current:
+            table = pd.read_sql_query(SQLITE_TABLE_QUERIES[name], self.connect())
+            current.rows = len(table)
+        if 'is_expired' in table.columns:
+            table['is_expired'] = table['is_expired'].astype(bool)
+        return table[columns] if columns else table
+
+    # ---------------------------------------------------------------------#
+    def content_hash(self, name):
+        """Return a hash of the rows of table 'name'."""
+        return hashlib.sha256(self.read_table(name).to_csv(index=False).encode('utf-8')).hexdigest()
+
+    # ---------------------------------------------------------------------#
+    def refresh_views(self, current_date):
+        """The tables are updated by every transaction, so there is nothing to rebuild."""
+
+    # ---------------------------------------------------------------------#
+    def inventory_as_of(self, as_of):
+        """
+        Return the inventory at the end of day 'as_of': the lots bought by then, with the
+        units that were sold after it added back to what is left of them now. Sales
+        without a lot (old sales there was no stock for) cannot be added back.
+        """
+        import pandas as pd
+        as_of = str(as_of)
+        inventory_df = pd.read_sql_query(
+            "SELECT lot_id AS inventory_id, lot_id AS buy_id, buy_date, buy_name, "
+            "       remaining + COALESCE(sold_later.units, 0) AS buy_amount, buy_price, expire_date "
+            "FROM lots LEFT JOIN (SELECT lot_id, SUM(sell_amount) AS units FROM sales "
+            "                     WHERE sell_date > ? GROUP BY lot_id) AS sold_later USING (lot_id) "
+            "WHERE buy_date <= ? AND remaining + COALESCE(sold_later.units, 0) > 0 ORDER BY lot_id",
+            self.connect(), params=(as_of, as_of))
+        inventory_df['is_expired'] = inventory_df['expire_date'] < as_of
+        return inventory_df
+
+    # ---------------------------------------------------------------------#
+    def update_management_report(self, rebuild=False):
+        """
+        Return the management report. Its totals are kept up to date by every transaction;
+        with 'rebuild' they are first computed again from the lots and sales tables.
+        """
+        if rebuild:
+            connection = self.connect()
+            with connection:
+                connection.execute("DELETE FROM management_report")
+                connection.execute(
+                    "INSERT INTO management_report (buy_name_buy, buy_price_buy, buy_amount_buy, expired_amount, sell_amount, revenue) "
+                    "SELECT buy_name, buy_price, SUM(buy_amount), SUM(CASE WHEN is_expired = 1 THEN remaining ELSE 0 END), "
+                    "       COALESCE(SUM(sold.units), 0), COALESCE(SUM(sold.revenue), 0) "
+                    "FROM lots LEFT JOIN (SELECT lot_id, SUM(sell_amount) AS units, SUM(sell_amount * sell_price) AS revenue "
+                    "                     FROM sales GROUP BY lot_id) AS sold USING (lot_id) "
+                    "GROUP BY buy_name, buy_price")
+        return self.read_table('management_report')
+
+    # ---------------------------------------------------------------------#
+    def read_management_report(self):
+        """
+        Return the management report (every transaction keeps it up to date). The database is
+        opened read-only, so it is never created or changed (see chain.py).
+        """
+        import pandas as pd
+        if not os.path.exists(self.config.database_file):
+            raise FileNotFoundError(f"No database in '{self.config.outputs_dir}'")
+        uri = pathlib.Path(self.config.database_file).absolute().as_uri() + '?mode=ro'
+        with contextlib.closing(sqlite3.connect(uri, uri=True)) as connection:
+            if 'revenue' not in [row[1] for row in connection.execute("PRAGMA table_info(management_report)")]:
+                raise ValueError(f"The database in '{self.config.outputs_dir}' is of an older version "
+                                 "(run any command in that store once)")
+            return pd.read_sql_query(SQLITE_TABLE_QUERIES['management_report'], connection)
+
+    # ---------------------------------------------------------------------#
+    def update_expire_status(self, current_date):
+        """
+        Flip 'is_expired' only for the lots that crossed their expire date
+        (both ways, the application date can be reset to an earlier day).
+        """
+        current_date = str(current_date)
+        connection = self.connect()
+        with connection:
+            for is_expired, expire_condition, sign in ((0, "expire_date < ?", 1), (1, "expire_date >= ?", -1)):
+                where = f"is_expired = {is_expired} AND {expire_condition}"
+                connection.executemany(
+                    "UPDATE management_report SET expired_amount = expired_amount + ? "
+                    "WHERE buy_name_buy = ? AND buy_price_buy = ?",
+                    [(sign * units, buy_name, buy_price) for buy_name, buy_price, units in connection.execute(
+                        f"SELECT buy_name, buy_price, SUM(remaining) FROM lots WHERE {where} GROUP BY buy_name, buy_price",
+                        (current_date,))])
+                connection.execute(f"UPDATE lots SET is_expired = {1 - is_expired} WHERE {where}", (current_date,))
+
+    # ---------------------------------------------------------------------#
+    def _next_id(self, connection, counter_name, count):
+        row = connection.execute("SELECT value FROM counters WHERE name = ?", (counter_name,)).fetchone()
+        first_id = (row[0] if row else 0) + 1
+        connection.execute("INSERT OR REPLACE INTO counters (name, value) VALUES (?, ?)", (counter_name, first_id + count - 1))
+        return first_id
+
+    # ---------------------------------------------------------------------#
+    def record_buys(self, buy_date, buys):
+        buys = [(catalog.normalize_name(buy_name), amount, price, expire_date) for buy_name, amount, price, expire_date in buys]
+        connection = self.connect()
+        with connection:
+            first_id = self._next_id(connection, 'buy_id', len(buys))
+            # a new product gets the next id
+            connection.executemany("INSERT OR IGNORE INTO products (name) VALUES (?)", [(buy_name,) for buy_name, _, _, _ in buys])
+            connection.executemany(
+                "INSERT INTO lots (lot_id, buy_date, buy_name, product_id, buy_amount, remaining, buy_price, expire_date, is_expired) "
+                "VALUES (?, ?, ?, (SELECT product_id FROM products WHERE name = ?), ?, ?, ?, ?, 0)",
+                [(buy_id, str(buy_date), buy_name, buy_name, int(amount), int(amount), float(price), expire_date)
+                 for buy_id, (buy_name, amount, price, expire_date) in enumerate(buys, start=first_id)])
+            connection.executemany(
+                "INSERT INTO management_report (buy_name_buy, buy_price_buy, buy_amount_buy) VALUES (?, ?, ?) "
+                "ON CONFLICT (buy_name_buy, buy_price_buy) DO UPDATE SET buy_amount_buy = buy_amount_buy + excluded.buy_amount_buy",
+                [(buy_name, float(price), int(amount)) for buy_name, amount, price, _ in buys])
+        return first_id
+
+    # ---------------------------------------------------------------------#
+    def record_sales(self, sell_date, sales):
+        connection = self.connect()
+        with connection:
+            first_id = self._next_id(connection, 'sell_id', len(sales))
+            rows = [(sell_id, str(sell_date), buy_name, int(lot_id), int(units), float(price))
+                    for sell_id, (buy_name, price, allocations) in enumerate(sales, start=first_id)
+                    for lot_id, units, _ in allocations]
+            connection.executemany("UPDATE lots SET remaining = remaining - ? WHERE lot_id = ?",
+                                   [(units, lot_id) for _, _, _, lot_id, units, _ in rows])
+            connection.executemany(
+                "INSERT INTO sales (sell_id, sell_date, buy_name, product_id, lot_id, sell_amount, sell_price) "
+                "VALUES (?, ?, ?, (SELECT product_id FROM lots WHERE lot_id = ?), ?, ?, ?)",
+                [(sell_id, sell_date, buy_name, lot_id, lot_id, units, price) for sell_id, sell_date, buy_name, lot_id, units, price in rows])
+            # the units and revenue go to the report line of the lot they were taken from
+            connection.executemany(
+                "UPDATE management_report SET sell_amount = sell_amount + ?, revenue = revenue + ? "
+                "WHERE (buy_name_buy, buy_price_buy) = (SELECT buy_name, buy_price FROM lots WHERE lot_id = ?)",
+                [(units, units * price, lot_id) for _, _, _, lot_id, units, price in rows])
+        return first_id
+
+    # ---------------------------------------------------------------------#
+    def record_expirations(self, old_date, new_date):
+        """
+        Flip the lots that cross their expire date between 'old_date' and 'new_date'
+        (index lookup on expire_date) and return the ones that still have stock.
+        """
+        old_date, new_date = str(old_date), str(new_date)
+        if new_date == old_date:
+            return []
+        first_date, last_date = sorted([old_date, new_date])
+        lots = [{'buy_id': lot_id, 'buy_name': buy_name, 'buy_amount': remaining, 'buy_price': buy_price, 'expire_date': expire_date}
+                for lot_id, buy_name, remaining, buy_price, expire_date in self.connect().execute(
+                    "SELECT lot_id, buy_name, remaining, buy_price, expire_date FROM lots "
+                    "WHERE expire_date >= ? AND expire_date < ? AND remaining > 0 ORDER BY lot_id",
+                    (first_date, last_date))]
+        self.update_expire_status(new_date)
+        return lots
+
+    # ---------------------------------------------------------------------#
+    def load_allocator(self, names=None):
+        """
+        Return a LotAllocator with the lots that have stock left,
+        only of the products in 'names' when it is given (index lookup on their product ids).
+        """
+        query = "SELECT lot_id, buy_date, buy_name, remaining, buy_price, expire_date FROM lots WHERE remaining > 0"
+        params = []
+        if names is not None:
+            products = self.load_catalog()
+            params = [product_id for product_id in map(products.product_id, names) if product_id is not None]
+            query += f" AND product_id IN ({', '.join('?' * len(params))})"
+        allocator = LotAllocator()
+        for lot_id, buy_date, buy_name, remaining, buy_price, expire_date in self.connect().execute(query + " ORDER BY lot_id", params):
+            allocator.add_lot({
+                'buy_id': lot_id,
+                'buy_date': buy_date,
+                'buy_name': buy_name,
+                'buy_amount': remaining,
+                'buy_price': buy_price,
+                'expire_date': expire_date,
+            })
+        return allocator
+
+    # ---------------------------------------------------------------------#
+    def drop_allocator(self):
+        """Every load_allocator reads the lots from the database, there is nothing in memory to forget."""
+
+# ---------------------------------------------------------------------#
+def migrate_csv_to_sqlite(config, current_date):
+    """
+    One-shot migration of the journal and CSV files in 'outputs' to the SQLite database.
+    The lots (with what is left of them) and the sales are copied, one row per lot a sale
+    took units from (see report_aggregates: the sales of the old 'sold.csv' get their lots
+    first expired first out), and the management report totals are computed from them once.
+
+    Returns:
+        SqliteStorage: The new storage.
+    """
+    sqlite_storage = SqliteStorage(config)
+    connection = sqlite_storage.connect()
+    if connection.execute("SELECT COUNT(*) FROM lots").fetchone()[0] > 0:
+        raise ValueError(f"The database '{config.database_file}' already has data; the migration only runs once.")
+
+    journal.ensure_journal(config)
+    journal_df = journal.read_journal(config)
+    # the products keep their ids
+    products = CsvStorage(config).load_catalog()
+    lots = journal.replay_lots(journal_df)
+    buys = journal_df[journal_df['event_type'] == 'buy']
+    aggregates = report_aggregates.ManagementAggregates()
+    ledger = [line for row, _ in journal.iter_events(config) for line in aggregates.apply(row)]
+
+    with connection:
+        connection.executemany("INSERT INTO products (product_id, name) VALUES (?, ?)", sorted(products.names.items()))
+        connection.executemany(
+            "INSERT INTO lots (lot_id, buy_date, buy_name, product_id, buy_amount, remaining, buy_price, expire_date, is_expired) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(int(event.lot_id), event.event_date, event.buy_name, products.product_id(event.buy_name), int(event.amount),
+              lots[int(event.lot_id)]['buy_amount'], float(event.price), event.expire_date, int(event.expire_date < str(current_date)))
+             for event in buys.itertuples(index=False)])
+        connection.executemany(
+            "INSERT INTO sales (sell_id, sell_date, buy_name, product_id, lot_id, sell_amount, sell_price) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(int(sale_id), sale_date, buy_name, products.product_id(buy_name), None if lot_id == '' else int(lot_id), int(units),
+              float(unit_price))
+             for sale_id, sale_date, lot_id, buy_name, units, _, unit_price in ledger])
+        counters = journal.load_counters(config)
+        connection.executemany("INSERT OR REPLACE INTO counters (name, value) VALUES (?, ?)",
+                               [('buy_id', counters['buy_id']), ('sell_id', counters['sell_id'])])
+
+    sqlite_storage.update_management_report(rebuild=True)
+    return sqlite_storage
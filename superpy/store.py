@@ -0,0 +1,324 @@
+"""
+In-process API of a SuperPy store.
+
+A Store wraps one SuperConfig (an outputs folder and a time file) and the
+storage backend of it. It keeps what it loaded (the lots, the product
+catalog, the database connection) in memory between calls, so a program
+that imports it, like a point-of-sale service, runs every transaction
+without starting a process. Several stores can be used in one process:
+
+    from store import Store, OutOfStockError
+
+    shop = Store(outputs_dir='shop1/outputs')
+    lot = shop.buy('Tomato 500g', 20, 1.50, '2023-07-20')
+    try:
+        sale = shop.sell('Tomato 500g', 2, 3.85)
+    except OutOfStockError as e:
+        ...
+    profit = shop.report('profit', filters={'sort': 'profit', 'top': 10})
+
+The methods return plain dicts, lists and DataFrames and raise the
+exceptions below (all of them a StoreError) instead of printing. The
+command line (functions.py and super.py) is a thin layer over a Store that
+prints the results and the errors.
+
+Unlike the command line, a Store does not reset its date every day (see
+functions.check_before_reset_date); the date only changes with set_date and
+advance_time.
+"""
+# ---------------------------------------------------------------------#
+# ---------------All the IMPORTS:---------------#
+import os
+from datetime import datetime as dt, timedelta, date
+from config import SuperConfig
+from catalog import normalize_name
+import locking
+import profiling
+import report_model
+import storage
+# pandas is imported inside the functions that need it, so a store that only buys and sells starts faster
+# -----------------------------------------------#
+
+REPORT_TYPES = ['inventory', 'expired', 'revenue', 'profit']
+
+
+class StoreError(Exception):
+    """A transaction or report that the store cannot do (the message says why)."""
+
+
+class InvalidInputError(StoreError, ValueError):
+    """An argument that is not valid: an empty product name, an amount below 1, a negative price, a date that cannot be read."""
+
+
+class ExpiredProductError(StoreError):
+    """A product that is bought already expired, or sold while all its stock is expired."""
+    def __init__(self, message, name, expired_amount=None):
+        super().__init__(message)
+        self.name = name
+        self.expired_amount = expired_amount    # units of it that are expired (for a sale)
+
+
+class OutOfStockError(StoreError):
+    """A sale of a product that has no stock (or that the store never had)."""
+    def __init__(self, message, name, available=0):
+        super().__init__(message)
+        self.name = name
+        self.available = available              # units that are not expired
+
+
+class InsufficientStockError(OutOfStockError):
+    """A sale of more units than there are left (that are not expired)."""
+
+# ---------------------------------------------------------------------#
+def parse_date(date_text):
+    """
+    Return 'date_text' as a date. A year-month-day date is parsed without pandas;
+    any other format is left to pandas.to_datetime, like before.
+    """
+    try:
+        return dt.strptime(str(date_text), '%Y-%m-%d').date()
+    except ValueError:
+        import pandas as pd
+        return pd.to_datetime(date_text).date()
+
+
+class Store:
+    def __init__(self, config=None, outputs_dir='outputs', time_file=None, storage_name=None):
+        """
+        Open a store.
+
+        Args:
+            config (SuperConfig): Paths of the store. When it is not given, one is made from the arguments below.
+            outputs_dir (str): The outputs folder of the store.
+            time_file (str): The file with the date of the store (default: 'time.txt' next to the outputs folder).
+                             It is created with today's date when it does not exist.
+            storage_name (str): 'csv' or 'sqlite' (default: SUPERPY_STORAGE, or 'csv').
+        """
+        if config is None:
+            # absolute paths, so the store does not move when the working directory changes
+            outputs_dir = os.path.abspath(outputs_dir)
+            time_file = os.path.abspath(time_file or os.path.join(os.path.dirname(outputs_dir), 'time.txt'))
+            config = SuperConfig(outputs_dir=outputs_dir, storage=storage_name, time_file=time_file)
+            os.makedirs(outputs_dir, exist_ok=True)
+            if not os.path.exists(config.time_file):
+                self._write_date(config, date.today())
+        self.config = config
+        self.storage = storage.get_storage(config)
+
+    # ---------------------------------------------------------------------#
+    @staticmethod
+    def _write_date(config, new_date):
+        with locking.atomic_write(config.time_file) as f:
+            f.write(str(new_date))
+
+    # ---------------------------------------------------------------------#
+    def _parse_date(self, date_text, what):
+        try:
+            return parse_date(date_text)
+        except (ValueError, TypeError):
+            raise InvalidInputError(f"Invalid {what}: '{date_text}'. Use the format YYYY-MM-DD.") from None
+
+    # ---------------------------------------------------------------------#
+    def _parse_amount(self, amount, name):
+        try:
+            number = int(amount)
+            if isinstance(amount, float) and number != amount:
+                raise ValueError(amount)
+        except (ValueError, TypeError, OverflowError):
+            raise InvalidInputError(f"Invalid amount of '{name}': '{amount}'. Use a whole number.") from None
+        if number <= 0:
+            raise InvalidInputError(f"The amount of '{name}' must be at least 1.")
+        return number
+
+    # ---------------------------------------------------------------------#
+    def _parse_price(self, price, name):
+        try:
+            number = float(price)
+        except (ValueError, TypeError):
+            number = None
+        # 'not >=' also refuses NaN
+        if number is None or not number >= 0 or number == float('inf'):
+            raise InvalidInputError(f"Invalid price of '{name}': '{price}'. Use a number of 0 or more.")
+        return number
+
+    # ---------------------------------------------------------------------#
+    def current_date(self):
+        """Return the date of the store."""
+        with open(self.config.time_file) as f:
+            today = f.readline()
+        return dt.strptime(today, '%Y-%m-%d').date()
+
+    # ---------------------------------------------------------------------#
+    def set_date(self, new_date):
+        """
+        Set the date of the store. Lots that expire on the way (or are not expired anymore,
+        when the date moves back) are recorded in the storage.
+
+        Returns:
+            list: The lots that changed, with the units they have left.
+        """
+        new_date = self._parse_date(new_date, 'date')
+        # the date is read and moved in one transaction, so two tills never both move it from the same day
+        with self.storage.transaction():
+            old_date = self.current_date()
+            self._write_date(self.config, new_date)
+            with profiling.stage('expiry_update') as current:
+                changed_lots = self.storage.record_expirations(old_date, new_date)
+                current.rows = len(changed_lots)
+        return changed_lots
+
+    # ---------------------------------------------------------------------#
+    def advance_time(self, days):
+        """
+        Move the date of the store 'days' days forward (back when it is negative).
+
+        Returns:
+            list: The lots that expired on the way (or are not expired anymore), with the units they have left.
+        """
+        with self.storage.transaction():
+            return self.set_date(self.current_date() + timedelta(int(days)))
+
+    # ---------------------------------------------------------------------#
+    def buy(self, name, amount, price, expire_date):
+        """
+        Buy a product: one new lot is recorded in the storage (one line in the journal
+        or one row in the database), nothing else is rewritten.
+
+        Args:
+            name (str): Name of the product.
+            amount (int): Amount bought.
+            price (float): Price per unit.
+            expire_date (str or date): Expiration date (year-month-day).
+
+        Returns:
+            dict: The lot: lot_id, buy_date, buy_name, buy_amount, buy_price, expire_date.
+
+        Raises:
+            InvalidInputError: For an empty name, an amount that is not a whole number of at least 1, a price
+                               that is not a number of 0 or more, or an expire date that cannot be read.
+            ExpiredProductError: When the expire date is before the date of the store.
+        """
+        name = normalize_name(name)
+        if not name:
+            raise InvalidInputError("The product name cannot be empty.")
+        amount = self._parse_amount(amount, name)
+        price = self._parse_price(price, name)
+        expire_date = self._parse_date(expire_date, 'expire date')
+        buy_date = self.current_date()
+        if expire_date < buy_date:
+            raise ExpiredProductError(f"This Product: '{name}' is already expired and cannot be bought!", name)
+        lot_id = self.storage.record_buys(buy_date, [(name, amount, price, str(expire_date))])
+        return {'lot_id': lot_id, 'buy_date': str(buy_date), 'buy_name': name, 'buy_amount': amount,
+                'buy_price': price, 'expire_date': str(expire_date)}
+
+    # ---------------------------------------------------------------------#
+    def stock(self, name):
+        """Return (units not expired, units expired) of a product on the date of the store."""
+        name = normalize_name(name)
+        if self.storage.load_catalog().product_id(name) is None:
+            return 0, 0
+        return self.storage.load_allocator([name]).stock(name, self.current_date())
+
+    # ---------------------------------------------------------------------#
+    def sell(self, name, amount, price):
+        """
+        Sell a product. The units are taken first expired first out: from the
+        non-expired lot that expires first, then the next one, so one sale can
+        span several lots. The sale is recorded in the storage with the lot each
+        unit came from.
+
+        Args:
+            name (str): Name of the product.
+            amount (int): Amount sold.
+            price (float): Sell price.
+
+        Returns:
+            dict: The sale: sale_id, sell_date, buy_name, sell_amount, sell_price and
+                  'lots', a list of dicts with the lot_id, units and expire_date of every lot it took units from.
+
+        Raises:
+            InvalidInputError: For an amount that is not a whole number of at least 1, or a price that is
+                               not a number of 0 or more.
+            OutOfStockError: When the product has no stock at all.
+            ExpiredProductError: When all the stock of the product is expired.
+            InsufficientStockError: When there are fewer units left than 'amount'.
+        """
+        # the name is looked up once in the product catalog: a product the store never had has no lots to load
+        name = normalize_name(name)
+        amount = self._parse_amount(amount, name)
+        price = self._parse_price(price, name)
+        # the stock is checked and taken in one transaction, so two tills never sell the same units
+        with self.storage.transaction():
+            if self.storage.load_catalog().product_id(name) is None:
+                raise OutOfStockError(f"Product '{name}' is out of stock and cannot be sold.", name)
+            current_date = self.current_date()
+            with profiling.stage('lot_load') as current:
+                allocator = self.storage.load_allocator([name])
+                current.rows = len(allocator.lots)
+            quantity_not_expired, quantity_expired = allocator.stock(name, current_date)
+
+            if quantity_not_expired + quantity_expired <= 0:
+                raise OutOfStockError(f"Product '{name}' is out of stock and cannot be sold.", name)
+            elif quantity_not_expired <= 0:
+                raise ExpiredProductError(f"Product '{name}' is expired and cannot be sold.", name, quantity_expired)
+            elif amount > quantity_not_expired:
+                raise InsufficientStockError(f"Not enough quantity '{name}' left for this sale.", name, quantity_not_expired)
+
+            try:
+                with profiling.stage('allocation', rows=1):
+                    allocations = allocator.allocate(name, amount, current_date)
+                sale_id = self.storage.record_sales(current_date, [(name, price, allocations)])
+            except BaseException:
+                # the lots in memory already lost the units of a sale that was not recorded
+                self.storage.drop_allocator()
+                raise
+        return {'sale_id': sale_id, 'sell_date': str(current_date), 'buy_name': name, 'sell_amount': amount,
+                'sell_price': price,
+                'lots': [{'lot_id': lot_id, 'units': units, 'expire_date': expire_date} for lot_id, units, expire_date in allocations]}
+
+    # ---------------------------------------------------------------------#
+    def update_expire_status(self):
+        """
+        Update the 'is_expired' status of the inventory for the date of the store
+        (the CSV storage first rebuilds the inventory from the journal if there were new transactions).
+        """
+        with profiling.stage('expiry_update'):
+            self.storage.update_expire_status(self.current_date())
+
+    # ---------------------------------------------------------------------#
+    def update_management_report(self, rebuild=False):
+        """Bring the management report up to date and return it (see report_model.update_management_report)."""
+        return report_model.update_management_report(self.storage, rebuild)
+
+    # ---------------------------------------------------------------------#
+    def report(self, report_type, filters=None, as_of=None):
+        """
+        Return the rows of a report, after bringing the store up to date for it.
+
+        Args:
+            report_type (str): 'inventory', 'expired', 'revenue' or 'profit'.
+            filters (dict): Filter, sort and page options, see report_filters.select_rows.
+            as_of (str or date): For 'inventory': the inventory as it was at the end of this day.
+
+        Returns:
+            DataFrame: The rows, with the columns of the report (report_model.REPORT_COLUMNS).
+
+        Raises:
+            InvalidInputError: For an unknown report type, a date that cannot be read, 'as_of' with another report than
+                               'inventory', or filters that do not fit the report.
+        """
+        if report_type not in REPORT_TYPES:
+            raise InvalidInputError(f"Unknown report type: '{report_type}'. Choose from: {', '.join(REPORT_TYPES)}")
+        if as_of is not None:
+            if report_type != 'inventory':
+                raise InvalidInputError(f"as_of only works with the 'inventory' report, not with '{report_type}'.")
+            as_of = self._parse_date(as_of, 'date for as_of')
+        self.update_expire_status()
+        model = None
+        if report_type in ('revenue', 'profit'):
+            model = report_model.build_model(self.update_management_report())
+        try:
+            rows, _ = report_model.report_rows(report_type, self.storage, self.current_date(), filters, model, as_of)
+        except ValueError as e:
+            raise InvalidInputError(str(e)) from None
+        return rows[report_model.REPORT_COLUMNS[report_type]].reset_index(drop=True)
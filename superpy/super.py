@@ -1,8 +1,20 @@
 # Imports
-import argparse, pandas as pd
+import time
+start_time = time.perf_counter()  # for --timings
+import argparse, contextlib, json, os, shutil, sys, tempfile
+import daemon
+import frame_cache
 import functions
+import profiling
 from config import SuperConfig
-import reporting_logic
+import batch
+import report_filters
+import report_model
+import replay
+import storage
+import table_files
+# pandas, rich and reportlab are only loaded by the commands that use them:
+# 'reporting_logic' (tables and PDF) is imported in the report action
 
 # Do not change these lines.
 __winc_id__ = "a2bc36ea784242e4989deb157d527ba0"
@@ -13,24 +25,25 @@ __human_name__ = "superpy"
 
 line = '-'*20 # for underlining some columns 
 
-# Set pandas display options
-pd.set_option('display.width', None)  # Allow unlimited width
-pd.set_option('display.max_columns', None)  # Show all columns
-
 # created 5 backspaces to pull a string back 5 places:
 reverse_tab = '\b\b\b\b\b'
 reverse_tab2 = '\b\b\b\b\b\b\b\b\b\b'
 reverse_tab3 = '\b\b\b\b\b\b\b\b\b\b\b\b\b\b\b'
 
 
-def main():
-    super_config = SuperConfig()
-
+def build_parser():
+    """Return the parser of the command line."""
     parser = argparse.ArgumentParser(
         description="Supermarket Inventory Tool.",
         formatter_class=argparse.RawTextHelpFormatter
     )
 
+    parser.add_argument('--timings', action='store_true', help='Print how long the imports and the command took (to stderr)')
+    parser.add_argument('--profile', action='store_true',
+                        help='Append the time, rows and peak memory of every stage of the command to outputs/metrics.ndjson')
+    parser.add_argument('--profile-dir', type=str, metavar='DIR',
+                        help='Also write the cProfile statistics of the slowest stage to this folder (implies --profile)')
+
     subparsers = parser.add_subparsers(
         dest='action',
         help='Choose which action you want to take: buy/sell/report'
@@ -50,17 +63,90 @@ def main():
     time_parser = subparsers.add_parser('time')
     time_parser.add_argument('advance_time', type=int, help='Advance the current date by a specified number of days')
 
+    for batch_action, columns in (('buy-batch', batch.BUY_BATCH_COLUMNS), ('sell-batch', batch.SELL_BATCH_COLUMNS)):
+        batch_parser = subparsers.add_parser(batch_action)
+        batch_parser.add_argument('source', type=str, help=f"CSV or NDJSON file with the columns {columns}, or '-' for stdin")
+        batch_parser.add_argument('--format', dest='file_format', choices=['csv', 'ndjson'], help='File format (default: guessed from the file extension, csv for stdin)')
+        batch_parser.add_argument('--rejects', type=str, help='File to write the rejected lines to')
+
+    subparsers.add_parser('serve', help='Keep the store in memory and run the commands sent to outputs/superpy.sock')
+
+    migrate_parser = subparsers.add_parser('migrate')
+    migrate_parser.add_argument('target', choices=['sqlite', 'parquet', 'feather'],
+                                help="Copy the CSV store in 'outputs' to the SQLite backend (one-shot),\nor write its CSV tables again as Parquet or Feather files")
+
+    replay_parser = subparsers.add_parser('replay', help='Replay a transaction log against a scratch store and measure the throughput')
+    replay_parser.add_argument('log_file', metavar='LOGFILE', help=f"CSV or NDJSON file with the columns {replay.LOG_COLUMNS}")
+    replay_parser.add_argument('--format', dest='file_format', choices=['csv', 'ndjson'], help='File format (default: guessed from the file extension)')
+    replay_parser.add_argument('--speed', type=float, metavar='FACTOR', help='Run the log this many times faster than it was recorded (default: full speed)')
+    replay_parser.add_argument('--scratch', type=str, metavar='DIR', help='Empty folder for the scratch store (default: a temporary folder that is removed afterwards)')
+    replay_parser.add_argument('--seed-store', type=str, metavar='DIR', help='Outputs folder to copy as the store the replay starts from (default: an empty store)')
+    replay_parser.add_argument('--start-date', type=str, default=replay.START_DATE, help=f'Application date at the start (default: {replay.START_DATE})')
+    replay_parser.add_argument('--storage', choices=['csv', 'sqlite'], help='Storage backend of the scratch store (default: as configured)')
+    replay_parser.add_argument('--output', type=str, metavar='FILE', help='Also write the results as JSON to this file')
+
+    chain_parser = subparsers.add_parser('chain', help='Management and profit report over several stores')
+    chain_parser.add_argument('stores', nargs='*', metavar='STORE_DIR', help="Outputs folders of the stores")
+    chain_parser.add_argument('--root', type=str, help="Folder with one sub folder per store (or per store an 'outputs' folder in it)")
+    chain_parser.add_argument('--jobs', type=int, help='Number of stores that are read at the same time (default: one per CPU)')
+    chain_parser.add_argument('--by-store', action='store_true', help='Also show every product of every store')
+    chain_parser.add_argument('--output', type=str, help='Write the totals per store and product to this CSV file')
+    chain_parser.add_argument('--product', type=str, help='Only the products whose name contains this text')
+    chain_parser.add_argument('--sort', choices=['name', 'amount', 'revenue', 'profit', 'expired'], help='Sort the products (numbers largest first)')
+    chain_parser.add_argument('--top', type=int, metavar='N', help='Only the first N products')
+
     report_parser = subparsers.add_parser('report')
     report_parser.add_argument('report_type', choices=['inventory', 'revenue', 'profit', 'expired'], metavar='report_type',
                                type=str, help="Choose what kind of report you want ['inventory', 'revenue', 'profit', or 'expired']")
+    report_parser.add_argument('--rebuild', action='store_true', help='Compute the management report again from the complete history')
+    report_parser.add_argument('--as-of', type=str, metavar='DATE', help="Show the inventory as it was at the end of this day (only with 'inventory')")
+    report_parser.add_argument('--product', type=str, help='Only the products whose name contains this text')
+    expired_group = report_parser.add_mutually_exclusive_group()
+    expired_group.add_argument('--expired', dest='expired', action='store_true', default=None, help='Only expired lots (products with expired units)')
+    expired_group.add_argument('--not-expired', dest='expired', action='store_false', help='Only lots (products) that are not expired')
+    report_parser.add_argument('--sort', choices=report_filters.SORT_KEYS, help='Sort the rows (numbers largest first)')
+    report_parser.add_argument('--top', type=int, metavar='N', help='Only the first N rows')
+    report_parser.add_argument('--page', type=int, metavar='N', help='Only page N of --page-size rows')
+    report_parser.add_argument('--page-size', type=int, default=report_filters.PAGE_SIZE, help=f'Rows per page (default: {report_filters.PAGE_SIZE})')
+    report_parser.add_argument('--pdf', action='store_true', help='Render the PDF management report, even when the data did not change')
+    report_parser.add_argument('--pdf-background', action='store_true', help='Render the PDF management report (when needed) in a background process')
+    report_parser.add_argument('--output', type=str, metavar='FILE', help="Also write the rows of the 'revenue' or 'profit' report to this CSV file")
+    report_parser.add_argument('--format', choices=report_model.OUTPUT_FORMATS,
+                               help='Stream the rows to stdout as JSON, NDJSON or CSV instead of printing a table (messages go to stderr)')
+    report_parser.add_argument('--memory-mb', type=int, help='Memory ceiling (MB) for reading the history into the management report (default: 64)')
+    return parser
+
 
-    args = parser.parse_args()
+# ---------------------------------------------------------------------#
+def command_action(argv):
+    """
+    Return the action of the command line 'argv', after the options that can come before it
+    (None when it cannot be parsed; running it then prints why).
+    """
+    try:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+            return build_parser().parse_known_args(argv)[0].action
+    except SystemExit:
+        return None
+
+
+def main(argv=None):
+    super_config = SuperConfig()
+    args = build_parser().parse_args(argv)
+
+    profile_dir = args.profile_dir or functions.super_config.profile_dir
+    if (args.profile or profile_dir or functions.super_config.profile) and args.action != 'serve':
+        # every command the server runs is profiled on its own
+        command = ' '.join(str(part) for part in (args.action, getattr(args, 'report_type', None) or getattr(args, 'target', None)) if part)
+        profiling.start(functions.super_config, command, sys.argv[1:] if argv is None else argv, profile_dir)
 
     if args.action == 'time' and args.advance_time:
         print(f"Current date in the application is --> {functions.get_current_date()}")
-        functions.advance_time(int(args.advance_time))
+        expired_lots = functions.advance_time(int(args.advance_time))
         print(f"Now the date in time.txt file is --> {functions.get_current_date()}")
-        functions.update_inventory_expire_status()
+        if expired_lots:
+            action = 'expired' if int(args.advance_time) > 0 else 'not expired anymore'
+            print(f"{len(expired_lots)} lot(s) {action} ({sum(lot['buy_amount'] for lot in expired_lots)} units).")
 
     elif args.action == 'buy':
         product_name = args.buy_name
@@ -68,11 +154,8 @@ def main():
         price = args.buy_price
         expire_date = args.expire_date
 
-        if functions.validate_expire_date_before_buying(expire_date):
-            functions.buy_product(product_name, amount, price, expire_date)
-
-        else:
-            print(f"Error: This Product: '{product_name}' is already expired and cannot be bought!")
+        # a product that is already expired is refused by Store.buy
+        functions.buy_product(product_name, amount, price, expire_date)
 
     elif args.action == 'sell':
         product_name = args.buy_name
@@ -80,40 +163,252 @@ def main():
         price = args.sell_price
         functions.sell_action(product_name, amount, price)
 
+    elif args.action in ('buy-batch', 'sell-batch'):
+        batch_function = batch.buy_batch if args.action == 'buy-batch' else batch.sell_batch
+        try:
+            accepted, rejected = batch_function(functions.storage_backend, args.source, functions.get_current_date(),
+                                                args.file_format, args.rejects)
+            print(f"{accepted} line(s) processed, {rejected} line(s) rejected.")
+        except (OSError, ValueError) as e:
+            print(f"Error: The batch could not be read ---> {e}")
+        # write the views once for the whole batch
+        functions.storage_backend.refresh_views(functions.get_current_date())
 
-    elif args.action == 'report':
+    elif args.action == 'replay':
         try:
-            functions.update_inventory_expire_status()
-        except Exception as e:
-            print(f"Something went wrong when running this function: update_inventory_expire_status().\nError given: {e}")
+            events = replay.read_log(args.log_file, args.file_format)
+        except (OSError, ValueError) as e:
+            print(f"Error: The replay log could not be read ---> {e}")
+            return args
+        scratch_dir = args.scratch or tempfile.mkdtemp(prefix='superpy-replay-')
         try:
-            reporting_logic.update_management_report()
-        except Exception as e:
-            print(f"Something went wrong when running this function: update_management_report().\nError given: {e}")
+            config = replay.prepare_store(scratch_dir, args.seed_store, args.start_date, args.storage)
+            results = replay.replay(config, events, args.speed)
+        except (OSError, ValueError) as e:
+            print(f"Error: {e}")
+            return args
+        finally:
+            if not args.scratch:
+                shutil.rmtree(scratch_dir, ignore_errors=True)
+        replay.print_results(results)
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(results, f, indent=2)
+            print(f"Results written to: {args.output}")
+
+    elif args.action == 'serve':
+        try:
+            daemon.serve(super_config, run, command_action)
+        except RuntimeError as e:
+            print(f"Error: {e}")
+
+    elif args.action == 'migrate' and args.target == 'sqlite':
         try:
-            reporting_logic.generate_pdf_report()
-        except Exception as e:
-            print(f"Something went wrong when running this function: generate_pdf_report().\nError given: {e}")
+            storage.migrate_csv_to_sqlite(super_config, functions.get_current_date())
+            print(f"Migrated the store to: {super_config.database_file}")
+            print("Set the environment variable SUPERPY_STORAGE=sqlite to use it.")
+        except ValueError as e:
+            print(f"Error: {e}")
+
+    elif args.action == 'migrate':
+        try:
+            # the CSV tables are brought up to date first, so they have every column of the schema
+            # (a management report in the format of an older version is written again)
+            csv_storage = storage.CsvStorage(SuperConfig(table_format='csv'))
+            csv_storage.refresh_views(functions.get_current_date())
+            csv_storage.update_management_report()
+            written = table_files.convert_csv_tables(SuperConfig(table_format=args.target))
+            print(f"Converted to {args.target}: {', '.join(written) or 'no CSV tables found'}")
+            print(f"Set the environment variable SUPERPY_TABLE_FORMAT={args.target} to use them.")
+        except ImportError as e:
+            print(f"Error: {e}")
+
+    elif args.action == 'chain':
+        import reporting_logic
+        import chain
+        store_dirs = list(args.stores) + (chain.find_stores(args.root) if args.root else [])
+        if not store_dirs:
+            print("Error: Give the store folders, or a folder with one per store with --root.")
+        else:
+            reporting_logic.generate_chain_report(store_dirs, args.jobs, args.by_store, args.output,
+                                                  filters={'product': args.product, 'sort': args.sort, 'top': args.top})
+
+    elif args.action == 'report':
+        if args.as_of and args.report_type != 'inventory':
+            # the other reports only know the figures of today, they are not shown under a past date
+            print(f"Error: --as-of only works with 'report inventory', not with '{args.report_type}'.",
+                  file=sys.stderr if args.format else sys.stdout)
+            return args
+        if args.format:
+            # the rows are the only thing on stdout, every message goes to stderr
+            with contextlib.redirect_stdout(sys.stderr):
+                model = prepare_report(args)
+            write_report(args, model)
+            return args
+
+        import pandas as pd
+        import reporting_logic
+        # Set pandas display options
+        pd.set_option('display.width', None)  # Allow unlimited width
+        pd.set_option('display.max_columns', None)  # Show all columns
+        model = prepare_report(args)
+
+        # filters, sorting and paging of the rows (see report_filters.select_rows)
+        filters = report_filters_of(args)
 
         if args.report_type == 'expired':
-            functions.check_expired_products() 
+            functions.check_expired_products(filters) 
         elif args.report_type == 'inventory':
-            reporting_logic.generate_inventory_report() 
+            if args.as_of:
+                try:
+                    as_of = functions.parse_date(args.as_of)
+                except ValueError:
+                    print(f"Invalid date for --as-of: '{args.as_of}'. Use the format YYYY-MM-DD.")
+                else:
+                    reporting_logic.generate_inventory_report(as_of=as_of, filters=filters)
+            else:
+                reporting_logic.generate_inventory_report(filters=filters)
         elif args.report_type == 'revenue':
-            reporting_logic.generate_revenue_report(super_config.management_report_file)
+            try:
+                reporting_logic.generate_revenue_report(filters, model, args.output)
+            except ValueError as e:
+                print(f"Error: {e}")
 
         elif args.report_type == 'profit':
-            reporting_logic.generate_profit_report(super_config.management_report_file)
-            pass
+            try:
+                reporting_logic.generate_profit_report(filters, model, args.output)
+            except ValueError as e:
+                print(f"Error: {e}")
     
         else:
             print("Invalid report type. Please choose 'inventory', 'revenue', 'profit', or 'expired.'")
-            
-    reporting_logic.update_management_report()
-    
-    
 
+    return args
 
-if __name__ == "__main__":
+
+# ---------------------------------------------------------------------#
+def prepare_report(args):
+    """
+    Bring the store up to date for a report: the expire status of the inventory, the management
+    report and (when it is asked for or the data changed) the PDF. The PDF is left alone with
+    --format, unless --pdf or --pdf-background asks for it.
+
+    Returns:
+        DataFrame: The report model (see report_model.build_model), None when the management report failed.
+    """
+    try:
+        functions.update_inventory_expire_status()
+    except Exception as e:
+        print(f"Something went wrong when running this function: update_inventory_expire_status().\nError given: {e}")
+    if args.memory_mb:
+        functions.super_config.report_memory_mb = args.memory_mb
+    management_report = None
+    try:
+        if args.rebuild:
+            # the peak is only measured for a rebuild, tracemalloc slows every allocation down
+            import tracemalloc
+            tracemalloc.start()
+            start = time.perf_counter()
+            management_report = report_model.update_management_report(functions.storage_backend, rebuild=True)
+            peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f"Management report rebuilt: {len(management_report)} lines in {time.perf_counter() - start:.2f} s, "
+                  f"peak memory {peak_memory / 1024 / 1024:.1f} MB (ceiling {functions.super_config.report_memory_mb} MB)")
+        else:
+            management_report = report_model.update_management_report(functions.storage_backend)
+    except Exception as e:
+        print(f"Something went wrong when running this function: update_management_report().\nError given: {e}")
+    # the columns the PDF and the revenue and profit reports show are computed once, for all of them
+    model = report_model.build_model(management_report) if management_report is not None else None
+    if args.format and not (args.pdf or args.pdf_background):
+        return model
+    try:
+        # rich and reportlab are only loaded here
+        import reporting_logic
+        # only rendered when asked for or when the management report changed
+        if reporting_logic.update_pdf_report(force=args.pdf, background=args.pdf_background, model=model) == 'started':
+            print(f"The PDF report is being rendered in the background: {functions.super_config.pdf_report_file}")
+    except Exception as e:
+        print(f"Something went wrong when running this function: update_pdf_report().\nError given: {e}")
+    return model
+
+
+# ---------------------------------------------------------------------#
+def report_filters_of(args):
+    """Return the filters, sorting and paging of the rows of a report (see report_filters.select_rows)."""
+    return {'product': args.product, 'expired': args.expired, 'sort': args.sort, 'top': args.top,
+            'page': args.page, 'page_size': args.page_size}
+
+
+# ---------------------------------------------------------------------#
+def write_report(args, model):
+    """
+    Stream the rows of a report to stdout in the format of --format (see report_model.write_rows).
+    Errors and the footer of a paged report go to stderr.
+    """
+    import pandas as pd
+    as_of = None
+    if args.as_of:
+        try:
+            as_of = functions.parse_date(args.as_of)
+        except ValueError:
+            print(f"Invalid date for --as-of: '{args.as_of}'. Use the format YYYY-MM-DD.", file=sys.stderr)
+            return
+    current_date = pd.to_datetime(functions.get_current_date()).date()
+    try:
+        rows, footer = report_model.report_rows(args.report_type, functions.storage_backend, current_date,
+                                                filters=report_filters_of(args), model=model, as_of=as_of)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return
+    with profiling.stage('table_render', rows=len(rows)):
+        if not report_model.write_rows(rows[report_model.REPORT_COLUMNS[args.report_type]], args.format):
+            # the reader is gone (like '| head'), it gets nothing more
+            return
+    if footer:
+        print(footer, file=sys.stderr)
+    if args.output and args.report_type in ('revenue', 'profit'):
+        report_model.write_csv(rows, args.report_type, args.output)
+        print(f"{args.report_type.capitalize()} report written to: {args.output}", file=sys.stderr)
+
+
+# ---------------------------------------------------------------------#
+def print_timings(imports_done, command_done):
+    """
+    Print the startup time of this run to stderr: the imports of super.py, the command
+    itself (with the libraries it loaded on the way) and the total, plus how often
+    every CSV file was parsed and how often it came from the cache.
+    """
+    loaded = [name for name in ('pandas', 'numpy', 'rich', 'reportlab') if name in sys.modules]
+    print(f"timings: imports {(imports_done - start_time) * 1000:.1f} ms, "
+          f"command {(command_done - imports_done) * 1000:.1f} ms, "
+          f"total {(command_done - start_time) * 1000:.1f} ms "
+          f"(loaded: {', '.join(loaded) or 'none'})", file=sys.stderr)
+    print(f"timings: file reads: {frame_cache.summary()}", file=sys.stderr)
+
+
+# ---------------------------------------------------------------------#
+def run(argv=None):
+    """
+    Run one command line in this process (also used by the 'serve' server for every request).
+    """
     functions.check_before_reset_date()
-    main()
+    try:
+        args = main(argv)
+    except BaseException as e:
+        profiling.finish(e)
+        raise
+    profiling.finish()
+    return args
+
+
+if __name__ == "__main__":
+    imports_done = time.perf_counter()
+    # a running 'serve' process gets the command, otherwise it runs here
+    status = daemon.forward(SuperConfig(), sys.argv[1:], command_action)
+    if status is None:
+        run()
+        status = 0
+    if '--timings' in sys.argv[1:]:
+        print_timings(imports_done, time.perf_counter())
+    sys.exit(status)
@@ -0,0 +1,182 @@
+"""
+The view tables of the CSV storage in the format chosen in the config.
+
+'bought', 'sold', 'inventory' and 'management_report' are written as CSV
+(the default), or as Parquet or Feather files with a fixed schema:
+
+- ids and amounts are int64, is_expired is a boolean
+- buy_name is a categorical (dictionary encoded, every name stored once),
+  next to the product_id of the product catalog (see catalog.py)
+- dates are date32, so they are never parsed from text again
+- prices are decimal(12, 2)
+
+A columnar table is loaded without any type inference, only the columns
+that are asked for are read, and the file is memory-mapped. Prices come
+back as floats and dates as datetime.date objects, so the reports work
+the same for every format.
+
+Parquet and Feather need pyarrow, an optional dependency (pip install pyarrow, see
+requirements.txt); the CSV format does not.
+"""
+# ---------------All the IMPORTS:---------------#
+import os
+import frame_cache
+import locking
+# pandas and pyarrow are imported inside the functions that need them
+# -----------------------------------------------#
+
+TABLE_FORMATS = ('csv', 'parquet', 'feather')
+
+# column -> type in the columnar files
+TABLE_SCHEMAS = {
+    'bought': [('buy_id', 'int'), ('buy_date', 'date'), ('buy_name', 'name'), ('product_id', 'int'),
+               ('buy_amount', 'int'), ('buy_price', 'price'), ('expire_date', 'date')],
+    'sold': [('sell_id', 'int'), ('sell_date', 'date'), ('buy_name', 'name'), ('product_id', 'int'), ('sell_amount', 'int'),
+             ('sell_price', 'price')],
+    'inventory': [('inventory_id', 'int'), ('buy_id', 'int'), ('buy_date', 'date'), ('buy_name', 'name'),
+                  ('product_id', 'int'), ('buy_amount', 'int'), ('buy_price', 'price'), ('expire_date', 'date'), ('is_expired', 'bool')],
+    'management_report': [('buy_name_buy', 'name'), ('buy_amount_buy', 'int'), ('buy_price_buy', 'price'),
+                          ('sell_amount', 'int'), ('sell_price', 'price'), ('expired_amount', 'int'), ('revenue', 'price')],
+}
+
+# ---------------------------------------------------------------------#
+def _arrow_type(column_type):
+    import pyarrow as pa
+    return {
+        'int': pa.int64(),
+        'bool': pa.bool_(),
+        'date': pa.date32(),
+        'name': pa.dictionary(pa.int32(), pa.string()),
+        'price': pa.decimal128(12, 2),
+    }[column_type]
+
+# ---------------------------------------------------------------------#
+def _import_pyarrow(table_format):
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError(f"The '{table_format}' table format needs pyarrow. Install it with: pip install pyarrow") from None
+    return pyarrow
+
+# ---------------------------------------------------------------------#
+def _csv_file(config, name):
+    return {
+        'bought': config.bought_file,
+        'sold': config.sold_file,
+        'inventory': config.inventory_file,
+        'management_report': config.management_report_file,
+    }[name]
+
+# ---------------------------------------------------------------------#
+def table_file(config, name):
+    """
+    Return the path of table 'name' ('bought', 'sold', 'inventory' or 'management_report')
+    in the format of the config.
+    """
+    if config.table_format == 'csv':
+        return _csv_file(config, name)
+    return os.path.splitext(_csv_file(config, name))[0] + '.' + config.table_format
+
+# ---------------------------------------------------------------------#
+def to_arrow(df, name):
+    """
+    Convert a DataFrame with the columns of table 'name' to a pyarrow Table with its fixed schema.
+    """
+    import pandas as pd
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    arrays = []
+    for column, column_type in TABLE_SCHEMAS[name]:
+        values = df[column]
+        if column_type == 'date':
+            array = pa.array(pd.to_datetime(values).dt.date, type=pa.date32())
+        elif column_type == 'price':
+            array = pc.cast(pa.array(values.astype(float).round(2)), pa.decimal128(12, 2), safe=False)
+        elif column_type == 'name':
+            array = pa.array(values.astype(str)).dictionary_encode()
+        elif column_type == 'bool':
+            array = pa.array(values.astype(bool))
+        else:
+            array = pa.array(values.astype('int64'))
+        arrays.append(array.cast(_arrow_type(column_type)))
+    return pa.Table.from_arrays(arrays, names=[column for column, _ in TABLE_SCHEMAS[name]])
+
+# ---------------------------------------------------------------------#
+def _load_columnar(path, table_format, columns=None):
+    """Load a Parquet or Feather table (memory-mapped) into a DataFrame with float prices."""
+    import pyarrow as pa
+    if table_format == 'parquet':
+        import pyarrow.parquet as pq
+        table = pq.read_table(path, columns=columns, memory_map=True)
+    else:
+        import pyarrow.feather as feather
+        table = feather.read_table(path, columns=columns, memory_map=True)
+    df = table.to_pandas()
+    for column, field in zip(table.column_names, table.schema):
+        if pa.types.is_decimal(field.type):
+            df[column] = df[column].astype(float)
+    return df
+
+# ---------------------------------------------------------------------#
+def write_table(config, name, df):
+    """
+    Write table 'name' in the format of the config (CSV with the table's columns, or columnar).
+    """
+    path = table_file(config, name)
+    columns = [column for column, _ in TABLE_SCHEMAS[name]]
+    if config.table_format == 'csv':
+        frame_cache.write_csv(df, path, index=False, columns=columns)
+        return
+    _import_pyarrow(config.table_format)
+    table = to_arrow(df, name)
+    with locking.atomic_write(path, 'wb') as f:
+        if config.table_format == 'parquet':
+            import pyarrow.parquet as pq
+            pq.write_table(table, f)
+        else:
+            import pyarrow.feather as feather
+            feather.write_feather(table, f, compression='uncompressed')    # uncompressed, so it can be memory-mapped
+    frame_cache.invalidate(path)
+
+# ---------------------------------------------------------------------#
+def read_table(config, name, columns=None):
+    """
+    Read table 'name' in the format of the config.
+
+    Args:
+        columns (list): Only these columns (a columnar file does not even read the others).
+
+    Returns:
+        DataFrame: The table, or an empty one with its columns when the file is missing.
+    """
+    import pandas as pd
+    if config.table_format != 'csv':
+        # also without the file: an empty table would look like an empty store
+        _import_pyarrow(config.table_format)
+    path = table_file(config, name)
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=columns or [column for column, _ in TABLE_SCHEMAS[name]])
+    if config.table_format == 'csv':
+        df = frame_cache.read_csv(path)
+        return df[columns] if columns else df
+    return frame_cache.read_frame(path, _load_columnar, table_format=config.table_format, columns=columns)
+
+# ---------------------------------------------------------------------#
+def convert_csv_tables(config):
+    """
+    Write the CSV tables in 'outputs' again in the columnar format of the config
+    (the CSV files are left where they are).
+
+    Returns:
+        list: The files that were written.
+    """
+    _import_pyarrow(config.table_format)
+    written = []
+    for name in TABLE_SCHEMAS:
+        csv_file = _csv_file(config, name)
+        if os.path.exists(csv_file):
+            # product names like 'None' or 'NA' stay names (see frame_cache.read_csv)
+            name_columns = {column: str for column, column_type in TABLE_SCHEMAS[name] if column_type == 'name'}
+            write_table(config, name, frame_cache.read_csv(csv_file, dtype=name_columns))
+            written.append(table_file(config, name))
+    return written
@@ -0,0 +1,65 @@
+"""
+Cold-start benchmark of the SuperPy command line.
+
+Every command is run a few times as a new process (the way a till script
+calls it) in a scratch copy of the 'superpy' folder, so the real store is
+never touched. For each command the median wall time and the --timings line
+of the last run are printed.
+
+Usage (from the repository root):
+    python testing/bench_startup.py [--runs 5]
+"""
+# ---------------All the IMPORTS:---------------#
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date
+# -----------------------------------------------#
+
+SUPERPY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'superpy')
+
+COMMANDS = [
+    ['--help'],
+    ['time', '1'],
+    ['buy', 'Bench Apple', '5', '0.5', '2099-12-31'],
+    ['sell', 'Bench Apple', '1', '1.0'],
+    ['report', 'inventory'],
+]
+
+# ---------------------------------------------------------------------#
+def run_command(workdir, command):
+    """Run one command in a new process and return (wall time in ms, --timings line)."""
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, 'super.py', '--timings'] + command, cwd=workdir,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    elapsed = (time.perf_counter() - start) * 1000
+    timings = [line for line in result.stderr.splitlines() if line.startswith('timings:')]
+    return elapsed, timings[-1] if timings else ''
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cold-start benchmark of super.py per subcommand.')
+    parser.add_argument('--runs', type=int, default=5, help='Runs per command (default: 5)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = os.path.join(tmp, 'superpy')
+        shutil.copytree(SUPERPY_DIR, workdir)
+        # today already counts as run, so the start-of-day date reset does not skew the numbers
+        with open(os.path.join(workdir, 'last_run_day.txt'), 'w') as f:
+            f.write(str(date.today()))
+
+        print(f"{'command':<45}{'median ms':>10}  timings of the last run")
+        for command in COMMANDS:
+            results = [run_command(workdir, command) for _ in range(args.runs)]
+            median = statistics.median(elapsed for elapsed, _ in results)
+            print(f"{' '.join(command):<45}{median:>10.1f}  {results[-1][1]}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+"""
+Benchmark suite: how the SuperPy operations scale with the size of the store.
+
+For every scale a synthetic store (see generate_store.py) is generated in a
+temporary outputs folder, the application is pointed at it with
+functions.use_config, and every operation is timed a few times in this
+process. The first run of an operation is kept apart from the median of all
+runs, because the first one also pays for loading the store. An operation
+that takes longer than --max-seconds is not repeated and is left out at the
+larger scales (status 'too slow'), so a run shows where the tool falls over
+without taking all day.
+
+The results are written as CSV (one line per scale and operation) so runs
+can be compared, and a table of the median times is printed.
+
+Usage (from the repository root):
+    python testing/benchmark.py [--scales 1000 100000 1000000] [--storage csv] [--table-format csv]
+                                [--repeats 3] [--max-seconds 60] [--output benchmark_results.csv]
+"""
+# ---------------All the IMPORTS:---------------#
+import argparse
+import contextlib
+import csv
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'superpy'))
+import functions
+import reporting_logic
+from config import SuperConfig
+from generate_store import generate_store
+# -----------------------------------------------#
+
+RESULT_COLUMNS = ['storage', 'table_format', 'rows', 'products', 'lots', 'sales', 'operation', 'status', 'repeats', 'first_seconds', 'median_seconds']
+
+BENCH_PRODUCT = 'Bench Product'
+
+# (name, function) in the order they run; every function works on the store functions.use_config points at
+OPERATIONS = [
+    ('buy_product', lambda: functions.buy_product(BENCH_PRODUCT, 5, 1.0, '2099-12-31')),
+    ('sell_action', lambda: functions.sell_action(BENCH_PRODUCT, 1, 2.0)),
+    ('advance_time + update_inventory_expire_status', lambda: (functions.advance_time(1), functions.update_inventory_expire_status())),
+    ('update_management_report', lambda: reporting_logic.update_management_report()),
+    ('update_management_report (rebuild)', lambda: reporting_logic.update_management_report(rebuild=True)),
+    ('report inventory', reporting_logic.generate_inventory_report),
+    ('report revenue', reporting_logic.generate_revenue_report),
+    ('report profit', reporting_logic.generate_profit_report),
+    ('report expired', functions.check_expired_products),
+    ('generate_pdf_report', reporting_logic.generate_pdf_report),
+]
+
+# ---------------------------------------------------------------------#
+def time_operation(operation, repeats, max_seconds):
+    """
+    Run 'operation' up to 'repeats' times with its output thrown away (it stops
+    after a run that took more than 'max_seconds'). Returns the times in seconds.
+    """
+    times = []
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for _ in range(repeats):
+            start = time.perf_counter()
+            operation()
+            times.append(time.perf_counter() - start)
+            if times[-1] > max_seconds:
+                break
+    return times
+
+# ---------------------------------------------------------------------#
+def run_scale(rows, storage, table_format, repeats, max_seconds, skip):
+    """
+    Generate a store of 'rows' rows in a temporary folder and time every operation on it
+    that is not in 'skip'. Operations that were too slow are added to 'skip'.
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        config = SuperConfig(outputs_dir=os.path.join(tmp, 'outputs'), storage=storage,
+                             time_file=os.path.join(tmp, 'time.txt'), table_format=table_format)
+        start = time.perf_counter()
+        counts = generate_store(config, rows)
+        generate_seconds = time.perf_counter() - start
+        print(f"\n{rows} rows: {counts} generated in {generate_seconds:.2f} s")
+
+        functions.use_config(config)
+        for name, operation in OPERATIONS:
+            result = {'storage': storage, 'table_format': table_format, 'rows': rows, 'products': counts['products'], 'lots': counts['lots'],
+                      'sales': counts['sales'], 'operation': name, 'status': 'skipped', 'repeats': 0,
+                      'first_seconds': '', 'median_seconds': ''}
+            if name not in skip:
+                times = time_operation(operation, repeats, max_seconds)
+                result.update({'status': 'ok', 'repeats': len(times), 'first_seconds': round(times[0], 6),
+                               'median_seconds': round(statistics.median(times), 6)})
+                if times[-1] > max_seconds:
+                    result['status'] = 'too slow'
+                    skip.add(name)
+                print(f"  {name:<50}first {times[0]:>9.4f} s   median {statistics.median(times):>9.4f} s   {result['status']}")
+            results.append(result)
+    return results
+
+# ---------------------------------------------------------------------#
+def print_scaling(results, scales):
+    """Print the median time of every operation at every scale."""
+    print(f"\n{'median seconds':<50}" + ''.join(f"{rows:>14}" for rows in scales))
+    for name, _ in OPERATIONS:
+        medians = {result['rows']: result['median_seconds'] for result in results
+                   if result['operation'] == name and result['status'] != 'skipped'}
+        if medians:
+            print(f"{name:<50}" + ''.join(f"{medians[rows]:>14.4f}" if rows in medians else f"{'-':>14}" for rows in scales))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the SuperPy operations on synthetic stores of several sizes.')
+    parser.add_argument('--scales', type=int, nargs='+', default=[1000, 100000, 1000000], help='Store sizes in rows (lots plus sales)')
+    parser.add_argument('--storage', choices=['csv', 'sqlite'], default='csv', help='Storage backend to benchmark')
+    parser.add_argument('--table-format', choices=['csv', 'parquet', 'feather'], default='csv', help='File format of the tables of the csv storage')
+    parser.add_argument('--repeats', type=int, default=3, help='Runs per operation (default: 3)')
+    parser.add_argument('--max-seconds', type=float, default=60, help='Leave an operation out of the larger scales once a run takes longer (default: 60)')
+    parser.add_argument('--skip', nargs='*', default=[], metavar='OPERATION', help='Operations to leave out, e.g. "report inventory"')
+    parser.add_argument('--output', type=str, default='benchmark_results.csv', help='CSV file for the results')
+    args = parser.parse_args()
+
+    results = []
+    skip = set(args.skip)
+    for rows in args.scales:
+        results.extend(run_scale(rows, args.storage, args.table_format, args.repeats, args.max_seconds, skip))
+        # write after every scale, so the results so far survive a scale that falls over
+        with open(args.output, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=RESULT_COLUMNS)
+            writer.writeheader()
+            writer.writerows(results)
+
+    print_scaling(results, args.scales)
+    print(f"\nResults written to: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
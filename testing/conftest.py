@@ -0,0 +1,31 @@
+"""
+Fixtures of the tests in this folder (run them from the repository root with: python -m pytest testing).
+
+Every test works on its own store in a temporary folder, never on 'superpy/outputs'.
+"""
+# ---------------All the IMPORTS:---------------#
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'superpy'))
+from store import Store
+# -----------------------------------------------#
+
+START_DATE = '2023-07-01'
+
+# ---------------------------------------------------------------------#
+def open_store(folder, storage_name='csv', start_date=START_DATE):
+    """Open a store in 'folder' (an 'outputs' folder and a time file) at 'start_date'."""
+    os.makedirs(folder, exist_ok=True)
+    time_file = os.path.join(folder, 'time.txt')
+    if not os.path.exists(time_file):
+        with open(time_file, 'w') as f:
+            f.write(start_date)
+    return Store(outputs_dir=os.path.join(folder, 'outputs'), time_file=time_file, storage_name=storage_name)
+
+# ---------------------------------------------------------------------#
+@pytest.fixture(params=['csv', 'sqlite'])
+def store(request, tmp_path):
+    """An empty store at START_DATE, once for every storage backend."""
+    return open_store(str(tmp_path), request.param)
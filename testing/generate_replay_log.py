@@ -0,0 +1,92 @@
+"""
+Synthetic replay log generator (see superpy/replay.py).
+
+Writes a log of buy, sell, time and report events as a few tills would send
+them: the events arrive at random moments at a given rate, most of them are
+sales of products that were bought earlier, the day advances every so many
+events and a report is asked for now and then. The same seed gives the same
+log, so replays of it can be compared.
+
+Usage (from the repository root):
+    python testing/generate_replay_log.py replay.csv --events 10000 [--rate 50] [--seed 0]
+    python superpy/super.py replay replay.csv
+"""
+# ---------------All the IMPORTS:---------------#
+import argparse
+import csv
+import os
+import random
+import sys
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'superpy'))
+import replay
+# -----------------------------------------------#
+
+SHELF_LIFE_DAYS = [3, 7, 14, 30, 90, 180, 365]
+
+# ---------------------------------------------------------------------#
+def generate_log(filename, events, rate=50.0, n_products=None, events_per_day=200, report_every=500,
+                 start_date=replay.START_DATE, seed=0):
+    """
+    Write a replay log of 'events' events to 'filename' (CSV).
+
+    Args:
+        filename (str): The log to write.
+        events (int): Number of events.
+        rate (float): Average events per second (the 'at' column).
+        n_products (int): Number of products (default: one per 50 events, at least 10).
+        events_per_day (int): A 'time' event advances the day after this many events.
+        report_every (int): A 'report' event after this many events.
+        start_date (str): The application date the replay starts at (for the expire dates).
+        seed (int): Seed of the random generator.
+
+    Returns:
+        dict: The number of events per action.
+    """
+    rng = random.Random(seed)
+    n_products = n_products or max(10, events // 50)
+    products = [(f"Product {i:05d}", round(rng.uniform(0.2, 10.0), 2), rng.choice(SHELF_LIFE_DAYS)) for i in range(n_products)]
+    today = date.fromisoformat(start_date)
+    bought = []     # indexes of the products that were bought at least once
+    counts = dict.fromkeys(replay.REPLAY_ACTIONS, 0)
+    at = 0.0
+    with open(filename, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(replay.LOG_COLUMNS)
+        for number in range(1, events + 1):
+            at += rng.expovariate(rate)
+            if number % report_every == 0:
+                row = [f"{at:.4f}", 'report', '', '', '', '', '']
+            elif number % events_per_day == 0:
+                today += timedelta(1)
+                row = [f"{at:.4f}", 'time', '', '', '', '', 1]
+            elif not bought or rng.random() < 0.3:
+                # some products are bought a lot more often than others
+                index = min(int(rng.paretovariate(1.2)) - 1, n_products - 1)
+                name, price, shelf_life = products[index]
+                bought.append(index)
+                expire_date = today + timedelta(shelf_life + rng.randint(-1, 2))
+                row = [f"{at:.4f}", 'buy', name, rng.randint(10, 60), price, expire_date, '']
+            else:
+                name, price, _ = products[rng.choice(bought)]
+                row = [f"{at:.4f}", 'sell', name, rng.randint(1, 5), round(price * rng.uniform(1.2, 2.0), 2), '', '']
+            counts[row[1]] += 1
+            writer.writerow(row)
+    return counts
+
+# ---------------------------------------------------------------------#
+def main():
+    parser = argparse.ArgumentParser(description='Generate a replay log for super.py replay.')
+    parser.add_argument('log_file', help='CSV file to write')
+    parser.add_argument('--events', type=int, default=10000, help='Number of events')
+    parser.add_argument('--rate', type=float, default=50.0, help='Average events per second')
+    parser.add_argument('--products', type=int, help='Number of products (default: one per 50 events)')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the random generator')
+    args = parser.parse_args()
+    counts = generate_log(args.log_file, args.events, args.rate, args.products, seed=args.seed)
+    print(f"Written {args.events} events to {args.log_file}: " + ', '.join(f"{count} {action}" for action, count in counts.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Synthetic supermarket store generator.
+
+Writes a consistent store into an outputs folder: a journal with N products,
+M lots (buy events) and K sales, plus the expire events of the lots that
+already expired with stock left, and a time file with the current date.
+
+- Every product has a base price and a shelf life (a few days for fresh
+  food up to a year for tins), lots are bought over the past year and
+  expire after the shelf life of their product, give or take a few days.
+- Sales take units from a lot between its buy date and its expire date and
+  never sell more than the lot had.
+
+Usage (from the repository root):
+    python testing/generate_store.py OUTPUTS_DIR --rows 100000 [--storage sqlite]
+"""
+# ---------------All the IMPORTS:---------------#
+import argparse
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'superpy'))
+import expiry_index
+import journal
+import storage
+from config import SuperConfig
+# -----------------------------------------------#
+
+CURRENT_DATE = '2023-07-01'
+HISTORY_DAYS = 365
+SHELF_LIFE_DAYS = [3, 7, 14, 30, 90, 180, 365]
+EVENT_ORDER = {'buy': 0, 'sell': 1, 'expire': 2}
+
+# ---------------------------------------------------------------------#
+def generate_store(config, rows, n_products=None, current_date=CURRENT_DATE, seed=0):
+    """
+    Generate a store of about 'rows' journal events (half lots, half sales) into config.outputs_dir.
+
+    Args:
+        config (SuperConfig): Where to write the store (outputs_dir, time_file, storage).
+        rows (int): Number of lots plus sales.
+        n_products (int): Number of products (default: one per 100 lots, at least 10).
+        current_date (str): The application date written to the time file.
+        seed (int): Seed of the random generator, the same seed gives the same store.
+
+    Returns:
+        dict: The number of products, lots, sales and expire events that were written.
+    """
+    rng = np.random.default_rng(seed)
+    n_lots = max(1, rows // 2)
+    n_products = n_products or max(10, n_lots // 100)
+    today = np.datetime64(current_date, 'D')
+
+    # products
+    base_prices = np.round(rng.uniform(0.2, 10.0, n_products), 2)
+    shelf_lives = rng.choice(SHELF_LIFE_DAYS, n_products)
+    names = np.array([f"Product {i:06d}" for i in range(n_products)])
+
+    # lots: some products are bought a lot more often than others
+    lot_products = np.minimum(rng.zipf(1.3, n_lots) - 1, n_products - 1)
+    buy_dates = today - np.sort(rng.integers(1, HISTORY_DAYS + 1, n_lots))[::-1]    # lot ids in buy order
+    expire_dates = buy_dates + shelf_lives[lot_products] + rng.integers(-1, 3, n_lots)
+    expire_dates = np.maximum(expire_dates, buy_dates)
+    buy_amounts = rng.integers(1, 51, n_lots)
+    buy_prices = np.round(base_prices[lot_products] * rng.choice([0.95, 1.0, 1.05], n_lots), 2)    # a few price points per product
+
+    # sales: a few units of a random lot, on a day it was in the shop and not expired
+    n_sales = max(0, rows - n_lots)
+    sale_lots = rng.integers(0, n_lots, n_sales)
+    last_days = np.minimum(expire_dates[sale_lots], today - 1)
+    spans = np.maximum((last_days - buy_dates[sale_lots]).astype(int), 0)
+    sell_dates = buy_dates[sale_lots] + np.floor(rng.random(n_sales) * (spans + 1)).astype(int)
+    sell_units = rng.integers(1, 6, n_sales)
+    sales = pd.DataFrame({'lot': sale_lots, 'date': sell_dates, 'units': sell_units})
+    sales = sales.sort_values(['lot', 'date'], kind='stable')
+    sold_so_far = sales.groupby('lot')['units'].cumsum()
+    sales = sales[sold_so_far.values <= buy_amounts[sales['lot'].values]]
+    sell_prices = np.round(buy_prices[sales['lot'].values] * rng.uniform(1.2, 2.0, len(sales)), 2)
+
+    # lots that expired before today with stock left get their expire event the day after
+    remaining = buy_amounts - np.bincount(sales['lot'].values, weights=sales['units'].values, minlength=n_lots).astype(int)
+    expired = (expire_dates < today) & (remaining > 0)
+    expired_lots = np.flatnonzero(expired)
+
+    lot_ids = np.arange(1, n_lots + 1)
+    events = pd.concat([
+        pd.DataFrame({
+            'event_type': 'buy', 'event_date': buy_dates, 'ref_id': lot_ids, 'lot_id': lot_ids,
+            'buy_name': names[lot_products], 'amount': buy_amounts, 'price': buy_prices, 'expire_date': expire_dates,
+        }),
+        pd.DataFrame({
+            'event_type': 'sell', 'event_date': sales['date'].values, 'ref_id': 0, 'lot_id': lot_ids[sales['lot'].values],
+            'buy_name': names[lot_products[sales['lot'].values]], 'amount': sales['units'].values, 'price': sell_prices,
+            'expire_date': expire_dates[sales['lot'].values],
+        }),
+        pd.DataFrame({
+            'event_type': 'expire', 'event_date': expire_dates[expired_lots] + 1, 'ref_id': None, 'lot_id': lot_ids[expired_lots],
+            'buy_name': names[lot_products[expired_lots]], 'amount': remaining[expired_lots], 'price': buy_prices[expired_lots],
+            'expire_date': expire_dates[expired_lots],
+        }),
+    ], ignore_index=True)
+
+    # the journal is in time order: on one day the buys first, then the sales, then the expire events
+    events['order'] = events['event_type'].map(EVENT_ORDER)
+    events = events.sort_values(['event_date', 'order', 'lot_id'], kind='stable').reset_index(drop=True)
+    is_sale = events['event_type'] == 'sell'
+    events.loc[is_sale, 'ref_id'] = np.arange(1, is_sale.sum() + 1)
+    events['ref_id'] = events['ref_id'].astype('Int64')
+    events['event_id'] = np.arange(1, len(events) + 1)
+    for column in ('event_date', 'expire_date'):
+        events[column] = events[column].astype(str)
+
+    os.makedirs(config.outputs_dir, exist_ok=True)
+    events.to_csv(config.journal_file, index=False, columns=journal.JOURNAL_COLUMNS)
+    with open(config.time_file, 'w') as f:
+        f.write(str(current_date))
+
+    # build what the first command would otherwise build, so it is not in the timings
+    journal.load_counters(config)
+    if config.storage == 'sqlite':
+        storage.migrate_csv_to_sqlite(config, current_date)
+    else:
+        expiry_index.ensure_index(config)
+        journal.refresh_views(config, current_date)
+    storage.get_storage(config).update_management_report(rebuild=True)
+
+    return {'products': n_products, 'lots': n_lots, 'sales': len(sales), 'expired_lots': len(expired_lots)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic SuperPy store.')
+    parser.add_argument('outputs_dir', type=str, help='Folder to write the store to (the time file goes next to it)')
+    parser.add_argument('--rows', type=int, default=1000, help='Number of lots plus sales (default: 1000)')
+    parser.add_argument('--products', type=int, default=None, help='Number of products (default: one per 100 lots)')
+    parser.add_argument('--storage', choices=['csv', 'sqlite'], default='csv', help='Storage backend of the store')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the random generator')
+    args = parser.parse_args()
+
+    time_file = os.path.join(os.path.dirname(os.path.abspath(args.outputs_dir)), 'time.txt')
+    config = SuperConfig(outputs_dir=args.outputs_dir, storage=args.storage, time_file=time_file)
+    counts = generate_store(config, args.rows, args.products, seed=args.seed)
+    print(f"Generated in {args.outputs_dir}: {counts}")
+
+
+if __name__ == '__main__':
+    main()
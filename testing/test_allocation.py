@@ -0,0 +1,81 @@
+"""
+Tests of the first expired first out allocation of a sale (see superpy/allocation.py).
+"""
+# ---------------All the IMPORTS:---------------#
+from conftest import open_store
+from allocation import LotAllocator
+# -----------------------------------------------#
+
+# ---------------------------------------------------------------------#
+def _lot(buy_id, buy_amount, expire_date, buy_name='Milk'):
+    return {'buy_id': buy_id, 'buy_date': '2023-07-01', 'buy_name': buy_name, 'buy_amount': buy_amount,
+            'buy_price': 1.0, 'expire_date': expire_date}
+
+# ---------------------------------------------------------------------#
+def test_sale_is_taken_from_the_lot_that_expires_first():
+    allocator = LotAllocator()
+    # bought in another order than they expire
+    allocator.add_lot(_lot(1, 5, '2023-07-20'))
+    allocator.add_lot(_lot(2, 5, '2023-07-10'))
+    allocator.add_lot(_lot(3, 5, '2023-07-15'))
+
+    assert allocator.allocate('Milk', 3, '2023-07-05') == [(2, 3, '2023-07-10')]
+    assert allocator.stock('Milk', '2023-07-05') == (12, 0)
+
+# ---------------------------------------------------------------------#
+def test_sale_splits_across_lots_in_expiry_order():
+    allocator = LotAllocator()
+    allocator.add_lot(_lot(1, 5, '2023-07-20'))
+    allocator.add_lot(_lot(2, 5, '2023-07-10'))
+    allocator.add_lot(_lot(3, 5, '2023-07-15'))
+
+    allocations = allocator.allocate('Milk', 12, '2023-07-05')
+
+    assert allocations == [(2, 5, '2023-07-10'), (3, 5, '2023-07-15'), (1, 2, '2023-07-20')]
+    assert allocator.lots[1]['buy_amount'] == 3
+    assert allocator.stock('Milk', '2023-07-05') == (3, 0)
+
+# ---------------------------------------------------------------------#
+def test_expired_lots_are_skipped_and_not_sold():
+    allocator = LotAllocator()
+    allocator.add_lot(_lot(1, 5, '2023-07-03'))
+    allocator.add_lot(_lot(2, 5, '2023-07-10'))
+
+    assert allocator.stock('Milk', '2023-07-05') == (5, 5)
+    assert allocator.allocate('Milk', 4, '2023-07-05') == [(2, 4, '2023-07-10')]
+    # more than the units that are not expired: nothing is taken
+    assert allocator.allocate('Milk', 2, '2023-07-05') is None
+    assert allocator.stock('Milk', '2023-07-05') == (1, 5)
+
+# ---------------------------------------------------------------------#
+def test_other_products_are_not_touched():
+    allocator = LotAllocator()
+    allocator.add_lot(_lot(1, 5, '2023-07-05', buy_name='Bread'))
+    allocator.add_lot(_lot(2, 5, '2023-07-10'))
+
+    assert allocator.allocate('Milk', 5, '2023-07-01') == [(2, 5, '2023-07-10')]
+    assert allocator.stock('Bread', '2023-07-01') == (5, 0)
+
+# ---------------------------------------------------------------------#
+def test_recorded_sale_splits_across_lots(store):
+    store.buy('Milk', 5, 1.00, '2023-07-20')
+    store.buy('Milk', 5, 1.10, '2023-07-10')
+    store.buy('Milk', 5, 1.20, '2023-07-15')
+
+    sale = store.sell('Milk', 12, 2.00)
+
+    assert [(lot['lot_id'], lot['units']) for lot in sale['lots']] == [(2, 5), (3, 5), (1, 2)]
+    assert store.stock('Milk') == (3, 0)
+    inventory = store.report('inventory')
+    assert inventory[['buy_amount', 'expire_date']].values.tolist() == [[3, '2023-07-20']]
+
+# ---------------------------------------------------------------------#
+def test_recorded_sale_survives_a_new_process(store, tmp_path):
+    store.buy('Milk', 5, 1.00, '2023-07-20')
+    store.buy('Milk', 5, 1.10, '2023-07-10')
+    store.sell('Milk', 7, 2.00)
+
+    # the lots are read again from the storage, not from the memory of the first store
+    reopened = open_store(str(tmp_path), store.config.storage)
+    assert reopened.stock('Milk') == (3, 0)
+    assert [(lot['lot_id'], lot['units']) for lot in reopened.sell('Milk', 3, 2.00)['lots']] == [(1, 3)]
@@ -0,0 +1,41 @@
+"""
+Tests of the chain report over several stores (see superpy/chain.py).
+"""
+# ---------------All the IMPORTS:---------------#
+import hashlib
+import os
+import pytest
+import chain
+from conftest import open_store
+# -----------------------------------------------#
+
+# ---------------------------------------------------------------------#
+def _files(folder):
+    """Every file under 'folder' with a hash of its contents."""
+    files = {}
+    for path, _, names in os.walk(folder):
+        for name in names:
+            with open(os.path.join(path, name), 'rb') as f:
+                files[os.path.join(path, name)] = hashlib.sha256(f.read()).hexdigest()
+    return files
+
+# ---------------------------------------------------------------------#
+@pytest.mark.parametrize('configured_storage', ['csv', 'sqlite'])
+def test_chain_of_csv_and_sqlite_stores(tmp_path, monkeypatch, configured_storage):
+    csv_shop = open_store(str(tmp_path / 'shop1'), 'csv')
+    csv_shop.buy('Milk', 5, 1.00, '2023-07-20')
+    csv_shop.sell('Milk', 2, 2.00)
+    sqlite_shop = open_store(str(tmp_path / 'shop2'), 'sqlite')
+    sqlite_shop.buy('Milk', 4, 1.00, '2023-07-20')
+    sqlite_shop.sell('Milk', 3, 2.50)
+    files = _files(tmp_path)
+    monkeypatch.setenv('SUPERPY_STORAGE', configured_storage)
+
+    per_product, per_store, _, errors = chain.chain_report(chain.find_stores(str(tmp_path)), jobs=1)
+
+    assert errors == {}
+    assert per_store['store'].tolist() == ['shop1', 'shop2']
+    assert per_store['revenue'].tolist() == [4.0, 7.5]
+    assert per_product[['product', 'buy_amount', 'sell_amount']].values.tolist() == [['Milk', 9, 5]]
+    # the stores were only read
+    assert _files(tmp_path) == files
@@ -0,0 +1,55 @@
+"""
+Tests of the inventory on an earlier date ('report inventory --as-of', see superpy/checkpoints.py).
+"""
+# ---------------All the IMPORTS:---------------#
+import checkpoints
+import journal
+from conftest import open_store
+# -----------------------------------------------#
+
+# ---------------------------------------------------------------------#
+def _rows(inventory):
+    """The lines of an inventory report, in an order that does not depend on how they were read."""
+    return sorted(tuple(str(value) for value in row) for row in inventory.itertuples(index=False))
+
+# ---------------------------------------------------------------------#
+def _trade_one_day(shop, day):
+    shop.buy(f"Product {day % 4}", 10 + day, 1.0 + day % 3, f"2023-07-{5 + day:02d}")
+    if day >= 2:
+        name = f"Product {(day - 2) % 4}"
+        if shop.stock(name)[0] >= 3:
+            shop.sell(name, 3, 4.0)
+
+# ---------------------------------------------------------------------#
+def test_as_of_matches_the_inventory_of_that_day(store):
+    store.config.checkpoint_days = 3
+    inventory_of_day = {}
+    for day in range(15):
+        _trade_one_day(store, day)
+        inventory_of_day[str(store.current_date())] = _rows(store.report('inventory'))
+        store.advance_time(1)
+    store.buy('Product 9', 5, 1.0, '2023-08-30')
+
+    for day, inventory in inventory_of_day.items():
+        assert _rows(store.report('inventory', as_of=day)) == inventory, day
+
+# ---------------------------------------------------------------------#
+def test_as_of_matches_a_full_replay_of_the_journal(tmp_path):
+    shop = open_store(str(tmp_path))
+    shop.config.checkpoint_days = 2
+    for day in range(12):
+        _trade_one_day(shop, day)
+        shop.advance_time(1)
+    checkpoints.update_checkpoints(shop.config)
+    # the clock is reset to an earlier day: the events after it are dated before the last checkpoints
+    shop.set_date('2023-07-04')
+    for day in range(3):
+        _trade_one_day(shop, day)
+        shop.advance_time(1)
+
+    journal_df = journal.read_journal(shop.config)
+    for day in [f"2023-07-{day:02d}" for day in range(1, 14)]:
+        replayed = journal.load_allocator(journal_df[journal_df['event_date'] <= day])
+        expected = sorted((lot_id, lot['buy_amount']) for lot_id, lot in replayed.lots.items() if lot['buy_amount'] > 0)
+        inventory = checkpoints.inventory_as_of(shop.config, day)
+        assert sorted(zip(inventory['buy_id'], inventory['buy_amount'])) == expected, day
@@ -0,0 +1,116 @@
+"""
+Tests of the journal of the CSV storage: a torn last line, a torn counters file, the lots checkpoint and
+a journal that was created again (see superpy/journal.py, superpy/checkpoints.py and superpy/report_aggregates.py).
+"""
+# ---------------All the IMPORTS:---------------#
+import csv
+import os
+import shutil
+import pytest
+import checkpoints
+import journal
+from conftest import open_store
+# -----------------------------------------------#
+
+# ---------------------------------------------------------------------#
+def _journal_lines(config):
+    with open(config.journal_file, newline='') as f:
+        return list(csv.reader(f))
+
+# ---------------------------------------------------------------------#
+def _lots_left(allocator):
+    return {lot_id: lot['buy_amount'] for lot_id, lot in allocator.lots.items() if lot['buy_amount'] > 0}
+
+# ---------------------------------------------------------------------#
+def test_torn_last_line_is_left_out_and_cut_on_the_next_write(tmp_path):
+    shop = open_store(str(tmp_path))
+    shop.buy('Milk', 5, 1.00, '2023-07-20')
+    shop.buy('Bread', 3, 2.00, '2023-07-10')
+    # a write that stopped halfway (a crash, a full disk)
+    with open(shop.config.journal_file, 'a') as f:
+        f.write('3,buy,2023-07-01,3,3,Che')
+
+    # a new process only reads the complete lines
+    reopened = open_store(str(tmp_path))
+    assert reopened.stock('Milk') == (5, 0)
+    assert reopened.stock('Che') == (0, 0)
+
+    reopened.buy('Cheese', 2, 4.00, '2023-07-30')
+    lines = _journal_lines(reopened.config)
+    assert lines[0] == journal.JOURNAL_COLUMNS
+    assert all(len(line) == len(journal.JOURNAL_COLUMNS) for line in lines)
+    assert [line[5] for line in lines[1:]] == ['Milk', 'Bread', 'Cheese']
+    assert reopened.report('inventory')['buy_name'].tolist() == ['Milk', 'Bread', 'Cheese']
+
+# ---------------------------------------------------------------------#
+def _history(shop):
+    for day in range(10):
+        shop.buy(f"Product {day % 3}", 10, 1.0 + day, '2023-07-25')
+        shop.sell(f"Product {day % 3}", 4, 3.0)
+        shop.advance_time(1)
+
+# ---------------------------------------------------------------------#
+def test_lots_checkpoint_plus_tail_matches_a_full_replay(tmp_path):
+    shop = open_store(str(tmp_path))
+    shop.config.checkpoint_events = 5
+    _history(shop)
+    checkpoints.load_lots(shop.config)      # saves a checkpoint: there were more than 5 new events
+    shop.buy('Product 0', 7, 9.0, '2023-07-30')
+    shop.sell('Product 1', 5, 3.0)
+
+    allocator, event_id, offset = checkpoints.load_lots(shop.config)
+    replayed = journal.load_allocator(journal.read_journal(shop.config))
+
+    assert _lots_left(allocator) == _lots_left(replayed)
+    assert event_id == int(_journal_lines(shop.config)[-1][0])
+
+# ---------------------------------------------------------------------#
+def test_a_corrupt_lots_checkpoint_is_not_used(tmp_path):
+    shop = open_store(str(tmp_path))
+    shop.config.checkpoint_events = 5
+    _history(shop)
+    checkpoints.load_lots(shop.config)
+    with open(shop.config.lots_checkpoint_file, 'r+') as f:
+        f.truncate(20)
+
+    allocator = checkpoints.load_lots(shop.config)[0]
+
+    assert _lots_left(allocator) == _lots_left(journal.load_allocator(journal.read_journal(shop.config)))
+
+# ---------------------------------------------------------------------#
+def test_totals_of_a_journal_that_was_created_again(tmp_path):
+    shop = open_store(str(tmp_path / 'shop'))
+    shop.buy('Milk', 5, 1.00, '2023-07-20')
+    shop.sell('Milk', 2, 2.00)
+    shop.report('profit')                   # saves the totals up to the end of this journal
+    other = open_store(str(tmp_path / 'other'))
+    other.buy('Bread', 4, 1.50, '2023-07-20')
+    other.sell('Bread', 3, 3.00)
+    other.buy('Cheese', 2, 4.00, '2023-07-20')
+    # the journal is created again, with more events than the saved totals have seen
+    for store_file in ('journal.csv', 'counters.json'):
+        shutil.copy(os.path.join(other.config.outputs_dir, store_file), shop.config.outputs_dir)
+
+    reopened = open_store(str(tmp_path / 'shop'))
+    report = reopened.update_management_report()
+
+    assert report['buy_name_buy'].tolist() == ['Bread', 'Cheese']
+    assert report['revenue'].tolist() == [9.0, 0.0]
+
+# ---------------------------------------------------------------------#
+@pytest.mark.parametrize('contents', ['', '{"event_id": 3, "buy_', '[]', '{"event_id": 3}'])
+def test_an_unreadable_counters_file_is_seeded_again(tmp_path, contents):
+    shop = open_store(str(tmp_path))
+    shop.buy('Milk', 5, 1.00, '2023-07-20')
+    shop.buy('Bread', 3, 2.00, '2023-07-10')
+    shop.sell('Milk', 2, 2.00)
+    # an empty or torn file, like a write that a power loss cut short
+    with open(shop.config.counters_file, 'w') as f:
+        f.write(contents)
+
+    reopened = open_store(str(tmp_path))
+    lot = reopened.buy('Cheese', 2, 4.00, '2023-07-30')
+    sale = reopened.sell('Milk', 1, 2.00)
+
+    assert (lot['lot_id'], sale['sale_id']) == (3, 2)
+    assert [int(line[0]) for line in _journal_lines(reopened.config)[1:]] == [1, 2, 3, 4, 5]
@@ -0,0 +1,40 @@
+"""
+Tests of the atomic rewrite of the state files (see superpy/locking.py).
+"""
+# ---------------All the IMPORTS:---------------#
+import os
+import pytest
+import locking
+# -----------------------------------------------#
+
+# ---------------------------------------------------------------------#
+def test_atomic_write_is_on_disk_before_it_replaces_the_file(tmp_path, monkeypatch):
+    path = str(tmp_path / 'counters.json')
+    calls = []
+    real_fsync, real_replace = os.fsync, os.replace
+    monkeypatch.setattr(os, 'fsync', lambda fd: calls.append('fsync') or real_fsync(fd))
+    monkeypatch.setattr(os, 'replace', lambda *args: calls.append('replace') or real_replace(*args))
+
+    with locking.atomic_write(path) as f:
+        f.write('{"event_id": 1}')
+
+    # the new file first, then the folder with the rename in it
+    assert calls == ['fsync', 'replace', 'fsync']
+    with open(path) as f:
+        assert f.read() == '{"event_id": 1}'
+    assert os.listdir(tmp_path) == ['counters.json']
+
+# ---------------------------------------------------------------------#
+def test_a_failed_atomic_write_leaves_the_old_file(tmp_path):
+    path = str(tmp_path / 'time.txt')
+    with open(path, 'w') as f:
+        f.write('2023-07-01')
+
+    with pytest.raises(RuntimeError):
+        with locking.atomic_write(path) as f:
+            f.write('2023-')
+            raise RuntimeError('crash')
+
+    with open(path) as f:
+        assert f.read() == '2023-07-01'
+    assert os.listdir(tmp_path) == ['time.txt']
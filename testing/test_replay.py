@@ -0,0 +1,26 @@
+"""
+Tests of the replay of a transaction log (see superpy/replay.py).
+"""
+# ---------------All the IMPORTS:---------------#
+import replay
+# -----------------------------------------------#
+
+LOG = """at,action,name,amount,price,expire_date,days
+0,buy,Error Bread,5,1.0,2023-07-20,
+1,sell,Error Bread,2,2.0,,
+2,sell,Milk,1,2.0,,
+3,buy,Old Milk,1,1.0,2023-06-01,
+4,report,,,,,
+"""
+
+# ---------------------------------------------------------------------#
+def test_only_the_transactions_the_store_refuses_are_rejected(tmp_path):
+    log_file = tmp_path / 'replay.csv'
+    log_file.write_text(LOG)
+    config = replay.prepare_store(str(tmp_path / 'scratch'), None, replay.START_DATE, 'csv')
+
+    results = replay.replay(config, replay.read_log(str(log_file)))
+
+    # the sale of a product the store never had and the buy of an expired product; not the product called 'Error ...'
+    assert results['events'] == 5
+    assert results['rejected'] == 2
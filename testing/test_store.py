@@ -0,0 +1,156 @@
+"""
+Tests of the in-process API of a store (see superpy/store.py).
+"""
+# ---------------All the IMPORTS:---------------#
+import pytest
+from conftest import open_store
+from store import (StoreError, InvalidInputError, ExpiredProductError, OutOfStockError,
+                   InsufficientStockError)
+# -----------------------------------------------#
+
+# ---------------------------------------------------------------------#
+def test_buy_returns_the_lot(store):
+    lot = store.buy(' Milk ', 5, 1.25, '2023-07-20')
+
+    assert lot == {'lot_id': 1, 'buy_date': '2023-07-01', 'buy_name': 'Milk', 'buy_amount': 5,
+                   'buy_price': 1.25, 'expire_date': '2023-07-20'}
+    assert store.stock('Milk') == (5, 0)
+
+# ---------------------------------------------------------------------#
+def test_sale_of_a_product_the_store_never_had(store):
+    with pytest.raises(OutOfStockError) as error:
+        store.sell('Milk', 1, 2.00)
+
+    assert not isinstance(error.value, InsufficientStockError)
+    assert str(error.value) == "Product 'Milk' is out of stock and cannot be sold."
+    assert error.value.name == 'Milk'
+
+# ---------------------------------------------------------------------#
+def test_sale_of_a_product_that_is_sold_out(store):
+    store.buy('Milk', 2, 1.00, '2023-07-20')
+    store.sell('Milk', 2, 2.00)
+
+    with pytest.raises(OutOfStockError):
+        store.sell('Milk', 1, 2.00)
+
+# ---------------------------------------------------------------------#
+def test_sale_of_a_product_that_is_expired(store):
+    store.buy('Milk', 4, 1.00, '2023-07-03')
+    store.advance_time(5)
+
+    with pytest.raises(ExpiredProductError) as error:
+        store.sell('Milk', 1, 2.00)
+
+    assert error.value.expired_amount == 4
+    assert store.stock('Milk') == (0, 4)
+
+# ---------------------------------------------------------------------#
+def test_sale_of_more_than_is_left(store):
+    store.buy('Milk', 4, 1.00, '2023-07-03')
+    store.buy('Milk', 3, 1.00, '2023-07-20')
+    store.advance_time(5)
+
+    with pytest.raises(InsufficientStockError) as error:
+        store.sell('Milk', 4, 2.00)
+
+    # only the units that are not expired can be sold
+    assert error.value.available == 3
+    assert isinstance(error.value, OutOfStockError)
+    # nothing was taken
+    assert store.stock('Milk') == (3, 4)
+
+# ---------------------------------------------------------------------#
+def test_buy_of_a_product_that_is_already_expired(store):
+    with pytest.raises(ExpiredProductError) as error:
+        store.buy('Milk', 4, 1.00, '2023-06-30')
+
+    assert str(error.value) == "This Product: 'Milk' is already expired and cannot be bought!"
+    assert store.stock('Milk') == (0, 0)
+
+# ---------------------------------------------------------------------#
+@pytest.mark.parametrize('name, amount, price, expire_date', [
+    ('  ', 1, 1.00, '2023-07-20'),
+    ('Milk', 0, 1.00, '2023-07-20'),
+    ('Milk', 'two', 1.00, '2023-07-20'),
+    ('Milk', 1.5, 1.00, '2023-07-20'),
+    ('Milk', 1, -1.00, '2023-07-20'),
+    ('Milk', 1, 'free', '2023-07-20'),
+    ('Milk', 1, float('nan'), '2023-07-20'),
+    ('Milk', 1, 1.00, 'not a date'),
+])
+def test_invalid_input(store, name, amount, price, expire_date):
+    with pytest.raises(InvalidInputError) as error:
+        store.buy(name, amount, price, expire_date)
+
+    # it is also a ValueError, and a StoreError like every refused transaction
+    assert isinstance(error.value, ValueError)
+    assert isinstance(error.value, StoreError)
+    assert store.stock('Milk') == (0, 0)
+
+# ---------------------------------------------------------------------#
+@pytest.mark.parametrize('amount, price', [(0, 2.00), ('two', 2.00), (1, -2.00), (1, 'two euro'), (1, None)])
+def test_invalid_input_of_a_sale(store, amount, price):
+    store.buy('Milk', 5, 1.00, '2023-07-20')
+
+    with pytest.raises(InvalidInputError):
+        store.sell('Milk', amount, price)
+
+    assert store.stock('Milk') == (5, 0)
+
+# ---------------------------------------------------------------------#
+def test_amounts_and_prices_given_as_text(store):
+    lot = store.buy('Milk', '5', '1.25', '2023-07-20')
+    sale = store.sell('Milk', '2', '2.50')
+
+    assert (lot['buy_amount'], lot['buy_price']) == (5, 1.25)
+    assert (sale['sell_amount'], sale['sell_price']) == (2, 2.5)
+    assert store.report('profit')['revenue'].tolist() == [5.0]
+
+# ---------------------------------------------------------------------#
+def test_as_of_is_refused_for_the_other_reports(store):
+    store.buy('Milk', 4, 1.00, '2023-07-20')
+
+    with pytest.raises(InvalidInputError):
+        store.report('profit', as_of='2023-07-01')
+
+# ---------------------------------------------------------------------#
+def test_advance_time_returns_the_lots_that_expired(store):
+    store.buy('Milk', 4, 1.00, '2023-07-03')
+    store.buy('Bread', 2, 1.00, '2023-07-20')
+
+    expired_lots = store.advance_time(5)
+
+    assert [(lot['buy_name'], lot['buy_amount']) for lot in expired_lots] == [('Milk', 4)]
+    assert str(store.current_date()) == '2023-07-06'
+
+# ---------------------------------------------------------------------#
+def test_stores_in_one_process_are_independent(tmp_path):
+    first = open_store(str(tmp_path / 'first'), 'csv')
+    second = open_store(str(tmp_path / 'second'), 'sqlite')
+    first.buy('Milk', 5, 1.00, '2023-07-20')
+    second.buy('Milk', 2, 1.00, '2023-07-20')
+    second.advance_time(3)
+
+    first.sell('Milk', 4, 2.00)
+
+    assert first.stock('Milk') == (1, 0)
+    assert second.stock('Milk') == (2, 0)
+    assert str(first.current_date()) == '2023-07-01'
+    assert str(second.current_date()) == '2023-07-04'
+    assert first.report('profit')['revenue'].tolist() == [8.0]
+    assert second.report('profit')['revenue'].tolist() == [0.0]
+
+# ---------------------------------------------------------------------#
+def test_a_sale_that_cannot_be_recorded_does_not_take_the_units(store, monkeypatch):
+    store.buy('Milk', 5, 1.00, '2023-07-20')
+    store.sell('Milk', 1, 2.00)
+
+    def full_disk(*args):
+        raise OSError('No space left on device')
+    with monkeypatch.context() as patch:
+        patch.setattr(store.storage, 'record_sales', full_disk)
+        with pytest.raises(OSError):
+            store.sell('Milk', 3, 2.00)
+
+    assert store.stock('Milk') == (4, 0)
+    assert store.sell('Milk', 4, 2.00)['lots'] == [{'lot_id': 1, 'units': 4, 'expire_date': '2023-07-20'}]
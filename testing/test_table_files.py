@@ -0,0 +1,27 @@
+"""
+Tests of the view tables in the Parquet and Feather formats (see superpy/table_files.py).
+"""
+# ---------------All the IMPORTS:---------------#
+import pytest
+import table_files
+from config import SuperConfig
+from conftest import open_store
+# -----------------------------------------------#
+
+# ---------------------------------------------------------------------#
+@pytest.mark.parametrize('table_format', ['parquet', 'feather'])
+def test_converted_tables_keep_names_that_look_missing(tmp_path, table_format):
+    pytest.importorskip('pyarrow')
+    shop = open_store(str(tmp_path))
+    for name in ('None', 'NA', 'null'):
+        shop.buy(name, 3, 1.00, '2023-07-20')
+    shop.sell('NA', 1, 2.00)
+    shop.storage.refresh_views(shop.current_date())
+    shop.update_management_report()
+
+    config = SuperConfig(outputs_dir=shop.config.outputs_dir, table_format=table_format)
+    table_files.convert_csv_tables(config)
+
+    assert table_files.read_table(config, 'bought')['buy_name'].astype(str).tolist() == ['None', 'NA', 'null']
+    assert table_files.read_table(config, 'sold')['buy_name'].astype(str).tolist() == ['NA']
+    assert sorted(table_files.read_table(config, 'management_report')['buy_name_buy'].astype(str)) == ['NA', 'None', 'null']